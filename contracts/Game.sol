@@ -12,22 +12,67 @@ function min(uint8 a, uint8 b) pure returns (uint8) {
 }
 
 
+// The board is packed into storage words, 2 bits (S.CellOwner) per cell, cell (x, y) has index x * n + y
+uint256 constant CELL_BITS = 2;
+uint256 constant CELL_MASK = 3;
+uint256 constant CELLS_PER_WORD = 128;
+
+
+// Storage word loaded into memory, so that the cells sharing a word cost a single SLOAD
+struct Word {
+    uint256 index;
+    uint256 value;
+}
+
+
+function cell_index(uint8 x, uint8 y, S.Settings memory settings) pure returns (uint256) {
+    return uint256(x) * settings.n + y;
+}
+
+
+function cell_offset(uint256 cell) pure returns (uint256) {
+    return (cell % CELLS_PER_WORD) * CELL_BITS;
+}
+
+
+function load_word(mapping(uint256 => uint256) storage board, uint256 cell) view returns (Word memory) {
+    return Word(cell / CELLS_PER_WORD, board[cell / CELLS_PER_WORD]);
+}
+
+
+function read_cell(
+    mapping(uint256 => uint256) storage board,
+    Word memory word,
+    uint256 cell
+) view returns (S.CellOwner) {
+    if (word.index != cell / CELLS_PER_WORD) {
+        word.index = cell / CELLS_PER_WORD;
+        word.value = board[word.index];
+    }
+    return S.CellOwner((word.value >> cell_offset(cell)) & CELL_MASK);
+}
+
+
 function check_vertical(
-    mapping(uint8 => mapping(uint8 => S.CellOwner)) storage moves,
+    mapping(uint256 => uint256) storage board,
+    Word memory center,
     uint8 x,
     uint8 y,
     S.CellOwner turn,
-    S.Settings storage settings
+    S.Settings memory settings
 ) view returns (bool) {
+    uint256 cell = cell_index(x, y, settings);
     uint8 counter = 1;
+    Word memory word = Word(center.index, center.value);
     for (uint8 shift = 1; shift < settings.k; shift++) {
-        if (min(MAXUINT8, settings.n - 1) - shift < y || moves[x][y+shift] != turn) {
+        if (min(MAXUINT8, settings.n - 1) - shift < y || read_cell(board, word, cell + shift) != turn) {
             break;
         }
         counter++;
     }
+    word = Word(center.index, center.value);
     for (uint8 shift = 1; shift < settings.k; shift++) {
-        if (y < shift || moves[x][y-shift] != turn) {
+        if (y < shift || read_cell(board, word, cell - shift) != turn) {
             break;
         }
         counter++;
@@ -37,21 +82,26 @@ function check_vertical(
 
 
 function check_horizontal(
-    mapping(uint8 => mapping(uint8 => S.CellOwner)) storage moves,
+    mapping(uint256 => uint256) storage board,
+    Word memory center,
     uint8 x,
     uint8 y,
     S.CellOwner turn,
-    S.Settings storage settings
+    S.Settings memory settings
 ) view returns (bool) {
+    uint256 cell = cell_index(x, y, settings);
+    uint256 step = settings.n;
     uint8 counter = 1;
+    Word memory word = Word(center.index, center.value);
     for (uint8 shift = 1; shift < settings.k; shift++) {
-        if (min(MAXUINT8, settings.m - 1) - shift < x || moves[x+shift][y] != turn) {
+        if (min(MAXUINT8, settings.m - 1) - shift < x || read_cell(board, word, cell + shift * step) != turn) {
             break;
         }
         counter++;
     }
+    word = Word(center.index, center.value);
     for (uint8 shift = 1; shift < settings.k; shift++) {
-        if (x < shift || moves[x-shift][y] != turn) {
+        if (x < shift || read_cell(board, word, cell - shift * step) != turn) {
             break;
         }
         counter++;
@@ -61,25 +111,30 @@ function check_horizontal(
 
 
 function check_diagonal_main(
-    mapping(uint8 => mapping(uint8 => S.CellOwner)) storage moves,
+    mapping(uint256 => uint256) storage board,
+    Word memory center,
     uint8 x,
     uint8 y,
     S.CellOwner turn,
-    S.Settings storage settings
+    S.Settings memory settings
 ) view returns (bool) {
+    uint256 cell = cell_index(x, y, settings);
+    uint256 step = uint256(settings.n) + 1;
     uint8 counter = 1;
+    Word memory word = Word(center.index, center.value);
     for (uint8 shift = 1; shift < settings.k; shift++) {
         if (
             min(MAXUINT8, settings.m - 1) - shift < x ||
             min(MAXUINT8, settings.n - 1) - shift < y ||
-            moves[x+shift][y+shift] != turn
+            read_cell(board, word, cell + shift * step) != turn
         ) {
             break;
         }
         counter++;
     }
+    word = Word(center.index, center.value);
     for (uint8 shift = 1; shift < settings.k; shift++) {
-        if (x < shift || y < shift || moves[x-shift][y-shift] != turn) {
+        if (x < shift || y < shift || read_cell(board, word, cell - shift * step) != turn) {
             break;
         }
         counter++;
@@ -89,28 +144,34 @@ function check_diagonal_main(
 
 
 function check_diagonal_secondary(
-    mapping(uint8 => mapping(uint8 => S.CellOwner)) storage moves,
+    mapping(uint256 => uint256) storage board,
+    Word memory center,
     uint8 x,
     uint8 y,
     S.CellOwner turn,
-    S.Settings storage settings
+    S.Settings memory settings
 ) view returns (bool) {
+    uint256 cell = cell_index(x, y, settings);
+    // (x - shift, y + shift) and (x + shift, y - shift) are (n - 1) * shift cells away
+    uint256 step = uint256(settings.n) - 1;
     uint8 counter = 1;
+    Word memory word = Word(center.index, center.value);
     for (uint8 shift = 1; shift < settings.k; shift++) {
         if (
             x < shift                                 ||
             min(MAXUINT8, settings.n - 1) - shift < y ||
-            moves[x-shift][y+shift] != turn
+            read_cell(board, word, cell - shift * step) != turn
         ) {
             break;
         }
         counter++;
     }
+    word = Word(center.index, center.value);
     for (uint8 shift = 1; shift < settings.k; shift++) {
         if (
             min(MAXUINT8, settings.m - 1) - shift < x ||
             y < shift                                 ||
-            moves[x+shift][y-shift] != turn
+            read_cell(board, word, cell + shift * step) != turn
         ) {
             break;
         }
@@ -121,62 +182,190 @@ function check_diagonal_secondary(
 
 
 function check_winner(
-    mapping(uint8 => mapping(uint8 => S.CellOwner)) storage moves,
+    mapping(uint256 => uint256) storage board,
+    Word memory center,
     uint8 x,
     uint8 y,
     S.CellOwner turn,
-    S.Settings storage settings
+    S.Settings memory settings
 ) view returns (bool) {
     return (
-        check_vertical(moves, x, y, turn, settings)          ||
-        check_horizontal(moves, x, y, turn, settings)        ||
-        check_diagonal_main(moves, x, y, turn, settings)     ||
-        check_diagonal_secondary(moves, x, y, turn, settings)
+        check_vertical(board, center, x, y, turn, settings)          ||
+        check_horizontal(board, center, x, y, turn, settings)        ||
+        check_diagonal_main(board, center, x, y, turn, settings)     ||
+        check_diagonal_secondary(board, center, x, y, turn, settings)
     );
 }
 
 
+// Off-chain moves are EIP-712 signed, the domain is bound to the game instance, so the move is not replayable.
+// A move commits to the history of the moves before it, so it cannot be applied on top of any other history.
+bytes32 constant DOMAIN_TYPEHASH = keccak256(
+    "EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)"
+);
+bytes32 constant MOVE_TYPEHASH = keccak256("Move(uint16 index,uint8 x,uint8 y,bytes30 previous)");
+// secp256k1n / 2, signatures with a greater s are malleable
+uint256 constant MAX_SIGNATURE_S = 0x7FFFFFFFFFFFFFFFFFFFFFFFFFFFFFFF5D576E7357A4501DDFE92F46681B20A0;
+// How many blocks a challenged player has to make a move, before the opponent may claim the win
+uint256 constant CHALLENGE_WINDOW = 100;
+
+
+function move_digest(address game, uint16 index, uint8 x, uint8 y, bytes30 previous) view returns (bytes32) {
+    bytes32 domain = keccak256(
+        abi.encode(DOMAIN_TYPEHASH, keccak256("dmnk"), keccak256("1"), block.chainid, game)
+    );
+    return keccak256(
+        abi.encodePacked("\x19\x01", domain, keccak256(abi.encode(MOVE_TYPEHASH, index, x, y, previous)))
+    );
+}
+
+
+// History of the moves up to and including (x, y), the history of a game without moves is 0
+function chain_move(bytes30 history, uint8 x, uint8 y) pure returns (bytes30) {
+    return bytes30(keccak256(abi.encode(history, x, y)));
+}
+
+
+function recover_signer(bytes32 digest, bytes calldata signature) pure returns (address) {
+    require(signature.length == 65, "ERROR: invalid signature length");
+    bytes32 r = bytes32(signature[0:32]);
+    bytes32 s = bytes32(signature[32:64]);
+    uint8 v = uint8(signature[64]);
+    require(uint256(s) <= MAX_SIGNATURE_S, "ERROR: malleable signature");
+    address signer = ecrecover(digest, v, r, s);
+    require(signer != address(0), "ERROR: invalid signature");
+    return signer;
+}
+
+
+// Implemented by the Gateway, which keeps the set of games waiting for an opponent
+interface Lobby {
+    function set_waiting(bool waiting) external;
+}
+
+
 contract GameInstance {
     // Bid, initialy (while game status == GameStatus.Created) is set to 0
     uint256 private _bid;
     S.State private _state;
-    mapping(uint8 => mapping(uint8 => S.CellOwner)) private _moves;
-    // Denormalized propertry of the _moves field. Need this as there's len(_moves)
+    // Packed board, see CELLS_PER_WORD
+    mapping(uint256 => uint256) private _board;
+    // Denormalized propertry of the _board field. Need this as there's no len(_board)
     uint16 private _moves_counter;
+    // Hash chain of the moves made, see chain_move. 30 bytes share the storage slot of _moves_counter, so a move
+    // updates both of them at the cost of a single one.
+    bytes30 private _history;
     mapping(S.CellOwner => address) private _players;
 
     // Size of the game field and the winning row length
     S.Settings private _settings;
+    // Games are minimal proxies of a single implementation, see Gateway.new_game, hence no constructor.
+    // The implementation itself is never registered by the Gateway, so it does not matter if anyone initializes it.
+    bool private _initialized;
+    // Move count + 1 at the moment of the recent challenge, 0 if there were no challenges
+    uint16 private _challenge;
+    // The Gateway, which has created the game, 0 if the game was initialized by an account directly
+    Lobby private _lobby;
 
-    event PlayerJoined(address game, address player);
-    event GameCancelled(address game);
-    event MoveAppended(address game, address player, uint8 x, uint8 y, bool is_winner);
+    // Game and player addresses are indexed, so that nodes filter the logs by game or by player themselves
+    event PlayerJoined(address indexed game, address indexed player);
+    event GameCancelled(address indexed game);
+    event MoveAppended(address indexed game, address indexed player, uint8 x, uint8 y, bool is_winner);
+    event TurnChallenged(address indexed game, address indexed challenger);
+    // The game is over: Completed, Exhausted or Aborted
+    event GameStatusChanged(address indexed game, S.GameStatus status);
 
     function append_move(uint8 x, uint8 y) public {
+        _append_move(tx.origin, x, y);
+    }
+
+    // Settles a transcript of the moves, which players have exchanged off-chain, in a single transaction. Anyone may
+    // relay the transcript, each move is attributed to its signer. Moves already on chain are skipped, so the
+    // transcript may overlap with the on-chain history. The first move applied has to be signed on top of the
+    // on-chain history, which the skipped moves are a part of, should they be the very same moves.
+    function settle(S.SignedMove[] calldata moves) public {
+        require(_state.status == S.GameStatus.Running, "ERROR: the game is not running");
+        for (uint256 counter=0; counter<moves.length; counter++) {
+            S.SignedMove calldata move = moves[counter];
+            if (move.index < _moves_counter) {
+                continue;
+            }
+            require(move.index == _moves_counter, "ERROR: gap in the transcript");
+            require(move.previous == _history, "ERROR: the transcript diverges from the game history");
+            address signer = recover_signer(
+                move_digest(address(this), move.index, move.x, move.y, move.previous), move.signature
+            );
+            _append_move(signer, move.x, move.y);
+            if (_state.status != S.GameStatus.Running) {
+                // The game is over, whatever follows is irrelevant
+                break;
+            }
+        }
+    }
+
+    // The player waiting for the opponent's move challenges the opponent to put the move on chain (or settle the
+    // off-chain transcript). Should the opponent fail to do so within CHALLENGE_WINDOW blocks, the challenger may
+    // claim the win, see claim_timeout.
+    function challenge() public {
+        require(_state.status == S.GameStatus.Running, "ERROR: the game is not running");
+        require(
+            _players[_state.currentTurn] != tx.origin &&
+            (tx.origin == _players[S.CellOwner.Alice] || tx.origin == _players[S.CellOwner.Bob]),
+            "ERROR: only the player waiting for the move may challenge"
+        );
+        _challenge = _moves_counter + 1;
+        _state.block_recent_move = block.number;
+        emit TurnChallenged(address(this), tx.origin);
+    }
+
+    function claim_timeout() public {
+        require(_state.status == S.GameStatus.Running, "ERROR: the game is not running");
+        require(_challenge == _moves_counter + 1, "ERROR: the challenge has been answered (or there is none)");
+        S.CellOwner challenger = _state.currentTurn == S.CellOwner.Alice ? S.CellOwner.Bob : S.CellOwner.Alice;
+        require(_players[challenger] == tx.origin, "ERROR: only the challenger may claim the win");
+        require(block.number > _state.block_recent_move + CHALLENGE_WINDOW, "ERROR: the challenge is not over yet");
+        // get_winner reports the current player of a completed game
+        _state.currentTurn = challenger;
+        _state.status = S.GameStatus.Completed;
+        emit GameStatusChanged(address(this), S.GameStatus.Completed);
+        payable(tx.origin).transfer(2 * _bid);
+    }
+
+    function _append_move(address player, uint8 x, uint8 y) internal {
         require( _state.status == S.GameStatus.Running, "ERROR: the game is not running");
-        require(_players[_state.currentTurn] == tx.origin, "ERROR: not your turn");
+        require(_players[_state.currentTurn] == player, "ERROR: not your turn");
+        S.Settings memory settings = _settings;
+        require(
+            x < settings.m && y < settings.n && x >= 0 && y >= 0, "ERROR: illegal move (outside the board)"
+        );
+        uint256 cell = cell_index(x, y, settings);
+        Word memory center = load_word(_board, cell);
         require(
-            x < _settings.m && y < _settings.n && x >= 0 && y >= 0, "ERROR: illegal move (outside the board)"
+            S.CellOwner((center.value >> cell_offset(cell)) & CELL_MASK) == S.CellOwner.Available,
+            "ERROR: illegal move (already taken)"
         );
-        require(_moves[x][y] == S.CellOwner.Available, "ERROR: illegal move (already taken)");
 
-        _moves[x][y] = _state.currentTurn;
+        center.value |= uint256(_state.currentTurn) << cell_offset(cell);
+        _board[center.index] = center.value;
         _state.block_recent_move = block.number;
         _moves_counter += 1;
+        _history = chain_move(_history, x, y);
 
         // Check if the current player just won the game
-        if (check_winner(_moves, x, y, _state.currentTurn, _settings)) {
+        if (check_winner(_board, center, x, y, _state.currentTurn, settings)) {
             // append the "winner" move
-            emit MoveAppended(address(this), tx.origin, x, y, true);
+            emit MoveAppended(address(this), player, x, y, true);
             _state.status = S.GameStatus.Completed;
+            emit GameStatusChanged(address(this), S.GameStatus.Completed);
             // Unlock funds and write the log
-            payable(tx.origin).transfer(2 * _bid);
+            payable(player).transfer(2 * _bid);
         } else {
             // append the a regular move
-            emit MoveAppended(address(this), tx.origin, x, y, false);
+            emit MoveAppended(address(this), player, x, y, false);
             // Check if this is a tie
-            if (_moves_counter == _settings.m * _settings.n) {
+            if (_moves_counter == uint16(settings.m) * settings.n) {
                 _state.status = S.GameStatus.Exhausted;
+                emit GameStatusChanged(address(this), S.GameStatus.Exhausted);
                 // Return locked funds to both Alice and Bob
                 payable(_players[S.CellOwner.Alice]).transfer(_bid);
                 payable(_players[S.CellOwner.Bob]).transfer(_bid);
@@ -197,17 +386,25 @@ contract GameInstance {
             require(msg.value > 0, "ERROR: bid should be > 0");
             _bid = msg.value;
             _state.status = S.GameStatus.Waiting;
+            _set_waiting(true);
         } else if (_state.status == S.GameStatus.Waiting) {
             require(_players[S.CellOwner.Alice] != tx.origin, "ERROR: trying to join as self opponent");
             require(msg.value == _bid, "ERROR: your deposit doesnt match the game's requirement");
             _players[S.CellOwner.Bob] = tx.origin;
             _state.status = S.GameStatus.Running;
+            _set_waiting(false);
         } else {
             revert("ERROR: you are not allowed to join");
         }
         emit PlayerJoined(address(this), tx.origin);
     }
 
+    function _set_waiting(bool waiting) internal {
+        if (address(_lobby) != address(0)) {
+            _lobby.set_waiting(waiting);
+        }
+    }
+
     function get_current_player() view public returns (address) {
         return _players[_state.currentTurn];
     }
@@ -220,6 +417,11 @@ contract GameInstance {
         return _moves_counter;
     }
 
+    // What the next signed move commits to, see settle
+    function get_history() view public returns (bytes30) {
+        return _history;
+    }
+
     function get_players() view public returns (address, address) {
         return (_players[S.CellOwner.Alice], _players[S.CellOwner.Bob]);
     }
@@ -228,13 +430,41 @@ contract GameInstance {
         if (_state.status != S.GameStatus.Completed) {
             return address(0x0);
         }
-        return this.get_current_player();
+        return _players[_state.currentTurn];
     }
 
     function get_settings() view public returns (uint8, uint8, uint8) {
         return (_settings.m, _settings.n, _settings.k);
     }
 
+    // The packed board as is, word after word, each word as 32 bytes big endian: cell (x, y) is the 2 bits at
+    // cell_offset(x * n + y) of the word (x * n + y) / CELLS_PER_WORD, see S.CellOwner for their meaning
+    function get_board() view public returns (bytes memory board) {
+        uint256 words = (uint256(_settings.m) * _settings.n + CELLS_PER_WORD - 1) / CELLS_PER_WORD;
+        board = new bytes(words * 32);
+        for (uint256 index=0; index<words; index++) {
+            uint256 word = _board[index];
+            assembly {
+                mstore(add(board, mul(add(index, 1), 32)), word)
+            }
+        }
+    }
+
+    // Everything the getters above return, but in a single call
+    function get_state() view public returns (S.GameState memory) {
+        return S.GameState({
+            status: _state.status,
+            currentTurn: _state.currentTurn,
+            alice: _players[S.CellOwner.Alice],
+            bob: _players[S.CellOwner.Bob],
+            bid: _bid,
+            settings: _settings,
+            moves: _moves_counter,
+            block_game_deployed: _state.block_game_deployed,
+            block_recent_move: _state.block_recent_move
+        });
+    }
+
     function cancel_game() public {
         require(
             _state.status == S.GameStatus.Created || _state.status == S.GameStatus.Waiting,
@@ -246,13 +476,20 @@ contract GameInstance {
         );
         // Here Alice's funds already have been put into contract, so invoke refund
         if (_state.status == S.GameStatus.Waiting) {
+            _set_waiting(false);
             payable(tx.origin).transfer(_bid);
         }
         _state.status = S.GameStatus.Aborted;
         emit GameCancelled(address(this));
+        emit GameStatusChanged(address(this), S.GameStatus.Aborted);
     }
 
-    constructor(S.Settings memory settings, S.Cell[] memory gouged) {
+    function initialize(S.Settings memory settings, S.Cell[] memory gouged) public {
+        require(!_initialized, "ERROR: the game is already initialized");
+        _initialized = true;
+        if (msg.sender.code.length > 0) {
+            _lobby = Lobby(msg.sender);
+        }
         require(
             settings.k <= settings.m &&
             settings.k <= settings.n &&
@@ -272,8 +509,22 @@ contract GameInstance {
             block_recent_move: block.number
         });
         _settings = settings;
+        // Gouge the cells in memory first, so that each storage word gets written at most once
+        uint256[] memory words = new uint256[](
+            (uint256(settings.m) * settings.n + CELLS_PER_WORD - 1) / CELLS_PER_WORD
+        );
         for (uint256 counter=0; counter<gouged.length; counter++) {
-            _moves[gouged[counter].x][gouged[counter].y] = S.CellOwner.Gouged;
+            // There is no such cell on the board, nothing to gouge
+            if (gouged[counter].x >= settings.m || gouged[counter].y >= settings.n) {
+                continue;
+            }
+            uint256 cell = cell_index(gouged[counter].x, gouged[counter].y, settings);
+            words[cell / CELLS_PER_WORD] |= uint256(S.CellOwner.Gouged) << cell_offset(cell);
+        }
+        for (uint256 index=0; index<words.length; index++) {
+            if (words[index] != 0) {
+                _board[index] = words[index];
+            }
         }
     }
 }
@@ -6,24 +6,146 @@ import "./Game.sol" as G;
 import "./Structs.sol" as S;
 
 
-contract Gateway {
+// EIP-1167 minimal proxy, which delegates every call to `implementation`
+function clone(address implementation) returns (address instance) {
+    assembly {
+        let ptr := mload(0x40)
+        mstore(ptr, 0x3d602d80600a3d3981f3363d3d373d3d3d363d73000000000000000000000000)
+        mstore(add(ptr, 0x14), shl(0x60, implementation))
+        mstore(add(ptr, 0x28), 0x5af43d82803e903d91602b57fd5bf30000000000000000000000000000000000)
+        instance := create(0, ptr, 0x37)
+    }
+    require(instance != address(0), "ERROR: failed to clone the game");
+}
+
+
+contract Gateway is G.Lobby {
     address payable _minter;
+    // Every game is a clone of this one
+    address immutable _implementation;
 
     mapping(address => bool) _known_games;
+    // Games waiting for an opponent in no particular order, a removed game is replaced with the last one
+    address[] _waiting;
+    // Position of the game in _waiting + 1, 0 if the game is not waiting
+    mapping(address => uint256) _waiting_position;
 
-    event GameCreated(address game, address initiator);
+    event GameCreated(address indexed game, address indexed initiator);
 
     function verify_game_address(address game) public view returns (bool) {
         return _known_games[game];
     }
 
-    function new_game(S.Settings calldata settings, S.Cell[] calldata gouged) public {
-        G.GameInstance game = new G.GameInstance(settings, gouged);
+    // Multicall-like aggregate of GameInstance.get_state, so that a whole bunch of games is read at once
+    function get_states(address[] calldata games) public view returns (S.GameState[] memory states) {
+        states = new S.GameState[](games.length);
+        for (uint256 counter=0; counter<games.length; counter++) {
+            require(_known_games[games[counter]], "ERROR: unknown game");
+            states[counter] = G.GameInstance(games[counter]).get_state();
+        }
+    }
+
+    // Called by the games themselves, when they start or stop waiting for an opponent
+    function set_waiting(bool waiting) external {
+        require(_known_games[msg.sender], "ERROR: unknown game");
+        uint256 position = _waiting_position[msg.sender];
+        if (waiting && position == 0) {
+            _waiting.push(msg.sender);
+            _waiting_position[msg.sender] = _waiting.length;
+        } else if (!waiting && position != 0) {
+            address last = _waiting[_waiting.length - 1];
+            _waiting[position - 1] = last;
+            _waiting_position[last] = position;
+            _waiting.pop();
+            delete _waiting_position[msg.sender];
+        }
+    }
+
+    function get_waiting_count() public view returns (uint256) {
+        return _waiting.length;
+    }
+
+    // A page of the waiting games matching the filter: scans the lobby from `cursor` until `limit` games are found or
+    // `max_scan` games are looked at, whatever comes first. Each game looked at is a call of its own, so `max_scan`
+    // keeps a page within the gas cap of eth_call however selective the filter is, a page may be even empty then.
+    // Pass `next_cursor` to get the next page, it is 0 once the lobby is scanned through. Games leaving the lobby in
+    // between the pages may make a game move to an already scanned position, so a page is a hint, not a snapshot.
+    function get_waiting_games(
+        uint256 cursor,
+        uint256 limit,
+        uint256 max_scan,
+        S.LobbyFilter calldata filter
+    ) public view returns (address[] memory games, uint256 next_cursor) {
+        games = new address[](limit);
+        uint256 found = 0;
+        uint256 end = _waiting.length;
+        if (cursor < end && max_scan < end - cursor) {
+            end = cursor + max_scan;
+        }
+        for (; cursor < end && found < limit; cursor++) {
+            S.GameState memory state = G.GameInstance(_waiting[cursor]).get_state();
+            if (
+                state.bid >= filter.min_bid &&
+                (filter.max_bid == 0 || state.bid <= filter.max_bid) &&
+                (filter.settings.m == 0 || state.settings.m == filter.settings.m) &&
+                (filter.settings.n == 0 || state.settings.n == filter.settings.n) &&
+                (filter.settings.k == 0 || state.settings.k == filter.settings.k)
+            ) {
+                games[found++] = _waiting[cursor];
+            }
+        }
+        // Trim the unused tail
+        assembly {
+            mstore(games, found)
+        }
+        next_cursor = cursor < _waiting.length ? cursor : 0;
+    }
+
+    function _new_game(S.Settings calldata settings, S.Cell[] calldata gouged) internal returns (G.GameInstance) {
+        G.GameInstance game = G.GameInstance(clone(_implementation));
+        game.initialize(settings, gouged);
         _known_games[address(game)] = true;
         emit GameCreated(address(game), tx.origin);
+        return game;
+    }
+
+    function new_game(S.Settings calldata settings, S.Cell[] calldata gouged) public {
+        _new_game(settings, gouged);
+    }
+
+    // Same as new_game followed by the initiator's join, but in a single transaction, the game ends up Waiting
+    function new_game_and_join(S.Settings calldata settings, S.Cell[] calldata gouged) public payable {
+        _new_game(settings, gouged).join{value: msg.value}();
+    }
+
+    // Opens a bunch of games at once. Games with a nonzero bid are joined by the initiator right away, the rest
+    // stay Created. The deposit must cover the bids exactly.
+    function new_games(
+        S.Settings[] calldata settings,
+        S.Cell[][] calldata gouged,
+        uint256[] calldata bids
+    ) public payable {
+        require(
+            settings.length == gouged.length && settings.length == bids.length,
+            "ERROR: settings, gouged and bids lengths differ"
+        );
+        uint256 deposit = 0;
+        for (uint256 counter=0; counter<settings.length; counter++) {
+            G.GameInstance game = _new_game(settings[counter], gouged[counter]);
+            if (bids[counter] > 0) {
+                game.join{value: bids[counter]}();
+                deposit += bids[counter];
+            }
+        }
+        require(deposit == msg.value, "ERROR: your deposit doesnt match the sum of the bids");
+    }
+
+    function get_implementation() public view returns (address) {
+        return _implementation;
     }
 
     constructor() {
         _minter = payable(msg.sender);
+        _implementation = address(new G.GameInstance());
     }
 }
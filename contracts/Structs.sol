@@ -40,3 +40,35 @@ struct State {
     CellOwner currentTurn;
     GameStatus status;
 }
+
+
+// Whole game at a glance, see GameInstance.get_state
+struct GameState {
+    GameStatus status;
+    CellOwner currentTurn;
+    address alice;
+    address bob;
+    uint256 bid;
+    Settings settings;
+    uint16 moves;
+    uint block_game_deployed;
+    uint block_recent_move;
+}
+
+
+// Move signed off-chain by the player, see GameInstance.settle
+struct SignedMove {
+    uint16 index;     // number of the move in the game, i.e. get_move_count() right before it
+    uint8 x;
+    uint8 y;
+    bytes30 previous; // get_history() right before the move
+    bytes signature;  // EIP-712 signature of Move(uint16 index,uint8 x,uint8 y,bytes30 previous), r || s || v
+}
+
+
+// Query of Gateway.get_waiting_games, zero max_bid, m, n or k matches any
+struct LobbyFilter {
+    uint256 min_bid;
+    uint256 max_bid;
+    Settings settings;
+}
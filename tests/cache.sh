@@ -0,0 +1,130 @@
+#!/bin/bash
+
+# Content addressed cache of the build pipeline, sourced by runtest.sh and deploy.sh after SCRIPT_DIR and ENVFILE.
+#   compile key: the contract sources, truffle-config.js (compiler version and settings) and DockerfileCompiler,
+#                the artifacts of build/contracts are stored under it
+#   deploy key:  the compile key, the migrations, the env file and DockerfileBlockchain, build/info.json is stored
+#                under it, on localnet along with the chain database right after the migration
+# BUILD_CACHE=0 compiles and deploys from scratch, `rm -rf tests/build/cache` drops whatever is cached.
+# A deployment to a public network is reused with REUSE_DEPLOYMENT=1 only, it has the lobby and the games of the
+# runs before, a localnet snapshot starts from the very same chain every time.
+
+
+REPO_DIR=$(realpath $SCRIPT_DIR/..)
+CACHE_DIR="$SCRIPT_DIR/build/cache"
+BUILD_CACHE="${BUILD_CACHE:-1}"
+# entries kept of each kind, the least recently used go first
+CACHE_KEEP="${CACHE_KEEP:-3}"
+# the chain of a localnet snapshot is forked at a fixed block, the fork node may not keep the state of old blocks
+DEPLOY_CACHE_TTL_HOURS="${DEPLOY_CACHE_TTL_HOURS:-24}"
+REUSE_DEPLOYMENT="${REUSE_DEPLOYMENT:-0}"
+
+
+# hash of the names and the contents of the given files
+function hash_files() {
+    for FILE in "$@"
+    do
+        echo "${FILE#$REPO_DIR/}"
+        cat "$FILE"
+    done | sha256sum | cut -c1-16
+}
+
+
+function compile_key() {
+    hash_files $(find $REPO_DIR/contracts -name "*.sol" | sort) \
+        $SCRIPT_DIR/truffle-config.js $SCRIPT_DIR/DockerfileCompiler
+}
+
+
+function deploy_key() {
+    echo "$(compile_key) $(hash_files $(find $REPO_DIR/migrations -type f | sort) $(realpath $ENVFILE) \
+        $SCRIPT_DIR/DockerfileBlockchain)" | sha256sum | cut -c1-16
+}
+
+
+# drops all but the CACHE_KEEP most recently used entries of the directory
+function prune_cache() {
+    ls -1t $1 2>/dev/null | tail -n +$((CACHE_KEEP + 1)) | while read ENTRY
+    do
+        rm -rf "$1/$ENTRY"
+    done
+}
+
+
+function restore_artifacts() {
+    local ENTRY="$CACHE_DIR/contracts/$(compile_key)"
+    [[ $BUILD_CACHE == 1 && -d $ENTRY ]] || return 1
+    rm -rf $SCRIPT_DIR/build/contracts && cp -r $ENTRY $SCRIPT_DIR/build/contracts && touch $ENTRY
+}
+
+
+function store_artifacts() {
+    local ENTRY="$CACHE_DIR/contracts/$(compile_key)"
+    [[ $BUILD_CACHE == 1 ]] || return 0
+    mkdir -p $CACHE_DIR/contracts && rm -rf $ENTRY && cp -r $SCRIPT_DIR/build/contracts $ENTRY
+    prune_cache $CACHE_DIR/contracts
+}
+
+
+# restores build/info.json and, if any, the chain database and its fork block into build/chain and FORK_BLOCK
+function restore_deployment() {
+    local ENTRY="$CACHE_DIR/deploy/$(deploy_key)"
+    [[ $BUILD_CACHE == 1 && -r $ENTRY/info.json ]] || return 1
+    if ! [[ -d $ENTRY/chain ]]
+    then
+        # deployed to a public network, the contracts there are not fresh anymore
+        [[ $REUSE_DEPLOYMENT == 1 ]] || return 1
+    elif [[ -n $(find $ENTRY/created -mmin +$((DEPLOY_CACHE_TTL_HOURS * 60))) ]]
+    then
+        rm -rf $ENTRY
+        return 1
+    fi
+    restore_artifacts || return 1
+    cp $ENTRY/info.json $SCRIPT_DIR/build/info.json
+    if [[ -d $ENTRY/chain ]]
+    then
+        rm -rf $SCRIPT_DIR/build/chain && cp -r $ENTRY/chain $SCRIPT_DIR/build/chain
+        export FORK_BLOCK=$(cat $ENTRY/fork_block)
+    fi
+    touch $ENTRY
+}
+
+
+# stores build/info.json, plus the chain database of build/chain, if given `chain` and the fork block is known
+function store_deployment() {
+    local ENTRY="$CACHE_DIR/deploy/$(deploy_key)"
+    [[ $BUILD_CACHE == 1 && -r $SCRIPT_DIR/build/info.json ]] || return 0
+    if [[ $1 == "chain" && -z $FORK_BLOCK ]]
+    then
+        # forked at whatever the head was, there is no way to start the same chain again
+        return 0
+    fi
+    store_artifacts
+    mkdir -p $ENTRY && cp $SCRIPT_DIR/build/info.json $ENTRY/info.json && touch $ENTRY/created
+    if [[ $1 == "chain" ]]
+    then
+        rm -rf $ENTRY/chain && cp -r $SCRIPT_DIR/build/chain $ENTRY/chain && echo $FORK_BLOCK > $ENTRY/fork_block
+    fi
+    prune_cache $CACHE_DIR/deploy
+}
+
+
+# current block of the JSON-RPC endpoint, empty if it is not reachable
+function head_block() {
+    local HEX=$(curl -s -X POST -H "Content-Type: application/json" \
+        --data '{"jsonrpc":"2.0","id":1,"method":"eth_blockNumber","params":[]}' $1 \
+        | sed -nE 's/.*"result":"0x([0-9a-fA-F]+)".*/\1/p')
+    [[ -n $HEX ]] && echo $((16#$HEX))
+}
+
+
+# waits for the JSON-RPC endpoint to answer, up to a minute
+function wait_for_node() {
+    for _ in $(seq 120)
+    do
+        [[ -n $(head_block $1) ]] && return 0
+        sleep 0.5
+    done
+    echo "Fatal: $1 does not answer."
+    return 1
+}
@@ -14,11 +14,27 @@ then
     exit 1
 fi
 
+source $SCRIPT_DIR/cache.sh
+mkdir -p $SCRIPT_DIR/build
+
+
+# the very same contracts are deployed to the very same network already and REUSE_DEPLOYMENT=1 asks for them
+if restore_deployment
+then
+    echo "Deployment of $(deploy_key) is cached: $(cat $SCRIPT_DIR/build/info.json)"
+    exit 0
+fi
+
+# the artifacts of the very same sources need no compiling
+MIGRATE_OPTIONS=""
+restore_artifacts && MIGRATE_OPTIONS="--compile-none"
 
 # build truffle node
 docker build -t compiler -f $SCRIPT_DIR/DockerfileCompiler $SCRIPT_DIR && \
 # run the compiler
-docker-compose -f $SCRIPT_DIR/docker-compose-publicnet.yml -- run compiler
+docker-compose -f $SCRIPT_DIR/docker-compose-publicnet.yml -- run compiler \
+    truffle migrate --network anynet --reset --skip-dry-run $MIGRATE_OPTIONS && \
+store_deployment
 
 # cleanup
 docker-compose -f $SCRIPT_DIR/docker-compose-publicnet.yml rm -fsv
@@ -0,0 +1,9 @@
+#!/bin/bash
+
+# Load generator against the chain of the env file, i.e.
+# ./tests/loadgen.sh tests/envs/localnet.env --pairs 1000 --board 5,5,3 --policy greedy
+# The report goes to tests/build/loadgen.json and tests/build/loadgen.csv, see tests/tests/loadgen.py
+
+
+SCRIPT_DIR=$(dirname $(realpath $0))
+TESTER_COMMAND="python -m tests.loadgen" $SCRIPT_DIR/runtest.sh "$@"
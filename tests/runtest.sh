@@ -6,6 +6,8 @@ export DOCKER_BUILDKIT=1
 
 SCRIPT_DIR=$(dirname $(realpath $0))
 export ENVFILE="${1:-"tests/envs/localnet.env"}"
+# what the tester runs, the rest of the arguments are appended to it
+TESTER_COMMAND="${TESTER_COMMAND:-"pytest --asyncio-mode=auto"}"
 
 
 if ! [[ -r $(realpath $ENVFILE) ]]
@@ -14,26 +16,88 @@ then
     exit 1
 fi
 
+source $SCRIPT_DIR/cache.sh
+mkdir -p $SCRIPT_DIR/build
 
+
+# migrate the contracts by default, the in-process chain deploys them itself, compiling is enough
+BUILD_STEP="deploy"
+BLOCKCHAIN_START_COMMAND="true"
 if [[ $ENVFILE == *"localnet"* ]]
 then
     COMPOSE_FILE="docker-compose-localnet.yml"
     BLOCKCHAIN_BUILD_COMMAND="docker build -t ganache -f $SCRIPT_DIR/DockerfileBlockchain $SCRIPT_DIR"
+    BLOCKCHAIN_START_COMMAND="docker-compose -f $SCRIPT_DIR/$COMPOSE_FILE up -d blockchain"
+    PROVIDER="$(grep -E "^PROVIDER_HOST=" $ENVFILE | cut -d= -f2-):$(grep -E "^PROVIDER_PORT=" $ENVFILE | cut -d= -f2-)"
+    export FORK_URI="${FORK_URI:-"https://api.s0.b.hmny.io"}"
+    # ganache keeps its database in build/chain, which is snapshotted right after the migration
+    [[ $BUILD_CACHE == 1 ]] && export CHAIN_DB="/chain"
+elif [[ $ENVFILE == *"inprocess"* ]]
+then
+    COMPOSE_FILE="docker-compose-publicnet.yml"
+    BLOCKCHAIN_BUILD_COMMAND="true"
+    BUILD_STEP="compile"
 else
     COMPOSE_FILE="docker-compose-publicnet.yml"
     BLOCKCHAIN_BUILD_COMMAND="true"
 fi
+COMPOSE="docker-compose -f $SCRIPT_DIR/$COMPOSE_FILE"
+
+
+# nothing to compile nor to deploy, should the very same sources have been compiled and deployed before
+if [[ $BUILD_STEP == "compile" ]] && restore_artifacts
+then
+    echo "Compiled contracts of $(compile_key) are cached."
+    BUILD_STEP=""
+elif [[ $BUILD_STEP == "deploy" ]] && restore_deployment
+then
+    echo "Deployment of $(deploy_key) is cached."
+    BUILD_STEP=""
+elif [[ -n $CHAIN_DB ]]
+then
+    # a fresh chain, forked at a known block, so that the snapshot of it can be started again
+    rm -rf $SCRIPT_DIR/build/chain
+    export FORK_BLOCK=$(head_block $FORK_URI)
+fi
+
+
+function build_contracts() {
+    case $BUILD_STEP in
+        compile)
+            $COMPOSE run --no-deps compiler truffle compile && store_artifacts
+            ;;
+        deploy)
+            # the artifacts of the very same sources are there already
+            local MIGRATE_OPTIONS=""
+            restore_artifacts && MIGRATE_OPTIONS="--compile-none"
+            $COMPOSE run --no-deps compiler truffle migrate --network anynet --reset --skip-dry-run $MIGRATE_OPTIONS \
+                || return 1
+            if [[ -n $CHAIN_DB ]]
+            then
+                # the database is consistent once ganache is stopped
+                $COMPOSE stop blockchain && store_deployment chain && \
+                    $COMPOSE start blockchain && wait_for_node $PROVIDER
+            else
+                store_deployment
+            fi
+            ;;
+    esac
+}
+
 
-# build truffle node
-docker build -t compiler -f $SCRIPT_DIR/DockerfileCompiler $SCRIPT_DIR && \
+# build truffle node, unless everything is cached
+([[ -z $BUILD_STEP ]] || docker build -t compiler -f $SCRIPT_DIR/DockerfileCompiler $SCRIPT_DIR) && \
 # build blockchain node, this step is optional, depending on the network selected
 sh -c "$BLOCKCHAIN_BUILD_COMMAND" && \
 # build pytest node
 docker build -t tester -f DockerfilePytester . && \
+# start the chain, if any
+sh -c "$BLOCKCHAIN_START_COMMAND" && \
+([[ -z $PROVIDER ]] || wait_for_node $PROVIDER) && \
 # compile and deploy contracts
-docker-compose -f $SCRIPT_DIR/$COMPOSE_FILE -- run compiler && \
+build_contracts && \
 # run tests
-docker-compose -f $SCRIPT_DIR/$COMPOSE_FILE -- run tester poetry run pytest --asyncio-mode=auto ${@:2}
+$COMPOSE run --no-deps tester poetry run $TESTER_COMMAND ${@:2}
 
 # cleanup
-docker-compose -f $SCRIPT_DIR/$COMPOSE_FILE rm -fsv
+$COMPOSE rm -fsv
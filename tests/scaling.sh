@@ -0,0 +1,17 @@
+#!/bin/bash
+
+# Wall clock time of the whole suite against the number of xdist workers, i.e.
+# ./tests/scaling.sh tests/envs/localnet.env "0 2 4 8" [pytest args]
+# 0 stands for the single process run.
+
+
+SCRIPT_DIR=$(dirname $(realpath $0))
+ENVFILE="${1:-"tests/envs/localnet.env"}"
+WORKERS="${2:-"0 2 4 8"}"
+
+
+for N in $WORKERS
+do
+    # The last line of the pytest summary, see pytest_terminal_summary of tests/tests/conftest.py
+    $SCRIPT_DIR/runtest.sh $ENVFILE -n $N ${@:3} | grep "wall clock:" || echo "$N workers: failed"
+done
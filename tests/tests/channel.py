@@ -0,0 +1,142 @@
+from dataclasses import dataclass, field
+
+import eth_abi
+from eth_keys import keys
+from eth_utils import keccak
+
+from .nonces import sign_and_send
+
+# Must match the constants of contracts/Game.sol
+DOMAIN_TYPEHASH = keccak(text="EIP712Domain(string name,string version,uint256 chainId,address verifyingContract)")
+MOVE_TYPEHASH = keccak(text="Move(uint16 index,uint8 x,uint8 y,bytes30 previous)")
+# History of a game without moves, see GameInstance.get_history
+EMPTY_HISTORY = bytes(30)
+DOMAIN_NAME = "dmnk"
+DOMAIN_VERSION = "1"
+CHALLENGE_WINDOW = 100
+
+
+class ChannelError(Exception):
+    pass
+
+
+def domain_separator(chain_id: int, game: str) -> bytes:
+    return keccak(
+        eth_abi.encode_abi(
+            ["bytes32", "bytes32", "bytes32", "uint256", "address"],
+            [DOMAIN_TYPEHASH, keccak(text=DOMAIN_NAME), keccak(text=DOMAIN_VERSION), chain_id, game],
+        )
+    )
+
+
+def move_digest(chain_id: int, game: str, index: int, x: int, y: int, previous: bytes) -> bytes:
+    move_hash = keccak(
+        eth_abi.encode_abi(
+            ["bytes32", "uint16", "uint8", "uint8", "bytes30"], [MOVE_TYPEHASH, index, x, y, previous]
+        )
+    )
+    return keccak(b"\x19\x01" + domain_separator(chain_id, game) + move_hash)
+
+
+def chain_move(history: bytes, x: int, y: int) -> bytes:
+    # chain_move of contracts/Game.sol, history of the moves up to and including (x, y)
+    return keccak(eth_abi.encode_abi(["bytes30", "uint8", "uint8"], [history, x, y]))[:30]
+
+
+@dataclass(frozen=True)
+class SignedMove:
+    index: int
+    x: int
+    y: int
+    # History of the moves before this one
+    previous: bytes
+    signature: bytes
+
+    def as_tuple(self):
+        # S.SignedMove as the contract's ABI expects it
+        return (self.index, self.x, self.y, self.previous, self.signature)
+
+
+def sign_move(account, chain_id: int, game: str, index: int, x: int, y: int, previous: bytes) -> SignedMove:
+    signature = keys.PrivateKey(bytes(account.key)).sign_msg_hash(
+        move_digest(chain_id, game, index, x, y, previous)
+    )
+    # r || s || v, ecrecover expects v to be 27 or 28
+    r, s, v = signature.vrs[1], signature.vrs[2], signature.vrs[0] + 27
+    return SignedMove(index, x, y, previous, r.to_bytes(32, "big") + s.to_bytes(32, "big") + bytes([v]))
+
+
+def recover_signer(chain_id: int, game: str, move: SignedMove) -> str:
+    if len(move.signature) != 65:
+        raise ChannelError("invalid signature length")
+    r, s, v = move.signature[:32], move.signature[32:64], move.signature[64]
+    signature = keys.Signature(vrs=(v - 27, int.from_bytes(r, "big"), int.from_bytes(s, "big")))
+    digest = move_digest(chain_id, game, move.index, move.x, move.y, move.previous)
+    return signature.recover_public_key_from_msg_hash(digest).to_checksum_address()
+
+
+@dataclass
+class MoveChannel:
+    """
+    Off-chain move exchange of a single running game. Both players keep their own copy of the channel: the one to
+    move signs the move with `propose` and sends it over, the opponent checks it with `receive`. At any moment either
+    player (or anybody else) may `relay` the transcript, GameInstance.settle applies it in a single transaction.
+
+    Every move is signed on top of the history of the moves before it, the way the contract chains them, so the
+    transcript settles only on top of the very same on-chain history. Only the turn order, move numbering, history
+    and the cells already taken are checked here, the full rules are up to the contract.
+    """
+
+    chain_id: int
+    game: str
+    alice: str
+    bob: str
+    # get_move_count() and get_history() at the moment the channel was opened
+    start_index: int = 0
+    start_history: bytes = EMPTY_HISTORY
+    transcript: list[SignedMove] = field(default_factory=list)
+
+    @property
+    def next_index(self) -> int:
+        return self.start_index + len(self.transcript)
+
+    @property
+    def history(self) -> bytes:
+        if not self.transcript:
+            return self.start_history
+        return chain_move(self.transcript[-1].previous, self.transcript[-1].x, self.transcript[-1].y)
+
+    def player_to_move(self) -> str:
+        # Alice makes every even move
+        return self.alice if self.next_index % 2 == 0 else self.bob
+
+    def _check(self, move: SignedMove, signer: str):
+        if move.index != self.next_index:
+            raise ChannelError("expected move #%s, got #%s" % (self.next_index, move.index))
+        if move.previous != self.history:
+            raise ChannelError("move #%s is signed on top of another history" % move.index)
+        if signer != self.player_to_move():
+            raise ChannelError("move #%s is signed by %s, not by %s" % (move.index, signer, self.player_to_move()))
+        if any((item.x, item.y) == (move.x, move.y) for item in self.transcript):
+            raise ChannelError("cell (%s, %s) is already taken" % (move.x, move.y))
+
+    def propose(self, account, x: int, y: int) -> SignedMove:
+        move = sign_move(account, self.chain_id, self.game, self.next_index, x, y, self.history)
+        self._check(move, account.address)
+        self.transcript.append(move)
+        return move
+
+    def receive(self, move: SignedMove):
+        self._check(move, recover_signer(self.chain_id, self.game, move))
+        self.transcript.append(move)
+
+    def settle_call(self, game_contract):
+        return game_contract.functions.settle([move.as_tuple() for move in self.transcript])
+
+    async def relay(self, w3, game_contract, account, transaction):
+        # `transaction` carries chainId, gas and fees, the nonce is allocated locally
+        return await sign_and_send(
+            w3, account, await self.settle_call(game_contract).build_transaction(
+                {**transaction, "from": account.address}
+            )
+        )
@@ -0,0 +1,211 @@
+import functools
+import glob
+import json
+import os
+import tempfile
+
+import aiohttp
+from eth_keys import keys
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.eth import AsyncEth
+from web3.providers.async_rpc import AsyncHTTPProvider
+
+from .nonces import sign_and_send
+from .receipts import wait_for_receipt
+from .rpcpool import PooledProvider
+
+BUILD_DIR = "./build"
+# What is used out of the truffle artifacts. The rest of them (sources, AST, source maps) is the most of their size,
+# hence the first process to load an artifact stores these fields aside for the rest of them, see load_artifact
+ARTIFACT_FIELDS = ("contractName", "abi", "bytecode", "deployedBytecode")
+# Chain backends: a node over HTTP (ganache or a public network) or an EVM right in the test process
+HTTP = "http"
+IN_PROCESS = "inprocess"
+BACKENDS = (HTTP, IN_PROCESS)
+# Keep-alive connections to the node, shared by every request of the process
+DEFAULT_POOL_SIZE = 32
+DEFAULT_KEEPALIVE = 30
+
+
+@functools.lru_cache(maxsize=None)
+def load_artifact(name, build_dir=BUILD_DIR) -> dict:
+    # Artifacts do not change while the process runs, each one is read and parsed once.
+    # The result is shared, do not modify it.
+    path = os.path.join(build_dir, "contracts", "%s.json" % name)
+    stat = os.stat(path)
+    # Keyed on the artifact's size and mtime, truffle rewrites it on every compile
+    slim_path = os.path.join(build_dir, "cache", "artifacts", "%s.%s.%s.json" % (name, stat.st_size, stat.st_mtime_ns))
+    try:
+        with open(slim_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    with open(path) as f:
+        artifact = json.load(f)
+    slim = {field: artifact[field] for field in ARTIFACT_FIELDS if field in artifact}
+    store_slim_artifact(slim_path, slim)
+    return slim
+
+
+def store_slim_artifact(path: str, artifact: dict):
+    # Written aside and renamed, the xdist workers may race for it. A read-only build directory is no error
+    directory = os.path.dirname(path)
+    try:
+        os.makedirs(directory, exist_ok=True)
+        for stale in glob.glob(os.path.join(directory, os.path.basename(path).split(".")[0] + ".*.json")):
+            if stale != path:
+                os.remove(stale)
+        with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as f:
+            json.dump(artifact, f)
+        os.replace(f.name, path)
+    except OSError:
+        pass
+
+
+@functools.lru_cache(maxsize=None)
+def load_gateway_address(build_dir=BUILD_DIR) -> str:
+    with open(os.path.join(build_dir, "info.json")) as f:
+        return json.load(f)["address"]
+
+
+def http_provider(uris: list[str]):
+    # A single node as is, several of them through the pool
+    return Web3.AsyncHTTPProvider(uris[0]) if len(uris) == 1 else PooledProvider(uris)
+
+
+def in_process_provider(deployer_private_key: str, balance: int, gas_limit: int):
+    """
+    eth-tester over py-evm: the deployer is the only funded account, every transaction is mined into a block of
+    its own right away, so the receipt is there once the transaction is sent. The chain id is eth-tester's own.
+    """
+    # Test dependencies, not needed to talk to a real node
+    from eth_tester import EthereumTester, PyEVMBackend
+    from eth_tester.backends.pyevm.main import generate_genesis_state_for_keys
+    from web3.providers.eth_tester import AsyncEthereumTesterProvider
+
+    backend = PyEVMBackend(
+        genesis_parameters=PyEVMBackend._generate_genesis_params(overrides={"gas_limit": gas_limit}),
+        genesis_state=generate_genesis_state_for_keys(
+            [keys.PrivateKey(HexBytes(deployer_private_key))], overrides={"balance": balance}
+        ),
+    )
+    provider = AsyncEthereumTesterProvider()
+    provider.ethereum_tester = EthereumTester(backend, auto_mine_transactions=True)
+    return provider
+
+
+class Client:
+    """
+    Web3 over a single pool of keep-alive HTTP connections, plus contract factories built once per ABI. Open it
+    once per process (or per test session) and pass `client.w3` around, contract objects are cheap to make out of
+    the cached factories: `client.game(address)`.
+
+    Several URIs of the same chain make a PooledProvider, which shares the very same pool of connections. Any
+    other async provider (see in_process_provider) may be passed instead of the URI, there is no pool then.
+    """
+
+    def __init__(
+        self,
+        uri: str | list[str] | None = None,
+        pool_size=DEFAULT_POOL_SIZE,
+        keepalive=DEFAULT_KEEPALIVE,
+        build_dir=BUILD_DIR,
+        provider=None,
+    ):
+        self.uri = uri
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.build_dir = build_dir
+        self.session: aiohttp.ClientSession | None = None
+        if provider is None:
+            provider = http_provider([uri] if isinstance(uri, str) else uri)
+        self.w3 = Web3(
+            provider,
+            modules={"eth": (AsyncEth,)},
+            middlewares=[],
+        )
+        # Gateway of build/info.json, unless it is deployed by the client itself, see deploy_gateway
+        self.gateway_address: str | None = None
+        self._factories = {}
+
+    @property
+    def backend(self) -> str:
+        return HTTP if isinstance(self.w3.provider, (AsyncHTTPProvider, PooledProvider)) else IN_PROCESS
+
+    async def open(self) -> "Client":
+        if self.backend == HTTP:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=self.keepalive)
+            )
+            if isinstance(self.w3.provider, PooledProvider):
+                self.w3.provider.session = self.session
+            else:
+                # The provider picks the cached session for its endpoint instead of making its own
+                await self.w3.provider.cache_async_session(self.session)
+        return self
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def __aenter__(self) -> "Client":
+        return await self.open()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def abi(self, name: str) -> list:
+        return load_artifact(name, self.build_dir)["abi"]
+
+    def factory(self, name: str):
+        # Contract class with the ABI parsed once, instances only bind an address
+        if name not in self._factories:
+            artifact = load_artifact(name, self.build_dir)
+            self._factories[name] = self.w3.eth.contract(abi=artifact["abi"], bytecode=artifact["bytecode"])
+        return self._factories[name]
+
+    def contract(self, name: str, address: str):
+        return self.factory(name)(address=address)
+
+    def gateway(self):
+        return self.contract("Gateway", self.gateway_address or load_gateway_address(self.build_dir))
+
+    def game(self, address: str):
+        return self.contract("GameInstance", address)
+
+    async def deploy(self, name: str, deployer, transaction: dict) -> str:
+        # `transaction` carries chainId, gas and fees, the nonce is allocated locally
+        receipt = await wait_for_receipt(
+            self.w3,
+            await sign_and_send(
+                self.w3,
+                deployer,
+                await self.factory(name).constructor().build_transaction({**transaction, "from": deployer.address}),
+            ),
+        )
+        assert receipt.status, "failed to deploy %s" % name
+        return receipt.contractAddress
+
+    async def deploy_gateway(self, deployer, transaction: dict) -> str:
+        # Same as migrations/1_deploy_Gateway.js, for the chains nobody has migrated
+        self.gateway_address = await self.deploy("Gateway", deployer, transaction)
+        return self.gateway_address
+
+    # Chain control, which ganache and eth-tester both have, but with different parameters
+
+    async def mine(self, blocks: int = 1):
+        if self.backend == HTTP:
+            await self.w3.provider.make_request("evm_mine", [{"blocks": blocks}])
+        else:
+            await self.w3.provider.make_request("evm_mine", [blocks])
+
+    async def snapshot(self):
+        return (await self.w3.provider.make_request("evm_snapshot", []))["result"]
+
+    async def revert(self, snapshot):
+        response = await self.w3.provider.make_request("evm_revert", [snapshot])
+        # ganache answers false for an unknown snapshot, eth-tester raises
+        if response.get("result") is False or "error" in response:
+            raise ValueError("failed to revert to snapshot %s: %s" % (snapshot, response))
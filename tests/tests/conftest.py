@@ -1,53 +1,86 @@
 import asyncio
-import enum
-import json
 import os
+import statistics
+import time
 from dataclasses import dataclass
 from typing import Any, Mapping
 
 import eth_abi
 import pytest
 from web3 import Web3
-from web3.eth import AsyncEth, Eth
+from web3.eth import Eth
+
+from .client import (BACKENDS, HTTP, IN_PROCESS, Client, in_process_provider,
+                     load_artifact, load_gateway_address)
+from .fees import STATION, TRANSFER_GAS, function_name
+from .gas import BASELINE_PATH, DEFAULT_THRESHOLD, REPORT_PATH, GasRecorder
+from .instrument import TRACER, instrument
+from .nonces import NONCES, sign_and_send
+from .receipts import DEFAULT_POLL_LATENCY, ReceiptWatcher, wait_for_receipt
+from .signing import SigningService, set_default_signer
+from .structs import GameStatus
 
 DEPLOYER_PRIVATE = os.environ.get("DEPLOYER_PRIV")
 DEPLOYER_PUBLIC = Web3.toChecksumAddress(os.environ.get("DEPLOYER_PUB")) # type: ignore
 CHAIN_ID = int(os.environ.get("CHAIN_ID"))                               # type: ignore
 GAS_PRICE = int(os.environ.get("GASPRICE"))                              # type: ignore
 GAS_LIMIT = int(os.environ.get("GASLIMIT"))                              # type: ignore
+CONFIRMATIONS = int(os.environ.get("CONFIRMATIONS", 1))
+RECEIPT_TIMEOUT = int(os.environ.get("RECEIPT_TIMEOUT", 120))
+PROVIDER_URI = "%s:%s" % (os.environ.get("PROVIDER_HOST"), os.environ.get("PROVIDER_PORT"))
+# More endpoints of the same chain, comma separated, the requests are spread over all of them, see rpcpool.py
+PROVIDER_URIS = [PROVIDER_URI] + [uri for uri in os.environ.get("PROVIDER_URIS", "").split(",") if uri]
+# Websocket endpoint of PROVIDER_URI for the subscriptions of notify.py, ganache serves both on the same port
+PROVIDER_WS = os.environ.get("PROVIDER_WS", PROVIDER_URI.replace("http", "ws", 1))
+POOL_SIZE = int(os.environ.get("POOL_SIZE", 32))
+# http: the node of PROVIDER_HOST:PROVIDER_PORT with the Gateway migrated by truffle, inprocess: eth-tester with
+# the Gateway deployed by the session out of the compiled artifacts, see tests/envs/inprocess.env
+BACKEND = os.environ.get("BACKEND", HTTP)
+DEPLOYER_BALANCE = int(os.environ.get("DEPLOYER_BALANCE", 10 ** 24))
+# Processes signing the transactions of the session, 0 signs in the event loop
+SIGN_PROCESSES = int(os.environ.get("SIGN_PROCESSES", 0))
+# GASLIMIT and GASPRICE for every transaction instead of the estimates and the fees of fees.py
+FIXED_GAS = bool(int(os.environ.get("FIXED_GAS", 0)))
+# What the sub-deployer of each xdist worker gets on a shared node, the rest goes back at the end of the session
+WORKER_FUNDS = int(os.environ.get("WORKER_FUNDS", 100 * 10 ** 18))
 DEFAULT_BID = 10 ** 17
+# Waiting games looked at by a single get_waiting_games call, each of them costs the Gateway a call of its own
+LOBBY_MAX_SCAN = 200
 
 
 NUMBER_OF_PREPAYED_WALLETS = 3
-
-
-class GameStatus(enum.IntEnum):
-    created = 0
-    waiting = 1
-    running = 2
-    completed = 3
-    aborted = 4
-    exhausted = 5
+# Running games of the baseline snapshot, see the `baseline` fixture
+BASELINE_SETTINGS = [(1, 1, 1), (3, 3, 3), (5, 5, 3), (20, 20, 5)]
+
+
+def transaction_params(initiator, value=0):
+    return {
+        "from": initiator.address,
+        "chainId": CHAIN_ID,
+        "gas": GAS_LIMIT,
+        "gasPrice": GAS_PRICE,
+        "value": value,
+    }
+
+
+async def transact(w3, function_call, initiator, value=0):
+    # Nonce is left out on purpose, it is allocated locally right before the signing
+    with TRACER.transaction(function_name(function_call)):
+        with TRACER.phase("build"):
+            params = transaction_params(initiator, value)
+            if STATION.enabled:
+                # Gas limit of the kind of the transaction and the fees of the recent blocks, see fees.py
+                params = await STATION.prepare(w3, function_call, params)
+            transaction = await function_call.build_transaction(params)
+        tx_hash = await sign_and_send(w3, initiator, transaction)
+        STATION.sent(tx_hash, function_call)
+        return tx_hash
 
 
 async def append_move_and_get_receipt(w3, game_instance, initiator, x, y):
     return (
-        await w3.eth.wait_for_transaction_receipt(
-            await w3.eth.send_raw_transaction(
-                Eth.account.sign_transaction(
-                    await game_instance.functions.append_move(x, y).build_transaction(
-                        {
-                            "from": initiator.address,
-                            "chainId": CHAIN_ID,
-                            "gas": GAS_LIMIT,
-                            "gasPrice": GAS_PRICE,
-                            "nonce": await w3.eth.get_transaction_count(initiator.address),
-                            "value": 0,
-                        },
-                    ),
-                    initiator.key,
-                ).rawTransaction
-            )
+        await wait_for_receipt(
+            w3, await transact(w3, game_instance.functions.append_move(x, y), initiator)
         )
     )
 
@@ -65,22 +98,8 @@ async def append_move_and_get_logs(w3, gateway_contract, initiator, x, y):
 
 async def cancel_game_and_get_receipt(w3, game_instance, initiator):
     return (
-        await w3.eth.wait_for_transaction_receipt(
-            await w3.eth.send_raw_transaction(
-                Eth.account.sign_transaction(
-                    await game_instance.functions.cancel_game().build_transaction(
-                        {
-                            "from": initiator.address,
-                            "chainId": CHAIN_ID,
-                            "gas": GAS_LIMIT,
-                            "gasPrice": GAS_PRICE,
-                            "nonce": await w3.eth.get_transaction_count(initiator.address),
-                            "value": 0,
-                        },
-                    ),
-                    initiator.key,
-                ).rawTransaction
-            )
+        await wait_for_receipt(
+            w3, await transact(w3, game_instance.functions.cancel_game(), initiator)
         )
     )
 
@@ -88,22 +107,8 @@ async def cancel_game_and_get_receipt(w3, game_instance, initiator):
 async def create_game_and_get_receipt(w3, gateway_contract, initiator, m=20, n=20, k=5, gouged=None):
     gouged = [(item.x, item.y) for item in (list() if gouged is None else gouged)]
     return (
-        await w3.eth.wait_for_transaction_receipt(
-            await w3.eth.send_raw_transaction(
-                Eth.account.sign_transaction(
-                    await gateway_contract.functions.new_game([m, n, k], gouged).build_transaction(
-                        {
-                            "from": initiator.address,
-                            "chainId": CHAIN_ID,
-                            "gas": GAS_LIMIT,
-                            "gasPrice": GAS_PRICE,
-                            "nonce": await w3.eth.get_transaction_count(initiator.address),
-                            "value": 0,
-                        },
-                    ),
-                    initiator.key,
-                ).rawTransaction
-            )
+        await wait_for_receipt(
+            w3, await transact(w3, gateway_contract.functions.new_game([m, n, k], gouged), initiator)
         )
     )
 
@@ -119,24 +124,60 @@ async def create_game_and_get_logs(w3, gateway_contract, initiator, m=20, n=20,
     )
 
 
-async def join_and_get_receipt(w3, game_instance, initiator, bid=DEFAULT_BID):
+async def create_and_join_game_and_get_receipt(
+    w3, gateway_contract, initiator, m=20, n=20, k=5, gouged=None, bid=DEFAULT_BID
+):
+    gouged = [(item.x, item.y) for item in (list() if gouged is None else gouged)]
+    return (
+        await wait_for_receipt(
+            w3, await transact(w3, gateway_contract.functions.new_game_and_join([m, n, k], gouged), initiator, bid)
+        )
+    )
+
+
+async def create_and_join_game_and_get_logs(
+    w3, gateway_contract, initiator, m=20, n=20, k=5, gouged=None, bid=DEFAULT_BID
+):
+    return (
+        gateway_contract
+            .events
+            .GameCreated()
+            .processReceipt(
+                await create_and_join_game_and_get_receipt(
+                    w3, gateway_contract, initiator, m, n, k, gouged=gouged, bid=bid
+                )
+            )
+    )
+
+
+async def create_games_and_get_receipt(w3, gateway_contract, initiator, games):
+    # games: list of (m, n, k, gouged, bid), zero bid leaves the game Created
+    settings = [[m, n, k] for m, n, k, *_ in games]
+    gouged = [[(item.x, item.y) for item in (gouged or [])] for _, _, _, gouged, _ in games]
+    bids = [bid for *_, bid in games]
+    return (
+        await wait_for_receipt(
+            w3,
+            await transact(w3, gateway_contract.functions.new_games(settings, gouged, bids), initiator, sum(bids)),
+        )
+    )
+
+
+async def create_games_and_get_logs(w3, gateway_contract, initiator, games):
     return (
-        await w3.eth.wait_for_transaction_receipt(
-            await w3.eth.send_raw_transaction(
-                Eth.account.sign_transaction(
-                    await game_instance.functions.join().build_transaction(
-                        {
-                            "from": initiator.address,
-                            "chainId": CHAIN_ID,
-                            "gas": GAS_LIMIT,
-                            "gasPrice": GAS_PRICE,
-                            "nonce": await w3.eth.get_transaction_count(initiator.address),
-                            "value": bid,
-                        },
-                    ),
-                    initiator.key,
-                ).rawTransaction
+        gateway_contract
+            .events
+            .GameCreated()
+            .processReceipt(
+                await create_games_and_get_receipt(w3, gateway_contract, initiator, games)
             )
+    )
+
+
+async def join_and_get_receipt(w3, game_instance, initiator, bid=DEFAULT_BID):
+    return (
+        await wait_for_receipt(
+            w3, await transact(w3, game_instance.functions.join(), initiator, bid)
         )
     )
 
@@ -152,6 +193,200 @@ async def join_and_get_logs(initiator, game_instance, w3, bid=DEFAULT_BID):
     )
 
 
+async def get_waiting_games(
+    gateway_contract, page_size=100, min_bid=0, max_bid=0, m=0, n=0, k=0, max_scan=LOBBY_MAX_SCAN
+):
+    # Whole lobby, page by page, a page is a single eth_call
+    games, cursor = [], 0
+    while True:
+        page, cursor = await gateway_contract.functions.get_waiting_games(
+            cursor, page_size, max_scan, (min_bid, max_bid, (m, n, k))
+        ).call()
+        games += page
+        if cursor == 0:
+            return games
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("gas", "gas benchmark")
+    group.addoption("--gas-benchmark", action="store_true", help="run the gas benchmark sweep")
+    group.addoption("--gas-report", default=REPORT_PATH, help="where to write the measured gas, JSON")
+    group.addoption(
+        "--gas-threshold", type=float, default=DEFAULT_THRESHOLD, help="allowed relative gas growth vs the baseline"
+    )
+    group.addoption("--gas-update-baseline", action="store_true", help="store measured gas as the new baseline")
+    group = parser.getgroup("timing", "setup timing")
+    group.addoption("--setup-timing", action="store_true", help="report the time spent setting the tests up")
+    parser.addoption(
+        "--backend", choices=BACKENDS, default=BACKEND, help="chain to run the tests against, BACKEND env by default"
+    )
+    group = parser.getgroup("instrument", "RPC and transaction instrumentation")
+    group.addoption("--metrics", help="write the RPC and transaction metrics there, Prometheus text format")
+    group.addoption("--trace-file", help="write the timeline of every transaction there, Chrome trace event JSON")
+    parser.addoption(
+        "--fixed-gas", action="store_true", default=FIXED_GAS,
+        help="send every transaction with GASLIMIT and GASPRICE instead of estimating them, FIXED_GAS env by default"
+    )
+    parser.addoption(
+        "--sign-processes", type=int, default=SIGN_PROCESSES,
+        help="sign the transactions in a pool of that many processes, SIGN_PROCESSES env by default"
+    )
+
+
+def worker_count(config) -> int:
+    # Number of xdist workers, 0 when the tests run in a single process
+    if hasattr(config, "workerinput"):
+        return config.workerinput["workercount"]
+    return getattr(config.option, "numprocesses", None) or 0
+
+
+def shares_chain(config) -> bool:
+    # Workers over HTTP all talk to the same node, in-process each of them has a chain of its own
+    return worker_count(config) > 1 and config.getoption("--backend") == HTTP
+
+
+async def fund_deployers(count: int) -> list[str]:
+    """
+    Private keys of `count` fresh deployers, each funded with WORKER_FUNDS. Every xdist worker sends from a deployer
+    of its own, so the workers never compete for the nonces of a single account. See sweep_deployers.
+    """
+    deployer = Eth.account.from_key(DEPLOYER_PRIVATE)
+    deployers = [Eth.account.create() for _ in range(count)]
+    async with Client(PROVIDER_URIS) as client:
+        balance = await client.w3.eth.get_balance(deployer.address)
+        if balance < count * (WORKER_FUNDS + TRANSFER_GAS * GAS_PRICE):
+            raise pytest.UsageError(
+                "the deployer has %s, not enough for %s workers of WORKER_FUNDS=%s" % (balance, count, WORKER_FUNDS)
+            )
+        tx_hashes = await fund_wallets(client.w3, deployer, deployers, WORKER_FUNDS)
+        await asyncio.gather(*(wait_for_receipt(client.w3, tx_hash) for tx_hash in tx_hashes))
+    return [account.key.hex() for account in deployers]
+
+
+async def sweep_deployers(keys: list[str]):
+    # Whatever the workers have left to their deployers goes back to the deployer, but the fee of the transfer
+    deployer = Eth.account.from_key(DEPLOYER_PRIVATE)
+    deployers = [Eth.account.from_key(key) for key in keys]
+    fee = TRANSFER_GAS * GAS_PRICE
+    async with Client(PROVIDER_URIS) as client:
+        balances = await asyncio.gather(*(client.w3.eth.get_balance(account.address) for account in deployers))
+        tx_hashes = await asyncio.gather(
+            *(
+                transfer(client.w3, account, deployer.address, balance - fee)
+                for account, balance in zip(deployers, balances)
+                if balance > fee
+            )
+        )
+        await asyncio.gather(*(wait_for_receipt(client.w3, tx_hash) for tx_hash in tx_hashes))
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "gas_benchmark: gas sweep, enabled with --gas-benchmark")
+    config.addinivalue_line("markers", "http_only: talks raw JSON-RPC over HTTP, skipped with the in-process backend")
+    config.addinivalue_line(
+        "markers", "exclusive_chain: reverts the chain or counts on nobody else using it, skipped when workers share it"
+    )
+    if config.getoption("--metrics") or config.getoption("--trace-file"):
+        TRACER.enable()
+    if config.getoption("--gas-benchmark") and not config.getoption("--gas-update-baseline"):
+        if not GasRecorder().baseline:
+            # Every single case would fail for the lack of a reference
+            raise pytest.UsageError("%s is empty, record it with --gas-update-baseline first" % BASELINE_PATH)
+    if hasattr(config, "workerinput") or worker_count(config) == 0:
+        return
+    if config.getoption("--gas-benchmark"):
+        # Every worker would write a report of its own part of the sweep into the very same file
+        raise pytest.UsageError("the gas benchmark runs in a single process, drop -n")
+    if config.getoption("--backend") == HTTP:
+        config.worker_deployers = asyncio.run(fund_deployers(worker_count(config)))
+
+
+def pytest_unconfigure(config):
+    # The controller, once every worker is done
+    if getattr(config, "worker_deployers", None):
+        asyncio.run(sweep_deployers(config.worker_deployers))
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_configure_node(node):
+    # xdist hook, called on the controller for every worker it starts
+    deployers = getattr(node.config, "worker_deployers", None)
+    if deployers:
+        node.workerinput["deployer"] = deployers[int(node.workerinput["workerid"][2:])]
+
+
+def pytest_collection_modifyitems(config, items):
+    skip_benchmark = pytest.mark.skip(reason="gas benchmark, use --gas-benchmark to run")
+    skip_http = pytest.mark.skip(reason="needs a node over HTTP")
+    skip_shared = pytest.mark.skip(reason="needs a chain of its own, the workers share the node")
+    for item in items:
+        if "gas_benchmark" in item.keywords and not config.getoption("--gas-benchmark"):
+            item.add_marker(skip_benchmark)
+        if "http_only" in item.keywords and config.getoption("--backend") != HTTP:
+            item.add_marker(skip_http)
+        if "exclusive_chain" in item.keywords and shares_chain(config):
+            item.add_marker(skip_shared)
+
+
+# (test id, seconds) of every test setup, fixtures included
+SETUP_DURATIONS: list[tuple[str, float]] = []
+SESSION_STARTED = time.monotonic()
+
+
+def pytest_sessionstart(session):
+    global SESSION_STARTED
+    SESSION_STARTED = time.monotonic()
+
+
+def pytest_sessionfinish(session):
+    config = session.config
+    if not TRACER.enabled:
+        return
+    # Every xdist worker has metrics and traces of its own
+    suffix = "." + config.workerinput["workerid"] if hasattr(config, "workerinput") else ""
+    TRACER.dump(
+        config.getoption("--metrics") and config.getoption("--metrics") + suffix,
+        config.getoption("--trace-file") and config.getoption("--trace-file") + suffix,
+    )
+
+
+def pytest_runtest_logreport(report):
+    if report.when == "setup" and report.passed:
+        SETUP_DURATIONS.append((report.nodeid, report.duration))
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    if hasattr(config, "workerinput"):
+        return
+    # Compare the runs of tests/scaling.sh by this line
+    terminalreporter.write_line(
+        "wall clock: %.1fs, %s" % (
+            time.monotonic() - SESSION_STARTED,
+            "%s workers" % worker_count(config) if worker_count(config) else "single process",
+        )
+    )
+    if STATION.report():
+        # Workers have estimates of their own, this is a single process run
+        terminalreporter.section("gas estimates")
+        for line in STATION.report():
+            terminalreporter.write_line(line)
+    if not config.getoption("--setup-timing") or not SETUP_DURATIONS:
+        return
+    durations = [duration for _, duration in SETUP_DURATIONS]
+    terminalreporter.section("setup timing")
+    terminalreporter.write_line(
+        "%s setups: total %.3fs, mean %.1fms, median %.1fms, max %.1fms" % (
+            len(durations),
+            sum(durations),
+            1000 * statistics.mean(durations),
+            1000 * statistics.median(durations),
+            1000 * max(durations),
+        )
+    )
+    for nodeid, duration in sorted(SETUP_DURATIONS, key=lambda item: -item[1])[:5]:
+        terminalreporter.write_line("%8.1fms %s" % (1000 * duration, nodeid))
+
+
 # Override the pytest-asyncio event_loop fixture to make it session scoped. This is required in order to enable
 # async test fixtures with a session scope. More info: https://github.com/pytest-dev/pytest-asyncio/issues/68
 @pytest.fixture(scope="session")
@@ -161,125 +396,228 @@ def event_loop():
     loop.close()
 
 
+@pytest.fixture(scope="session", autouse=True)
+async def signer(request):
+    # Every sign_and_send of the session goes through the pool, unless the transactions are signed in the loop
+    processes = request.config.getoption("--sign-processes")
+    if not processes:
+        yield None
+        return
+    async with SigningService(processes) as service:
+        previous = set_default_signer(service)
+        yield service
+        set_default_signer(previous)
+
+
+@pytest.fixture(scope="session")
+def gas_recorder(request):
+    recorder = GasRecorder(
+        threshold=request.config.getoption("--gas-threshold"), update=request.config.getoption("--gas-update-baseline")
+    )
+    yield recorder
+    recorder.dump(request.config.getoption("--gas-report"))
+    if recorder.update:
+        recorder.update_baseline()
+
+
 @dataclass
 class ABIAddress:
-    abi: Mapping[str, Any]
+    abi: list[Mapping[str, Any]]
     address: str
 
 
+@pytest.fixture(scope="session")
+async def client(request):
+    # A single connection pool and a single set of contract factories for the whole session
+    if request.config.getoption("--backend") == IN_PROCESS:
+        client = Client(provider=in_process_provider(DEPLOYER_PRIVATE, DEPLOYER_BALANCE, GAS_LIMIT))
+        # Receipts are there as soon as the transactions are sent, there is nothing to wait for
+        poll_latency = 0
+    else:
+        client = Client(PROVIDER_URIS, pool_size=POOL_SIZE)
+        poll_latency = DEFAULT_POLL_LATENCY
+    instrument(client.w3)
+    async with client:
+        # All the helpers share a single block follower instead of polling for each receipt separately
+        ReceiptWatcher.of(client.w3, confirmations=CONFIRMATIONS, timeout=RECEIPT_TIMEOUT, poll_latency=poll_latency)
+        if not request.config.getoption("--fixed-gas"):
+            STATION.enable(GAS_LIMIT, GAS_PRICE)
+            STATION.block_gas_limit = (await client.w3.eth.get_block("latest"))["gasLimit"]
+        if client.backend == IN_PROCESS:
+            chain_id = await client.w3.eth.chain_id
+            assert chain_id == CHAIN_ID, "CHAIN_ID must be %s for the in-process chain, got %s" % (chain_id, CHAIN_ID)
+            # The chain is the worker's own, so is its genesis deployer
+            deployer = Eth.account.from_key(DEPLOYER_PRIVATE)
+            await client.deploy_gateway(deployer, transaction_params(deployer))
+        yield client
+
+
+@dataclass
+class Baseline:
+    # Block, which the chain is reverted to after each test, see `isolation`
+    block: int
+    # (alice, bob, m, n, k) -> running game, created before the snapshot
+    games: dict[tuple[str, str, int, int, int], str]
+
+
+async def transfer(w3, sender, to, value):
+    return await sign_and_send(
+        w3,
+        sender,
+        {
+            "gas": TRANSFER_GAS,
+            "gasPrice": GAS_PRICE,
+            "to": to,
+            "from": sender.address,
+            "value": value,
+            "chainId": CHAIN_ID,
+        },
+    )
+
+
+async def fund_wallets(w3, deployer, wallets, value=2 * 10 ** 18):
+    # Nonces are allocated locally, so all the funding transactions are pipelined
+    return await asyncio.gather(*(transfer(w3, deployer, wallet.address, value) for wallet in wallets))
+
+
+@pytest.fixture(scope="session")
+def deployer(request):
+    # Sub-deployer of the xdist worker on a shared node (see fund_deployers), the deployer of the env otherwise
+    return Eth.account.from_key(getattr(request.config, "workerinput", {}).get("deployer", DEPLOYER_PRIVATE))
+
+
+@pytest.fixture(scope="session")
+async def chain_snapshots(request, client):
+    # Whether the chain can be snapshotted and reverted: ganache and eth-tester can, public networks cannot. Neither
+    # can a node shared by the workers, a revert would take the transactions of the other workers away as well
+    if shares_chain(request.config):
+        return False
+    try:
+        await client.revert(await client.snapshot())
+    except Exception:
+        return False
+    return True
+
+
 @pytest.fixture
-def gateway_abi_address():
-    with open("./build/info.json") as f:
-        address = json.load(f)["address"]
-    with open("./build/contracts/Gateway.json") as f:
-        abi = json.dumps(json.load(f)["abi"])
-    return ABIAddress(abi, address)
+def chain_control(chain_snapshots):
+    # Blocks are mined at will (see Client.mine), which public networks do not let anybody do
+    if not chain_snapshots:
+        pytest.skip("needs a chain of its own, which blocks can be mined on at will")
+
+
+@pytest.fixture(scope="session")
+async def wallet_pool(client, deployer, chain_snapshots):
+    # Funded once per session, every test gets them back with the balances of the baseline
+    if not chain_snapshots:
+        return None
+    wallets = [Eth.account.create() for _ in range(NUMBER_OF_PREPAYED_WALLETS)]
+    await asyncio.gather(
+        *(wait_for_receipt(client.w3, tx_hash) for tx_hash in await fund_wallets(client.w3, deployer, wallets))
+    )
+    return wallets
+
+
+@pytest.fixture(scope="session")
+async def baseline(client, wallet_pool):
+    """
+    A running game of each of BASELINE_SETTINGS between the first two pool wallets, so that get_game_running
+    does not repeat the create and join transactions in every test.
+    """
+    w3 = client.w3
+    games = {}
+    if wallet_pool is not None:
+        alice, bob, *_ = wallet_pool
+        gateway_contract = client.gateway()
+
+        async def running(m, n, k):
+            logs = await create_and_join_game_and_get_logs(w3, gateway_contract, alice, m, n, k)
+            game = client.game(logs[0]["args"]["game"])
+            assert (await join_and_get_receipt(w3, game, bob)).status
+            games[alice.address, bob.address, m, n, k] = game.address
+
+        await asyncio.gather(*(running(m, n, k) for m, n, k in BASELINE_SETTINGS))
+    return Baseline(await w3.eth.block_number, games)
 
 
 @pytest.fixture
-def game_abi():
-    with open("./build/contracts/GameInstance.json") as f:
-        return json.dumps(json.load(f)["abi"])
+async def isolation(client, chain_snapshots, baseline):
+    # Whatever the test does to the chain is reverted, the next test starts from the baseline again
+    if not chain_snapshots:
+        yield baseline
+        return
+    snapshot = await client.snapshot()
+    yield baseline
+    await client.revert(snapshot)
+    # The reverted transactions have taken their nonces and blocks with them
+    NONCES.reset()
+    ReceiptWatcher.of(client.w3).reset()
+    # So have the games, whose addresses the next ones get
+    STATION.forget_games()
+
 
+@pytest.fixture
+def gateway_abi_address(client):
+    return ABIAddress(client.abi("Gateway"), load_gateway_address())
 
 
 @pytest.fixture
-def w3() -> Web3:
-    return Web3(
-        Web3.AsyncHTTPProvider(
-            "%s:%s" % (os.environ.get("PROVIDER_HOST"), os.environ.get("PROVIDER_PORT"))
-        ),
-        modules={"eth": (AsyncEth,)},
-        middlewares=[],
-    )
+def game_abi(client):
+    return client.abi("GameInstance")
+
+
+@pytest.fixture
+def w3(client, isolation) -> Web3:
+    return client.w3
 
 
 @pytest.fixture(scope="function")
-def get_game_created(w3, gateway_contract, game_abi):
+def get_game_created(w3, client, gateway_contract):
     async def inner(initiator, m=20, n=20, k=5, gouged=None):
         # Alice creates the new game
         game_created_logs = await create_game_and_get_logs(w3, gateway_contract, initiator, m, n, k, gouged=gouged)
-        return w3.eth.contract(address=game_created_logs[0]["args"]["game"], abi=game_abi)
+        return client.game(game_created_logs[0]["args"]["game"])
     return inner
 
 
 @pytest.fixture(scope="function")
-def get_game_waiting(w3, get_game_created):
+def get_game_waiting(w3, client, gateway_contract):
     async def inner(initiator, m=20, n=20, k=5, gouged=None, bid=DEFAULT_BID):
-        # Alice creates the new game
-        game = await get_game_created(initiator=initiator, m=m, n=n, k=k, gouged=gouged)
-        await w3.eth.send_raw_transaction(
-            Eth.account.sign_transaction(
-                await game
-                    .functions
-                    .join()
-                    .build_transaction(
-                        {
-                            "from": initiator.address,
-                            "chainId": CHAIN_ID,
-                            "gas": GAS_LIMIT,
-                            "gasPrice": GAS_PRICE,
-                            "nonce": await w3.eth.get_transaction_count(initiator.address),
-                            "value": bid
-                        },
-                    ),
-                initiator.key,
-            ).rawTransaction
+        # Alice creates the new game and joins it in a single transaction
+        game_created_logs = await create_and_join_game_and_get_logs(
+            w3, gateway_contract, initiator, m, n, k, gouged=gouged, bid=bid
         )
-        return game
+        return client.game(game_created_logs[0]["args"]["game"])
     return inner
 
 
 @pytest.fixture(scope="function")
-async def get_game_running(w3, get_game_waiting):
+async def get_game_running(w3, client, isolation, get_game_waiting):
+    # Each baseline game is handed out once per test, the next request of the same game makes a new one
+    unused = dict(isolation.games)
+
     async def inner(initiator, follower, m=20, n=20, k=5, gouged=None, bid=DEFAULT_BID):
+        key = (initiator.address, follower.address, m, n, k)
+        if not gouged and bid == DEFAULT_BID and key in unused:
+            return client.game(unused.pop(key))
         game = await get_game_waiting(initiator=initiator, m=m, n=n, k=k, gouged=gouged, bid=bid)
-        await w3.eth.wait_for_transaction_receipt(
-            await w3.eth.send_raw_transaction(
-                Eth.account.sign_transaction(
-                    await game
-                        .functions
-                        .join()
-                        .build_transaction(
-                            {
-                                "from": follower.address,
-                                "chainId": CHAIN_ID,
-                                "gas": GAS_LIMIT,
-                                "gasPrice": GAS_PRICE,
-                                "nonce": await w3.eth.get_transaction_count(follower.address),
-                                "value": bid,
-                            },
-                        ),
-                    follower.key,
-                ).rawTransaction
-            )
+        await wait_for_receipt(
+            w3, await transact(w3, game.functions.join(), follower, bid)
         )
         return game
     return inner
 
 
 @pytest.fixture
-def gateway_contract(w3, gateway_abi_address):
-    return w3.eth.contract(address=gateway_abi_address.address, abi=gateway_abi_address.abi)
+def gateway_contract(client, isolation):
+    return client.gateway()
 
 
 @pytest.fixture(scope="function")
-async def prepayed_wallets(w3):
-    nonce = await w3.eth.get_transaction_count(DEPLOYER_PUBLIC)
+async def prepayed_wallets(w3, deployer, wallet_pool):
+    if wallet_pool is not None:
+        return wallet_pool
+    # No snapshots, hence no pool either: fresh wallets for every test
     wallets = [Eth.account.create() for _ in range(NUMBER_OF_PREPAYED_WALLETS)]
-    for index, wallet in enumerate(wallets):
-        await w3.eth.send_raw_transaction(
-            Eth.account.sign_transaction(
-                {
-                    "gas": GAS_LIMIT,
-                    "gasPrice": GAS_PRICE,
-                    "nonce": nonce + index,
-                    "to": wallet.address,
-                    "from": DEPLOYER_PUBLIC,
-                    "value": 2 * 10 ** 18,
-                    "chainId": CHAIN_ID,
-                },
-                DEPLOYER_PRIVATE,
-            ).rawTransaction
-        )
+    await fund_wallets(w3, deployer, wallets)
     return wallets
@@ -0,0 +1,108 @@
+import numpy as np
+
+from .structs import CellOwner, GameStatus
+
+# Same messages as the requires of GameInstance, so that a pre-flight check reads exactly like a reverted transaction
+ERROR_INVALID_SETTINGS = "ERROR: invalid settings"
+ERROR_NOT_RUNNING = "ERROR: the game is not running"
+ERROR_NOT_YOUR_TURN = "ERROR: not your turn"
+ERROR_OUTSIDE = "ERROR: illegal move (outside the board)"
+ERROR_TAKEN = "ERROR: illegal move (already taken)"
+MAXUINT8 = 255
+
+
+class IllegalMove(Exception):
+    pass
+
+
+class Engine:
+    """
+    Off-chain model of a running GameInstance: same turn order, same win rule (exactly k in a row, counting at most
+    k - 1 cells on each side of the move, as the check_* functions do) and the same Exhausted rule (all m * n moves
+    made, gouged cells never count as moves).
+
+    Each player has a bitboard per line of every direction: columns, rows, main and secondary diagonals, a line
+    is at most 255 bits long. A move updates four lines and the win check is a couple of bit operations on them,
+    hence both the legality and the win check do not depend on the board size.
+    """
+
+    def __init__(self, m: int, n: int, k: int, gouged=()):
+        if not (0 < k <= m <= MAXUINT8 and k <= n <= MAXUINT8):
+            raise ValueError(ERROR_INVALID_SETTINGS)
+        self.m, self.n, self.k = m, n, k
+        self.status = GameStatus.running
+        self.turn = CellOwner.alice
+        self.moves = 0
+        # Cell (x, y) is cells[x * n + y], the same layout as the contract's board
+        self.cells = bytearray(m * n)
+        # player -> direction -> line index -> bits
+        self.lines = {
+            player: ([0] * m, [0] * n, [0] * (m + n - 1), [0] * (m + n - 1))
+            for player in (CellOwner.alice, CellOwner.bob)
+        }
+        for x, y in gouged:
+            # Same as the contract: cells outside the board are ignored
+            if x < m and y < n:
+                self.cells[x * n + y] = CellOwner.gouged
+
+    def _coordinates(self, player: CellOwner, x: int, y: int):
+        # (lines, line index, bit) of the cell for each direction:
+        # vertical (x fixed), horizontal (y fixed), main diagonal (x - y fixed), secondary diagonal (x + y fixed)
+        columns, rows, main, secondary = self.lines[player]
+        return ((columns, x, y), (rows, y, x), (main, x - y + self.n - 1, x), (secondary, x + y, x))
+
+    def owner(self, x: int, y: int) -> CellOwner:
+        return CellOwner(self.cells[x * self.n + y])
+
+    def check(self, x: int, y: int, player: CellOwner | None = None):
+        if self.status != GameStatus.running:
+            raise IllegalMove(ERROR_NOT_RUNNING)
+        if player is not None and player != self.turn:
+            raise IllegalMove(ERROR_NOT_YOUR_TURN)
+        if not (0 <= x < self.m and 0 <= y < self.n):
+            raise IllegalMove(ERROR_OUTSIDE)
+        if self.cells[x * self.n + y] != CellOwner.available:
+            raise IllegalMove(ERROR_TAKEN)
+
+    def is_winning(self, x: int, y: int) -> bool:
+        # Whether the move of the current player to (x, y) wins, the cell itself is assumed to be available
+        k = self.k
+        limit = k - 1
+        for lines, index, bit in self._coordinates(self.turn, x, y):
+            line = lines[index] | (1 << bit)
+            # Consecutive set bits right above the move's bit: position of the lowest zero bit
+            above = line >> (bit + 1)
+            up = (~above & (above + 1)).bit_length() - 1
+            # Consecutive set bits right below the move's bit: distance to the highest zero bit
+            down = bit - (~line & ((1 << bit) - 1)).bit_length()
+            if 1 + (up if up < limit else limit) + (down if down < limit else limit) == k:
+                return True
+        return False
+
+    def play(self, x: int, y: int, player: CellOwner | None = None) -> bool:
+        """
+        Applies the move of the current player (if `player` is given, it must be the current one), returns whether
+        the move wins. Raises IllegalMove exactly when GameInstance.append_move would revert.
+        """
+        self.check(x, y, player)
+        is_winner = self.is_winning(x, y)
+        self.cells[x * self.n + y] = self.turn
+        for lines, index, bit in self._coordinates(self.turn, x, y):
+            lines[index] |= 1 << bit
+        self.moves += 1
+        if is_winner:
+            self.status = GameStatus.completed
+        elif self.moves == self.m * self.n:
+            self.status = GameStatus.exhausted
+        else:
+            self.turn = CellOwner.bob if self.turn == CellOwner.alice else CellOwner.alice
+        return is_winner
+
+    @property
+    def winner(self) -> CellOwner | None:
+        # The winner is the player, who made the last move, as in GameInstance.get_winner
+        return self.turn if self.status == GameStatus.completed else None
+
+    def board(self) -> np.ndarray:
+        # (m, n) view of the cells, no copying
+        return np.frombuffer(self.cells, dtype=np.uint8).reshape(self.m, self.n)
@@ -0,0 +1,213 @@
+import math
+import statistics
+import time
+from collections import defaultdict
+
+from eth_utils import keccak
+from hexbytes import HexBytes
+from web3 import Web3
+
+# Gas limit of a transaction over the most expensive gasUsed seen of its kind
+DEFAULT_MARGIN = 0.3
+# eth_feeHistory: blocks sampled, percentile of the priority fees paid in them and how long the fees are reused
+FEE_HISTORY_BLOCKS = 20
+REWARD_PERCENTILE = 50
+FEE_MAX_AGE = 5.0
+# Room for the base fee to grow before the transaction is mined, the base fee may double in 6 full blocks
+BASE_FEE_MULTIPLIER = 2
+# A plain transfer to an account without code
+TRANSFER_GAS = 21_000
+
+GAME_CREATED_TOPIC = HexBytes(keccak(text="GameCreated(address,address)"))
+MOVE_APPENDED_TOPIC = HexBytes(keccak(text="MoveAppended(address,address,uint8,uint8,bool)"))
+# Functions of the Gateway, which make a game of the settings of their first argument
+CREATE_FUNCTIONS = frozenset({"new_game", "new_game_and_join"})
+CONSTRUCTOR = "constructor"
+
+
+class GasStation:
+    """
+    Gas limits and fees of the transactions sent by transact (and the load generator). Instead of the fixed
+    GASLIMIT, a transaction gets the most expensive gasUsed seen of its kind plus a margin. The kind is
+    (function, m, n, k, winning): the board shape is that of the game called or created, winning tells the
+    move, which completes the game, from the rest of them. The first transaction of a kind is estimated with
+    eth_estimateGas. Whether a move wins is only known once it is mined, so moves are estimated one by one till
+    a winning move of the shape is seen, from then on a move is budgeted as the winning one. A transaction,
+    which is going to revert (and hence cannot be estimated), gets the fixed limit, as it used to. A call with a
+    list argument (gouged cells, signed moves) costs more the longer the list is and is estimated every time.
+
+    Fees are EIP-1559 ones out of eth_feeHistory: the median priority fee of the recent blocks on top of twice
+    the next base fee. A chain without a base fee (Harmony) gets the legacy fixed gas price.
+
+    Disabled, transactions get the fixed limit and price, see transaction_params of conftest.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.gas_limit = 0
+        self.gas_price = 0
+        self.margin = DEFAULT_MARGIN
+        # (function, m, n, k, winning) -> the most gas seen, estimated or used
+        self.gas: dict[tuple, int] = {}
+        self.observations: dict[tuple, int] = defaultdict(int)
+        self.estimates = 0
+        # game -> (m, n, k), None for any other contract
+        self.shapes: dict[str, tuple[int, int, int] | None] = {}
+        self.block_gas_limit: int | None = None
+        self._fees: dict | None = None
+        self._fees_updated = 0.0
+        # Sent, but not mined yet: tx hash -> (function, shape, cacheable)
+        self._pending: dict[HexBytes, tuple[str, tuple | None, bool]] = {}
+
+    def enable(self, gas_limit: int, gas_price: int, margin=DEFAULT_MARGIN):
+        self.enabled = True
+        self.gas_limit = gas_limit
+        self.gas_price = gas_price
+        self.margin = margin
+
+    def reset(self):
+        # Disabled and empty again
+        self.__init__()
+
+    def forget_games(self):
+        # The chain has been reverted, the next games are going to be created at the very same addresses
+        self.shapes.clear()
+        self._pending.clear()
+
+    async def shape_of(self, function_call) -> tuple[int, int, int] | None:
+        if function_name(function_call) in CREATE_FUNCTIONS:
+            return tuple(function_call.args[0])
+        if function_name(function_call) == CONSTRUCTOR:
+            return None
+        if function_call.address not in self.shapes:
+            try:
+                contract = function_call.w3.eth.contract(function_call.address, abi=function_call.contract_abi)
+                self.shapes[function_call.address] = tuple(await contract.functions.get_settings().call())
+            except (AttributeError, ValueError):
+                # Not a game, no shape then
+                self.shapes[function_call.address] = None
+        return self.shapes[function_call.address]
+
+    def limit(self, gas: int) -> int:
+        return min(self.gas_limit, math.ceil(gas * (1 + self.margin)))
+
+    def budget(self, function: str, shape: tuple | None) -> int | None:
+        # Gas limit of a transaction of the kind, None if it has to be estimated
+        shape = shape or (None,) * 3
+        if function == "append_move" and (function, *shape, True) not in self.gas:
+            return None
+        gas = max(self.gas.get((function, *shape, winning), 0) for winning in (False, True))
+        return self.limit(gas) if gas else None
+
+    async def prepare(self, w3, function_call, params: dict) -> dict:
+        # `params` of build_transaction with the gas limit and the fees of the transaction
+        shape = await self.shape_of(function_call)
+        gas = self.budget(function_name(function_call), shape) if cacheable(function_call) else None
+        fees = await self.fees(w3)
+        params = {**{key: value for key, value in params.items() if key not in ("gas", "gasPrice")}, **fees}
+        if gas is None:
+            try:
+                estimate = await function_call.estimate_gas(params)
+            except ValueError:
+                # Reverts as things stand, the fixed limit keeps the failure on chain, where the tests expect it
+                return {**params, "gas": self.gas_limit}
+            self.estimates += 1
+            if cacheable(function_call):
+                key = (function_name(function_call), *(shape or (None,) * 3), False)
+                self.gas[key] = max(self.gas.get(key, 0), estimate)
+            gas = self.limit(estimate)
+        return {**params, "gas": gas}
+
+    async def fees(self, w3) -> dict:
+        if self._fees is None or time.monotonic() - self._fees_updated > FEE_MAX_AGE:
+            self._fees = await self._fee_history(w3)
+            self._fees_updated = time.monotonic()
+        return self._fees
+
+    async def _fee_history(self, w3) -> dict:
+        try:
+            history = await w3.eth.fee_history(FEE_HISTORY_BLOCKS, "latest", [REWARD_PERCENTILE])
+        except (ValueError, NotImplementedError):
+            return {"gasPrice": self.gas_price}
+        base_fees = history.get("baseFeePerGas") or []
+        if not any(base_fees):
+            return {"gasPrice": self.gas_price}
+        rewards = [reward[0] for reward in history.get("reward") or [] if reward]
+        priority = int(statistics.median(rewards)) if rewards else 0
+        # The last base fee is the one of the next block
+        return {"maxFeePerGas": BASE_FEE_MULTIPLIER * base_fees[-1] + priority, "maxPriorityFeePerGas": priority}
+
+    def sent(self, tx_hash, function_call):
+        if not self.enabled or function_name(function_call) == CONSTRUCTOR:
+            return
+        shape = tuple(function_call.args[0]) if function_call.fn_name in CREATE_FUNCTIONS else self.shapes.get(
+            function_call.address
+        )
+        self._pending[HexBytes(tx_hash)] = (function_call.fn_name, shape, cacheable(function_call))
+
+    def mined(self, tx_hash, receipt):
+        sent = self._pending.pop(HexBytes(tx_hash), None) if self.enabled else None
+        if sent is None or not receipt["status"]:
+            return
+        function, shape, is_cacheable = sent
+        winning = False
+        for log in receipt["logs"]:
+            topic = HexBytes(log["topics"][0]) if log["topics"] else None
+            if topic == MOVE_APPENDED_TOPIC:
+                # x, y and is_winner, a word each
+                winning = winning or bool(int.from_bytes(HexBytes(log["data"])[64:96], "big"))
+            elif topic == GAME_CREATED_TOPIC:
+                game = Web3.toChecksumAddress(HexBytes(log["topics"][1])[-20:])
+                if function in CREATE_FUNCTIONS:
+                    self.shapes[game] = shape
+                else:
+                    # A batch, the shape is asked for once the game is called
+                    self.shapes.pop(game, None)
+        if not is_cacheable:
+            return
+        key = (function, *(shape or (None,) * 3), winning)
+        self.gas[key] = max(self.gas.get(key, 0), receipt["gasUsed"])
+        self.observations[key] += 1
+
+    def move_limits(self) -> dict[tuple[int, int, int], int]:
+        # (m, n, k) -> gas limit of a move, winning or not, on the board of the shape
+        limits = defaultdict(int)
+        for (function, *shape, _), gas in self.gas.items():
+            if function == "append_move" and shape[0] is not None:
+                limits[tuple(shape)] = max(limits[tuple(shape)], self.limit(gas))
+        return dict(sorted(limits.items()))
+
+    def moves_per_block(self) -> dict[tuple[int, int, int], tuple[int, int]]:
+        # (m, n, k) -> append_move transactions fitting into a block with the fixed limit and with the budget
+        if not self.block_gas_limit:
+            return {}
+        return {
+            shape: (self.block_gas_limit // self.gas_limit, self.block_gas_limit // limit)
+            for shape, limit in self.move_limits().items()
+        }
+
+    def report(self) -> list[str]:
+        limits = self.move_limits()
+        return [
+            "append_move %sx%s/%s: %s per block of %s gas with the fixed limit of %s, %s with %s" % (
+                m, n, k, fixed, self.block_gas_limit, self.gas_limit, budgeted, limits[m, n, k]
+            )
+            for (m, n, k), (fixed, budgeted) in self.moves_per_block().items()
+        ]
+
+
+def function_name(function_call) -> str:
+    # Contract function or constructor, see test_gas
+    return getattr(function_call, "fn_name", CONSTRUCTOR)
+
+
+def cacheable(function_call) -> bool:
+    # The gas of a call with a list argument (gouged cells, signed moves, a batch of games) depends on its length,
+    # the gas of a deployment on the constructor arguments
+    if function_name(function_call) == CONSTRUCTOR:
+        return False
+    args = function_call.args[1:] if function_call.fn_name in CREATE_FUNCTIONS else function_call.args
+    return not any(isinstance(arg, (list, tuple)) and arg for arg in args)
+
+
+STATION = GasStation()
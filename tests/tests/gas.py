@@ -0,0 +1,55 @@
+import json
+import os
+
+# Committed reference numbers, regenerate with `--gas-update-baseline` after an intended change of the contracts
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "gas_baseline.json")
+REPORT_PATH = "./build/gas_report.json"
+# Allowed relative growth of gasUsed before the benchmark fails
+DEFAULT_THRESHOLD = 0.02
+
+
+class GasRecorder:
+    """
+    Collects gasUsed of the receipts per benchmark case and operation and compares them with the baseline.
+    The report has the very same shape as the baseline: {case: {operation: gas_used}}. An operation missing
+    from the baseline is a failure as well, unless the baseline is being updated.
+    """
+
+    def __init__(self, baseline_path=BASELINE_PATH, threshold=DEFAULT_THRESHOLD, update=False):
+        self.baseline_path = baseline_path
+        self.threshold = threshold
+        self.update = update
+        self.measurements: dict[str, dict[str, int]] = {}
+        if os.path.exists(baseline_path):
+            with open(baseline_path) as f:
+                self.baseline = json.load(f)
+        else:
+            self.baseline = {}
+
+    def record(self, case: str, operation: str, receipt):
+        assert receipt["status"], "%s of %s has failed, nothing to measure" % (operation, case)
+        self.measurements.setdefault(case, {})[operation] = receipt["gasUsed"]
+
+    def regressions(self, case: str) -> list[str]:
+        regressions = []
+        for operation, gas_used in self.measurements.get(case, {}).items():
+            reference = self.baseline.get(case, {}).get(operation)
+            if reference is None:
+                if not self.update:
+                    regressions.append("%s: %s gas, no baseline, see --gas-update-baseline" % (operation, gas_used))
+            elif gas_used > reference * (1 + self.threshold):
+                regressions.append(
+                    "%s: %s gas, baseline %s (+%.1f%%)" % (
+                        operation, gas_used, reference, 100 * (gas_used - reference) / reference
+                    )
+                )
+        return regressions
+
+    def dump(self, path=REPORT_PATH):
+        with open(path, "w") as f:
+            json.dump(self.measurements, f, indent=2, sort_keys=True)
+
+    def update_baseline(self):
+        self.baseline.update(self.measurements)
+        with open(self.baseline_path, "w") as f:
+            json.dump(self.baseline, f, indent=2, sort_keys=True)
@@ -0,0 +1,323 @@
+import asyncio
+import sqlite3
+
+from eth_utils import event_abi_to_log_topic
+
+from .structs import GameStatus
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_CHUNK_SIZE = 100_000
+# A chunk with fewer logs than that is followed by a twice as large one
+TARGET_LOGS = 2000
+# Block hashes kept to detect reorgs, a deeper reorg re-indexes from the start block
+REORG_DEPTH = 128
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cursor (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    block INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    number INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS games (
+    address TEXT PRIMARY KEY,
+    initiator TEXT NOT NULL,
+    m INTEGER,
+    n INTEGER,
+    k INTEGER,
+    block INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS games_initiator ON games (initiator);
+CREATE INDEX IF NOT EXISTS games_block ON games (block);
+CREATE TABLE IF NOT EXISTS joins (
+    game TEXT NOT NULL,
+    player TEXT NOT NULL,
+    block INTEGER NOT NULL,
+    PRIMARY KEY (game, player)
+);
+CREATE INDEX IF NOT EXISTS joins_player ON joins (player);
+CREATE INDEX IF NOT EXISTS joins_block ON joins (block);
+CREATE TABLE IF NOT EXISTS moves (
+    game TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    player TEXT NOT NULL,
+    x INTEGER NOT NULL,
+    y INTEGER NOT NULL,
+    is_winner INTEGER NOT NULL,
+    block INTEGER NOT NULL,
+    PRIMARY KEY (game, number)
+);
+CREATE INDEX IF NOT EXISTS moves_block ON moves (block);
+CREATE TABLE IF NOT EXISTS cancellations (
+    game TEXT PRIMARY KEY,
+    block INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cancellations_block ON cancellations (block);
+CREATE TABLE IF NOT EXISTS statuses (
+    game TEXT PRIMARY KEY,
+    status INTEGER NOT NULL,
+    block INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS statuses_block ON statuses (block);
+"""
+TABLES = ("games", "joins", "moves", "cancellations", "statuses")
+
+
+def address_topic(address: str) -> str:
+    # An indexed address is a topic of 32 bytes, left padded with zeros
+    return "0x" + "0" * 24 + address[2:].lower()
+
+
+class Indexer:
+    """
+    Follows GameCreated of the Gateway and PlayerJoined, MoveAppended, GameCancelled, GameStatusChanged of its games
+    into SQLite.
+
+    eth_getLogs is called for block ranges starting at the persisted cursor, the range doubles while the chunks are
+    light and halves when the node refuses to serve one. Every row carries its block number and the hashes of the
+    recent blocks are kept, so a reorg is rolled back to the last block still on the chain and indexed again.
+
+    Settings are not part of any event, they are fetched once per new game.
+    """
+
+    def __init__(
+        self,
+        w3,
+        gateway_contract,
+        game_contract,
+        path=":memory:",
+        start_block=0,
+        confirmations=0,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        max_chunk_size=MAX_CHUNK_SIZE,
+    ):
+        # game_contract is the GameInstance contract factory (see Client.factory), games are bound to it by address
+        self.w3 = w3
+        self.gateway = gateway_contract
+        self.game = game_contract
+        self.start_block = start_block
+        self.confirmations = confirmations
+        self.chunk_size = chunk_size
+        self.max_chunk_size = max_chunk_size
+        self.events = {
+            event_abi_to_log_topic(event._get_event_abi()): event
+            for event in (
+                gateway_contract.events.GameCreated,
+                game_contract.events.PlayerJoined,
+                game_contract.events.MoveAppended,
+                game_contract.events.GameCancelled,
+                game_contract.events.GameStatusChanged,
+            )
+        }
+        self.db = sqlite3.connect(path)
+        with self.db:
+            self.db.executescript(SCHEMA)
+            self.db.execute("INSERT OR IGNORE INTO cursor (id, block) VALUES (0, ?)", (start_block - 1,))
+
+    @property
+    def cursor(self) -> int:
+        # The last indexed block
+        return self.db.execute("SELECT block FROM cursor").fetchone()[0]
+
+    def close(self):
+        self.db.close()
+
+    async def sync(self) -> int:
+        """
+        Indexes everything up to the head (minus confirmations), returns the new cursor.
+        """
+        await self._check_reorg()
+        head = await self.w3.eth.block_number - self.confirmations
+        while self.cursor < head:
+            from_block = self.cursor + 1
+            to_block = min(from_block + self.chunk_size - 1, head)
+            try:
+                logs = await self.w3.eth.get_logs({
+                    "fromBlock": from_block,
+                    "toBlock": to_block,
+                    "topics": [["0x" + topic.hex() for topic in self.events]],
+                })
+            except (ValueError, asyncio.TimeoutError):
+                # Too many logs or the range is too wide for the node
+                if self.chunk_size == 1:
+                    raise
+                self.chunk_size //= 2
+                continue
+            tip = await self.w3.eth.get_block(to_block)
+            await self._store(logs, to_block, tip["hash"].hex())
+            if len(logs) < TARGET_LOGS:
+                self.chunk_size = min(2 * self.chunk_size, self.max_chunk_size)
+        return self.cursor
+
+    async def follow(self, poll_interval=1.0):
+        while True:
+            await self.sync()
+            await asyncio.sleep(poll_interval)
+
+    def player_filter(self, player: str, from_block, to_block="latest") -> dict:
+        # eth_getLogs filter of everything `player` has done: the player is the second indexed topic of
+        # GameCreated (initiator), PlayerJoined and MoveAppended
+        topics = [
+            "0x" + topic.hex() for topic, event in self.events.items()
+            if event.event_name in ("GameCreated", "PlayerJoined", "MoveAppended")
+        ]
+        return {"fromBlock": from_block, "toBlock": to_block, "topics": [topics, None, address_topic(player)]}
+
+    async def player_history(self, player: str, from_block, to_block="latest") -> list:
+        # Decoded logs of the player straight from the node, nothing is stored
+        logs = await self.w3.eth.get_logs(self.player_filter(player, from_block, to_block))
+        return [self.events[bytes(log["topics"][0])]().processLog(log) for log in logs]
+
+    async def _store(self, logs, to_block, tip_hash):
+        known = set()
+        rows = {table: [] for table in TABLES}
+        moves = {}
+        blocks = {to_block: tip_hash}
+        for log in logs:
+            event = self.events.get(bytes(log["topics"][0]))
+            if event is None:
+                continue
+            address = log["address"]
+            block = log["blockNumber"]
+            if event.event_name == "GameCreated":
+                if address != self.gateway.address:
+                    # Same event signature, somebody else's contract
+                    continue
+                args = event().processLog(log)["args"]
+                known.add(args["game"])
+                rows["games"].append((args["game"], args["initiator"], block))
+            elif address in known or self._is_known(address):
+                known.add(address)
+                args = event().processLog(log)["args"]
+                match event.event_name:
+                    case "PlayerJoined":
+                        rows["joins"].append((address, args["player"], block))
+                    case "GameCancelled":
+                        rows["cancellations"].append((address, block))
+                    case "GameStatusChanged":
+                        rows["statuses"].append((address, args["status"], block))
+                    case "MoveAppended":
+                        if address not in moves:
+                            moves[address] = self._move_count(address)
+                        rows["moves"].append(
+                            (address, moves[address], args["player"], args["x"], args["y"], args["is_winner"], block)
+                        )
+                        moves[address] += 1
+            else:
+                continue
+            blocks[block] = log["blockHash"].hex()
+
+        settings = await asyncio.gather(
+            *(
+                self.game(address=game).functions.get_settings().call()
+                for game, _, _ in rows["games"]
+            )
+        )
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO games (address, initiator, m, n, k, block) VALUES (?, ?, ?, ?, ?, ?)",
+                [(game, initiator, *shape, block) for (game, initiator, block), shape in zip(rows["games"], settings)],
+            )
+            self.db.executemany("INSERT OR REPLACE INTO joins (game, player, block) VALUES (?, ?, ?)", rows["joins"])
+            self.db.executemany(
+                "INSERT OR REPLACE INTO moves (game, number, player, x, y, is_winner, block) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                rows["moves"],
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO cancellations (game, block) VALUES (?, ?)", rows["cancellations"]
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO statuses (game, status, block) VALUES (?, ?, ?)", rows["statuses"]
+            )
+            self.db.executemany("INSERT OR REPLACE INTO blocks (number, hash) VALUES (?, ?)", blocks.items())
+            self.db.execute("DELETE FROM blocks WHERE number <= ?", (to_block - REORG_DEPTH,))
+            self.db.execute("UPDATE cursor SET block = ?", (to_block,))
+
+    async def _check_reorg(self):
+        stored = self.db.execute("SELECT number, hash FROM blocks ORDER BY number DESC").fetchall()
+        for number, block_hash in stored:
+            block = await self.w3.eth.get_block(number)
+            if block["hash"].hex() == block_hash:
+                if number < self.cursor:
+                    self.rollback(number)
+                return
+        if stored:
+            # Deeper than anything we remember
+            self.rollback(self.start_block - 1)
+
+    def rollback(self, block: int):
+        # Forgets everything after `block`
+        with self.db:
+            for table in TABLES:
+                self.db.execute("DELETE FROM %s WHERE block > ?" % table, (block,))
+            self.db.execute("DELETE FROM blocks WHERE number > ?", (block,))
+            self.db.execute("UPDATE cursor SET block = ?", (block,))
+
+    def _is_known(self, game: str) -> bool:
+        return self.db.execute("SELECT 1 FROM games WHERE address = ?", (game,)).fetchone() is not None
+
+    def _move_count(self, game: str) -> int:
+        return self.db.execute("SELECT COUNT(*) FROM moves WHERE game = ?", (game,)).fetchone()[0]
+
+    def board_of(self, game: str) -> list[tuple[str, int, int]]:
+        # (player, x, y) of every move in order
+        return self.db.execute(
+            "SELECT player, x, y FROM moves WHERE game = ? ORDER BY number", (game,)
+        ).fetchall()
+
+    def status_of(self, game: str) -> GameStatus | None:
+        row = self.db.execute(
+            """
+            SELECT
+                games.m * games.n,
+                EXISTS (SELECT 1 FROM cancellations WHERE game = games.address),
+                (SELECT COUNT(*) FROM joins WHERE game = games.address),
+                (SELECT COUNT(*) FROM moves WHERE game = games.address),
+                EXISTS (SELECT 1 FROM moves WHERE game = games.address AND is_winner),
+                (SELECT status FROM statuses WHERE game = games.address)
+            FROM games WHERE address = ?
+            """,
+            (game,),
+        ).fetchone()
+        if row is None:
+            return None
+        cells, cancelled, joins, moves, won, final = row
+        if final is not None:
+            # The game is over, it says so itself
+            return GameStatus(final)
+        if cancelled:
+            return GameStatus.aborted
+        if won:
+            return GameStatus.completed
+        if moves == cells:
+            return GameStatus.exhausted
+        return (GameStatus.created, GameStatus.waiting, GameStatus.running)[joins]
+
+    def open_games(self) -> list[str]:
+        # Games waiting for the second player, oldest first
+        return [
+            address for address, in self.db.execute(
+                """
+                SELECT games.address FROM games JOIN joins ON joins.game = games.address
+                WHERE NOT EXISTS (SELECT 1 FROM cancellations WHERE game = games.address)
+                GROUP BY games.address HAVING COUNT(*) = 1
+                ORDER BY games.block, games.rowid
+                """
+            )
+        ]
+
+    def games_of(self, player: str) -> list[str]:
+        # Games the player has created or joined, oldest first
+        return [
+            address for address, in self.db.execute(
+                """
+                SELECT address FROM games
+                WHERE initiator = :player OR address IN (SELECT game FROM joins WHERE player = :player)
+                ORDER BY block, rowid
+                """,
+                {"player": player},
+            )
+        ]
@@ -0,0 +1,270 @@
+import bisect
+import contextlib
+import contextvars
+import json
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from hexbytes import HexBytes
+
+# Upper bounds of the histogram buckets, seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BLOCK_LAG_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+# Phases of a transaction in the order they happen, see TxTrace
+PHASES = ("build", "nonce", "sign", "send", "mempool", "receipt")
+
+# What the hooks of a disabled tracer return, so they cost a single attribute check
+DISABLED = contextlib.nullcontext()
+# Transaction being sent by the current task
+CURRENT: contextvars.ContextVar["TxTrace | None"] = contextvars.ContextVar("current_transaction", default=None)
+
+
+class Histogram:
+    # Cumulative buckets of the Prometheus histogram
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def prometheus(self, name: str, labels: str) -> list[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, "+Inf"), self.counts):
+            cumulative += count
+            lines.append('%s_bucket{%s,le="%s"} %s' % (name, labels, bound, cumulative))
+        lines.append("%s_sum{%s} %s" % (name, labels, self.sum))
+        lines.append("%s_count{%s} %s" % (name, labels, self.count))
+        return lines
+
+
+@dataclass
+class TxTrace:
+    """
+    Timeline of a single transaction: build (build_transaction), nonce (local allocation, a node round trip only
+    after a resync), sign, send (eth_sendRawTransaction), mempool (sent till the watcher finds it in a block) and
+    receipt (found till the receipt is there with its confirmations).
+    """
+
+    name: str
+    index: int
+    # (phase, start, end) in seconds of time.perf_counter
+    phases: list[tuple[str, float, float]] = field(default_factory=list)
+    # (method, start, end, ok) of the RPCs made while the transaction was being sent
+    rpcs: list[tuple[str, float, float, bool]] = field(default_factory=list)
+    tx_hash: str | None = None
+    sent_at: float | None = None
+    # Head known to the receipt watcher when the transaction was sent
+    sent_head: int | None = None
+    seen_at: float | None = None
+    gas_used: int | None = None
+    status: int | None = None
+    block_lag: int | None = None
+
+
+class Tracer:
+    """
+    Opt-in instrumentation of the RPCs (see middleware) and of the send helpers: sign_and_send, transact and
+    wait_for_receipt mark the phases of every transaction. Disabled, every hook is a single attribute check.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.started = time.perf_counter()
+        self.rpc_latency: dict[str, Histogram] = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.rpc_errors: dict[str, int] = defaultdict(int)
+        self.phase_latency: dict[str, Histogram] = defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.block_lag = Histogram(BLOCK_LAG_BUCKETS)
+        self.gas_used: dict[str, int] = defaultdict(int)
+        self.transactions: dict[tuple[str, int], int] = defaultdict(int)
+        self.traces: list[TxTrace] = []
+        # Sent, but not mined yet
+        self._pending: dict[HexBytes, TxTrace] = {}
+        self._head: int | None = None
+
+    def enable(self):
+        self.enabled = True
+        self.started = time.perf_counter()
+
+    def reset(self):
+        # Disabled and empty again
+        self.__init__()
+
+    def transaction(self, name: str):
+        # Trace of the transaction sent within, a nested one (transact calls sign_and_send) joins the outer one
+        return self._transaction(name) if self.enabled else DISABLED
+
+    def phase(self, name: str):
+        return self._timed_phase(name) if self.enabled else DISABLED
+
+    @contextlib.contextmanager
+    def _transaction(self, name: str):
+        if CURRENT.get() is not None:
+            yield CURRENT.get()
+            return
+        trace = TxTrace(name, len(self.traces))
+        self.traces.append(trace)
+        token = CURRENT.set(trace)
+        try:
+            yield trace
+        finally:
+            CURRENT.reset(token)
+
+    @contextlib.contextmanager
+    def _timed_phase(self, name: str):
+        trace = CURRENT.get()
+        if trace is None:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._phase(trace, name, started, time.perf_counter())
+
+    def _phase(self, trace: TxTrace, name: str, started: float, ended: float):
+        trace.phases.append((name, started, ended))
+        self.phase_latency[name].observe(ended - started)
+
+    def detach(self):
+        # Whatever the current task does from now on is nobody's transaction, i.e. the receipt watcher's polling
+        CURRENT.set(None)
+
+    def rpc(self, method: str, started: float, ok: bool):
+        ended = time.perf_counter()
+        self.rpc_latency[method].observe(ended - started)
+        if not ok:
+            self.rpc_errors[method] += 1
+        trace = CURRENT.get()
+        if trace is not None:
+            trace.rpcs.append((method, started, ended, ok))
+
+    def head(self, number: int):
+        self._head = number
+
+    def sent(self, tx_hash):
+        trace = CURRENT.get() if self.enabled else None
+        if trace is None:
+            return
+        trace.tx_hash = HexBytes(tx_hash).hex()
+        trace.sent_at = time.perf_counter()
+        trace.sent_head = self._head
+        self._pending[HexBytes(tx_hash)] = trace
+
+    def seen(self, tx_hash):
+        # The watcher has found the transaction in a block
+        trace = self._pending.get(HexBytes(tx_hash)) if self.enabled else None
+        if trace is not None and trace.seen_at is None:
+            trace.seen_at = time.perf_counter()
+
+    def mined(self, tx_hash, receipt):
+        trace = self._pending.pop(HexBytes(tx_hash), None) if self.enabled else None
+        if trace is None:
+            return
+        now = time.perf_counter()
+        seen_at = trace.seen_at or now
+        self._phase(trace, "mempool", trace.sent_at, seen_at)
+        self._phase(trace, "receipt", seen_at, now)
+        trace.gas_used = receipt["gasUsed"]
+        trace.status = receipt["status"]
+        self.gas_used[trace.name] += trace.gas_used
+        self.transactions[trace.name, trace.status] += 1
+        if trace.sent_head is not None:
+            trace.block_lag = receipt["blockNumber"] - trace.sent_head
+            self.block_lag.observe(trace.block_lag)
+
+    def prometheus(self) -> str:
+        lines = [
+            "# HELP rpc_request_duration_seconds Latency of the JSON-RPC requests",
+            "# TYPE rpc_request_duration_seconds histogram",
+        ]
+        for method, histogram in sorted(self.rpc_latency.items()):
+            lines += histogram.prometheus("rpc_request_duration_seconds", 'method="%s"' % method)
+        lines += ["# HELP rpc_errors_total Failed JSON-RPC requests", "# TYPE rpc_errors_total counter"]
+        lines += ['rpc_errors_total{method="%s"} %s' % item for item in sorted(self.rpc_errors.items())]
+        lines += [
+            "# HELP transaction_phase_duration_seconds Time spent in each phase of a transaction",
+            "# TYPE transaction_phase_duration_seconds histogram",
+        ]
+        for phase, histogram in sorted(self.phase_latency.items(), key=lambda item: PHASES.index(item[0])):
+            lines += histogram.prometheus("transaction_phase_duration_seconds", 'phase="%s"' % phase)
+        lines += [
+            "# HELP transaction_block_lag Blocks between the head at sending and the block of the transaction",
+            "# TYPE transaction_block_lag histogram",
+        ]
+        lines += self.block_lag.prometheus("transaction_block_lag", 'chain="default"')
+        lines += ["# HELP transactions_total Mined transactions", "# TYPE transactions_total counter"]
+        lines += [
+            'transactions_total{name="%s",status="%s"} %s' % (name, status, count)
+            for (name, status), count in sorted(self.transactions.items())
+        ]
+        lines += [
+            "# HELP transaction_gas_used_total Gas used by the mined transactions",
+            "# TYPE transaction_gas_used_total counter",
+        ]
+        lines += ['transaction_gas_used_total{name="%s"} %s' % item for item in sorted(self.gas_used.items())]
+        return "\n".join(lines) + "\n"
+
+    def trace_events(self) -> dict:
+        # Chrome trace event format (chrome://tracing, Perfetto, speedscope), a row per transaction
+        def micros(seconds):
+            return round((seconds - self.started) * 1e6)
+
+        events = []
+        for trace in self.traces:
+            args = {
+                "tx_hash": trace.tx_hash, "gas_used": trace.gas_used, "status": trace.status,
+                "block_lag": trace.block_lag,
+            }
+            events.append({
+                "name": "thread_name", "ph": "M", "pid": 1, "tid": trace.index, "args": {"name": trace.name}
+            })
+            for phase, started, ended in trace.phases:
+                events.append({
+                    "name": phase, "cat": "phase", "ph": "X", "pid": 1, "tid": trace.index,
+                    "ts": micros(started), "dur": micros(ended) - micros(started), "args": args,
+                })
+            for method, started, ended, ok in trace.rpcs:
+                events.append({
+                    "name": method, "cat": "rpc", "ph": "X", "pid": 1, "tid": trace.index,
+                    "ts": micros(started), "dur": micros(ended) - micros(started), "args": {"ok": ok},
+                })
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def dump(self, metrics_path=None, trace_path=None):
+        if metrics_path:
+            with open(metrics_path, "w") as f:
+                f.write(self.prometheus())
+        if trace_path:
+            with open(trace_path, "w") as f:
+                json.dump(self.trace_events(), f)
+
+
+async def middleware(make_request, w3):
+    # web3 middleware timing every request of the web3 instance, see instrument
+    async def inner(method, params):
+        started = time.perf_counter()
+        try:
+            response = await make_request(method, params)
+        except Exception:
+            TRACER.rpc(method, started, False)
+            raise
+        TRACER.rpc(method, started, "error" not in response)
+        return response
+    return inner
+
+
+def instrument(w3):
+    # Nothing is added unless the tracer is enabled, an uninstrumented web3 pays nothing at all
+    if TRACER.enabled:
+        w3.middleware_onion.add(middleware, "instrument")
+    return w3
+
+
+TRACER = Tracer()
@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import csv
+import json
+import os
+import random
+import time
+from dataclasses import asdict, dataclass, field, fields
+
+import numpy as np
+from eth_account import Account
+
+from .client import BACKENDS, HTTP, IN_PROCESS, Client, in_process_provider
+from .engine import Engine
+from .fees import STATION, TRANSFER_GAS
+from .instrument import TRACER, instrument
+from .nonces import sign_and_send
+from .receipts import ReceiptWatcher, wait_for_receipt
+from .signing import LoopLag, SigningService
+from .structs import CellOwner, GameStatus
+
+DEFAULT_BID = 10 ** 17
+DEFAULT_BOARD = (5, 5, 3)
+# Prefix of the reports, REPORT_PATH.json for the summary and REPORT_PATH.csv for every transaction
+REPORT_PATH = "./build/loadgen"
+PERCENTILES = (50, 95, 99)
+# Rough upper bound of gasUsed of a single move, only used to fund the players
+MOVE_GAS = 150_000
+# Funding transfers in flight at once, the nodes limit the pending transactions of a single sender
+FUND_BATCH = 64
+
+
+def random_move(engine: Engine, rng: random.Random) -> tuple[int, int]:
+    return divmod(rng.choice(np.flatnonzero(engine.board().ravel() == CellOwner.available).tolist()), engine.n)
+
+
+def greedy_move(engine: Engine, rng: random.Random) -> tuple[int, int]:
+    # Winning move if there is one, a random one otherwise
+    available = [divmod(int(cell), engine.n) for cell in np.flatnonzero(engine.board().ravel() == CellOwner.available)]
+    winning = [cell for cell in available if engine.is_winning(*cell)]
+    return rng.choice(winning or available)
+
+
+def scan_move(engine: Engine, rng: random.Random) -> tuple[int, int]:
+    # First available cell row by row, games go on for long on boards wider than k
+    return divmod(int(np.flatnonzero(engine.board().ravel() == CellOwner.available)[0]), engine.n)
+
+
+POLICIES = {"random": random_move, "greedy": greedy_move, "scan": scan_move}
+
+
+@dataclass
+class LoadConfig:
+    chain_id: int
+    gas_price: int
+    gas_limit: int
+    pairs: int = 10
+    games_per_pair: int = 1
+    # Pair i plays boards[i % len(boards)], its next game the next board and so on
+    boards: list[tuple[int, int, int]] = field(default_factory=lambda: [DEFAULT_BOARD])
+    policy: str = "random"
+    # Mean of the exponentially distributed pause before every move, seconds
+    think_time: float = 0.0
+    bid: int = DEFAULT_BID
+    seed: int | None = None
+
+    def funds(self) -> int:
+        # Wei per player: the bids, the moves of the largest board and the gas reserve of a single transaction
+        moves = max(m * n for m, n, _ in self.boards) // 2 + 2
+        return self.games_per_pair * (self.bid + moves * MOVE_GAS * self.gas_price) + self.gas_limit * self.gas_price
+
+    def transaction(self, account, value=0) -> dict:
+        # Nonce is allocated right before the signing, see sign_and_send
+        return {
+            "from": account.address,
+            "chainId": self.chain_id,
+            "gas": self.gas_limit,
+            "gasPrice": self.gas_price,
+            "value": value,
+        }
+
+
+@dataclass
+class Sample:
+    # create (new_game_and_join), join or move
+    kind: str
+    game: str | None
+    account: str
+    # Seconds since the start of the run
+    started: float
+    # Signing, sending and waiting for the receipt
+    latency: float
+    gas_used: int
+    ok: bool
+    error: str = ""
+
+
+@dataclass
+class LoadReport:
+    config: LoadConfig
+    samples: list[Sample]
+    # (status, gas of create, join and every move) of every finished game
+    games: list[tuple[GameStatus, int]]
+    duration: float
+    # LoopLag.stats and SigningService.stats (None when signed in the loop) over the run
+    loop_lag: dict = field(default_factory=dict)
+    signing: dict | None = None
+    # (m, n, k) -> append_move transactions per block with the fixed gas limit and with the estimated one
+    moves_per_block: dict = field(default_factory=dict)
+
+    def summary(self) -> dict:
+        succeeded = [sample for sample in self.samples if sample.ok]
+        latency = {}
+        for kind in sorted({sample.kind for sample in succeeded}):
+            values = np.array([sample.latency for sample in succeeded if sample.kind == kind])
+            latency[kind] = {
+                **{"p%s" % p: float(value) for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))},
+                "mean": float(values.mean()),
+            }
+        gas = np.array([gas_used for _, gas_used in self.games], dtype=np.int64)
+        return {
+            "config": asdict(self.config),
+            "duration": self.duration,
+            "transactions": len(self.samples),
+            "failed": len(self.samples) - len(succeeded),
+            "failure_rate": (len(self.samples) - len(succeeded)) / len(self.samples) if self.samples else 0.0,
+            "tps": len(succeeded) / self.duration if self.duration else 0.0,
+            "latency": latency,
+            "games": {
+                "started": self.config.pairs * self.config.games_per_pair,
+                "completed": sum(status == GameStatus.completed for status, _ in self.games),
+                "exhausted": sum(status == GameStatus.exhausted for status, _ in self.games),
+            },
+            "gas_per_game": {"mean": float(gas.mean()), "max": int(gas.max())} if gas.size else None,
+            "loop_lag": self.loop_lag,
+            "signing": self.signing,
+            "moves_per_block": {
+                "%sx%s/%s" % shape: {"fixed": fixed, "estimated": estimated}
+                for shape, (fixed, estimated) in self.moves_per_block.items()
+            },
+        }
+
+    def dump(self, path=REPORT_PATH):
+        path = str(path)
+        with open(path + ".json", "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        with open(path + ".csv", "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow([item.name for item in fields(Sample)])
+            writer.writerows(
+                [getattr(sample, item.name) for item in fields(Sample)] for sample in self.samples
+            )
+
+
+class LoadGenerator:
+    """
+    Plays complete games between `config.pairs` pairs of fresh players, all the pairs at once. The deployer funds
+    the players, every pair then creates and joins a game and moves by the policy until the game is over. Each
+    transaction is timed from signing to its receipt, a failed one (reverted, refused or timed out) ends the game
+    of the pair, the pair goes on with its next game.
+
+    The moves are picked on a local Engine, so a valid policy never makes an illegal move and every failure is
+    the chain's or the client's. Transactions are signed by `signer`, the default signer of sign_and_send if None.
+    """
+
+    def __init__(self, client: Client, deployer, config: LoadConfig, signer=None):
+        if config.policy not in POLICIES:
+            raise ValueError("unknown policy %s, one of %s" % (config.policy, ", ".join(POLICIES)))
+        self.client = client
+        self.w3 = client.w3
+        self.deployer = deployer
+        self.config = config
+        self.signer = signer
+        self.gateway = client.gateway()
+        self.samples: list[Sample] = []
+        self.games: list[tuple[GameStatus, int]] = []
+        self.started = 0.0
+
+    async def run(self) -> LoadReport:
+        players = [Account.create() for _ in range(2 * self.config.pairs)]
+        await self._fund(players)
+        self.started = time.perf_counter()
+        async with LoopLag() as loop_lag:
+            await asyncio.gather(
+                *(
+                    self._play_pair(index, players[2 * index], players[2 * index + 1])
+                    for index in range(self.config.pairs)
+                )
+            )
+        return LoadReport(
+            self.config, self.samples, self.games, time.perf_counter() - self.started, loop_lag.stats(),
+            self.signer.stats() if isinstance(self.signer, SigningService) else None,
+            STATION.moves_per_block(),
+        )
+
+    async def _fund(self, players):
+        transaction = {**self.config.transaction(self.deployer, self.config.funds()), "gas": TRANSFER_GAS}
+        for start in range(0, len(players), FUND_BATCH):
+            # Nonces are allocated locally, so the funding transactions of a batch are pipelined
+            tx_hashes = await asyncio.gather(
+                *(
+                    sign_and_send(self.w3, self.deployer, {**transaction, "to": player.address}, self.signer)
+                    for player in players[start:start + FUND_BATCH]
+                )
+            )
+            receipts = await asyncio.gather(*(wait_for_receipt(self.w3, tx_hash) for tx_hash in tx_hashes))
+            assert all(receipt.status for receipt in receipts), "failed to fund the players"
+
+    async def _send(self, kind, game, account, function_call, value=0):
+        # Receipt of the transaction, None if it has failed one way or another
+        started = time.perf_counter()
+        try:
+            with TRACER.transaction(kind):
+                with TRACER.phase("build"):
+                    params = self.config.transaction(account, value)
+                    if STATION.enabled:
+                        params = await STATION.prepare(self.w3, function_call, params)
+                    transaction = await function_call.build_transaction(params)
+                tx_hash = await sign_and_send(self.w3, account, transaction, self.signer)
+                STATION.sent(tx_hash, function_call)
+            receipt = await wait_for_receipt(self.w3, tx_hash)
+        except Exception as error:
+            self.samples.append(Sample(
+                kind, game, account.address, started - self.started, time.perf_counter() - started, 0, False,
+                repr(error)
+            ))
+            return None
+        self.samples.append(Sample(
+            kind, game, account.address, started - self.started, time.perf_counter() - started,
+            receipt.gasUsed, bool(receipt.status), "" if receipt.status else "reverted"
+        ))
+        return receipt if receipt.status else None
+
+    async def _play_pair(self, index, alice, bob):
+        config = self.config
+        rng = random.Random(None if config.seed is None else config.seed + index)
+        policy = POLICIES[config.policy]
+        for number in range(config.games_per_pair):
+            m, n, k = config.boards[(index + number) % len(config.boards)]
+            receipt = await self._send(
+                "create", None, alice, self.gateway.functions.new_game_and_join([m, n, k], []), config.bid
+            )
+            if receipt is None:
+                continue
+            game = self.client.game(self.gateway.events.GameCreated().processReceipt(receipt)[0]["args"]["game"])
+            gas_used = receipt.gasUsed
+            receipt = await self._send("join", game.address, bob, game.functions.join(), config.bid)
+            if receipt is None:
+                continue
+            gas_used += receipt.gasUsed
+            engine = Engine(m, n, k)
+            players = {CellOwner.alice: alice, CellOwner.bob: bob}
+            while engine.status == GameStatus.running:
+                if config.think_time:
+                    await asyncio.sleep(rng.expovariate(1 / config.think_time))
+                x, y = policy(engine, rng)
+                receipt = await self._send("move", game.address, players[engine.turn], game.functions.append_move(x, y))
+                if receipt is None:
+                    break
+                gas_used += receipt.gasUsed
+                engine.play(x, y)
+            if engine.status != GameStatus.running:
+                self.games.append((engine.status, gas_used))
+
+
+def load_env(path: str) -> dict[str, str]:
+    # KEY=VALUE lines of an env file of tests/envs, the comments are skipped
+    env = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                key, _, value = line.partition("=")
+                env[key] = value
+    return env
+
+
+def parse_board(value: str) -> tuple[int, int, int]:
+    m, n, k = map(int, value.split(","))
+    return m, n, k
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Plays complete games between pairs of players, all at once.")
+    parser.add_argument("--env", help="env file to read on top of the environment, i.e. tests/envs/localnet.env")
+    parser.add_argument("--backend", choices=BACKENDS, help="BACKEND of the env by default")
+    parser.add_argument("--pairs", type=int, default=10, help="number of player pairs playing at the same time")
+    parser.add_argument("--games-per-pair", type=int, default=1)
+    parser.add_argument(
+        "--board", type=parse_board, action="append", dest="boards", metavar="M,N,K",
+        help="board of the games, repeat to mix several, %s,%s,%s by default" % DEFAULT_BOARD,
+    )
+    parser.add_argument("--policy", choices=POLICIES, default="random")
+    parser.add_argument("--think-time", type=float, default=0.0, help="mean pause before every move, seconds")
+    parser.add_argument("--bid", type=int, default=DEFAULT_BID, help="wei")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--pool-size", type=int, default=32, help="keep-alive connections to the node")
+    parser.add_argument(
+        "--sign-processes", type=int, default=0, help="sign in a pool of that many processes, 0 signs in the loop"
+    )
+    parser.add_argument(
+        "--fixed-gas", action="store_true", help="send every transaction with GASLIMIT and GASPRICE, no estimates"
+    )
+    parser.add_argument("--output", default=REPORT_PATH, help="the report goes to OUTPUT.json and OUTPUT.csv")
+    parser.add_argument("--metrics", help="write the RPC and transaction metrics there, Prometheus text format")
+    parser.add_argument("--trace-file", help="write the timeline of every transaction there, Chrome trace event JSON")
+    return parser.parse_args(argv)
+
+
+async def run(args, env) -> LoadReport:
+    config = LoadConfig(
+        chain_id=int(env["CHAIN_ID"]),
+        gas_price=int(env["GASPRICE"]),
+        gas_limit=int(env["GASLIMIT"]),
+        pairs=args.pairs,
+        games_per_pair=args.games_per_pair,
+        boards=args.boards or [DEFAULT_BOARD],
+        policy=args.policy,
+        think_time=args.think_time,
+        bid=args.bid,
+        seed=args.seed,
+    )
+    deployer = Account.from_key(env["DEPLOYER_PRIV"])
+    if (args.backend or env.get("BACKEND", HTTP)) == IN_PROCESS:
+        client = Client(
+            provider=in_process_provider(env["DEPLOYER_PRIV"], int(env["DEPLOYER_BALANCE"]), config.gas_limit)
+        )
+    else:
+        # PROVIDER_HOST:PROVIDER_PORT and the extra endpoints of PROVIDER_URIS, as in conftest.py
+        uris = ["%s:%s" % (env["PROVIDER_HOST"], env["PROVIDER_PORT"])]
+        uris += [uri for uri in env.get("PROVIDER_URIS", "").split(",") if uri]
+        client = Client(uris, pool_size=args.pool_size)
+    if args.metrics or args.trace_file:
+        TRACER.enable()
+        instrument(client.w3)
+    async with client:
+        if client.backend == IN_PROCESS:
+            ReceiptWatcher.of(client.w3, poll_latency=0)
+            await client.deploy_gateway(deployer, config.transaction(deployer))
+        if not args.fixed_gas:
+            STATION.enable(config.gas_limit, config.gas_price)
+            STATION.block_gas_limit = (await client.w3.eth.get_block("latest"))["gasLimit"]
+        if not args.sign_processes:
+            return await LoadGenerator(client, deployer, config).run()
+        async with SigningService(args.sign_processes) as signer:
+            return await LoadGenerator(client, deployer, config, signer).run()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    env = {**os.environ, **(load_env(args.env) if args.env else {})}
+    report = asyncio.run(run(args, env))
+    report.dump(args.output)
+    TRACER.dump(args.metrics, args.trace_file)
+    print(json.dumps(report.summary(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
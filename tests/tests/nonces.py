@@ -0,0 +1,127 @@
+import asyncio
+import contextlib
+
+from eth_utils import ValidationError
+from web3 import Web3
+
+from .instrument import TRACER
+from .signing import default_signer
+
+# Node responses, which mean that the local view of the account's nonce has diverged from the chain's one,
+# i.e. some transaction got dropped from the mempool or replaced by another one.
+NONCE_ERRORS = (
+    "nonce too low",
+    "nonce too high",
+    "replacement transaction underpriced",
+    "the tx doesn't have the correct nonce",
+    # eth-tester of the in-process backend
+    "invalid transaction nonce",
+)
+
+
+# The very same signed transaction is in the mempool already, e.g. a resend or a broadcast through another node.
+# The nonce is taken by the transaction itself, signing the payload once again would send it twice.
+KNOWN_ERRORS = (
+    "already known",
+    "known transaction",
+)
+
+# What a rejected transaction raises, eth-tester does not wrap its validation errors into ValueError
+SEND_ERRORS = (ValueError, ValidationError)
+
+
+def is_nonce_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(pattern in message for pattern in NONCE_ERRORS)
+
+
+def is_known_error(error: Exception) -> bool:
+    message = str(error).lower()
+    return any(pattern in message for pattern in KNOWN_ERRORS)
+
+
+class NonceManager:
+    """
+    Hands out nonces for a single account. The chain is asked only once (and after each resync), the rest is
+    a local counter, so any number of transactions may be in flight from the same wallet.
+    """
+
+    def __init__(self, address: str):
+        self.address = address
+        self._next: int | None = None
+        self._lock = asyncio.Lock()
+
+    async def allocate(self, w3) -> int:
+        with TRACER.phase("nonce"):
+            async with self._lock:
+                if self._next is None:
+                    self._next = await w3.eth.get_transaction_count(self.address, "pending")
+                nonce = self._next
+                self._next += 1
+                return nonce
+
+    def release(self, nonce: int):
+        # The transaction never reached the node. If it was the most recent one just step back, otherwise
+        # there is a gap now and only the chain knows how to fill it.
+        if self._next is not None and nonce == self._next - 1:
+            self._next = nonce
+        else:
+            self.reset()
+
+    def reset(self):
+        # Next allocation will re-read the nonce from the chain
+        self._next = None
+
+    @contextlib.asynccontextmanager
+    async def reserve(self, w3):
+        nonce = await self.allocate(w3)
+        try:
+            yield nonce
+        except BaseException:
+            self.release(nonce)
+            raise
+
+
+class NonceRegistry(dict):
+    # address -> NonceManager, managers are created on demand
+    def __missing__(self, address: str) -> NonceManager:
+        manager = self[address] = NonceManager(address)
+        return manager
+
+    def reset(self):
+        for manager in self.values():
+            manager.reset()
+
+
+async def sign_and_send(w3, account, transaction, signer=None):
+    """
+    Sign `transaction` with the next local nonce of `account` and push it to the node. Should the node reject
+    the nonce (dropped or replaced transaction), the account gets resynced with the chain and the transaction
+    is sent once again. Should the node know the transaction already, it is pending and its hash is returned.
+
+    The default signer signs right in the event loop, see signing.set_default_signer for a pool of processes.
+    """
+    signer = signer or default_signer()
+    nonces = NONCES[account.address]
+    with TRACER.transaction("transfer" if not transaction.get("data") else "call"):
+        for attempt in range(2):
+            try:
+                async with nonces.reserve(w3) as nonce:
+                    with TRACER.phase("sign"):
+                        raw_transaction = await signer.sign(account, {**transaction, "nonce": nonce})
+                    with TRACER.phase("send"):
+                        try:
+                            tx_hash = await w3.eth.send_raw_transaction(raw_transaction)
+                        except SEND_ERRORS as error:
+                            if not is_known_error(error):
+                                raise
+                            tx_hash = Web3.keccak(raw_transaction)
+                    TRACER.sent(tx_hash)
+                    return tx_hash
+            except SEND_ERRORS as error:
+                if attempt or not is_nonce_error(error):
+                    raise
+                nonces.reset()
+
+
+NONCES = NonceRegistry()
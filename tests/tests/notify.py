@@ -0,0 +1,303 @@
+import asyncio
+import itertools
+import json
+from collections import defaultdict
+from dataclasses import dataclass
+
+import websockets
+from eth_utils import event_abi_to_log_topic
+from hexbytes import HexBytes
+from web3 import Web3
+from web3.exceptions import BadFunctionCallOutput, TransactionNotFound
+
+from .structs import GameStatus
+
+DEFAULT_POLL_LATENCY = 0.1
+# Pause before reconnecting to the websocket or polling again after an error, seconds
+RETRY_DELAY = 1.0
+# End of the iteration, see Subscription.close
+CLOSED = object()
+FINISHED = frozenset({GameStatus.completed, GameStatus.aborted, GameStatus.exhausted})
+
+
+@dataclass(frozen=True)
+class Notification:
+    # Name of the event, PendingMove for an append_move, which is not mined yet
+    event: str
+    game: str
+    args: dict
+    # None for a pending move
+    block_number: int | None
+    tx_hash: str
+    pending: bool = False
+
+
+class Subscription:
+    """
+    Async iterator of the notifications of some games and players. A player gets every event of the games the
+    player plays, joined before subscribing or after, plus the events of the games given upfront.
+    """
+
+    def __init__(self, hub: "NotificationHub", games, players):
+        self.hub = hub
+        self.games = {Web3.toChecksumAddress(game) for game in games}
+        self.players = {Web3.toChecksumAddress(player) for player in players}
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> Notification:
+        notification = await self.queue.get()
+        if notification is CLOSED:
+            raise StopAsyncIteration
+        return notification
+
+    async def next(self, timeout=None) -> Notification:
+        return await asyncio.wait_for(self.__anext__(), timeout)
+
+    def close(self):
+        self.hub._unsubscribe(self)
+        self.queue.put_nowait(CLOSED)
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class NotificationHub:
+    """
+    Watches any number of games without polling any of them. Over HTTP the hub polls the head once per
+    poll_latency and fetches the logs of the new blocks in a single eth_getLogs, filtered by the event topics
+    only. Given a websocket endpoint it subscribes to those logs (eth_subscribe) instead, on reconnect the
+    blocks missed in between are fetched over HTTP. Either way the cost does not depend on the number of games.
+
+    With pending=True the transactions entering the mempool are fetched as well and the append_move calls to
+    the watched games are delivered right away as PendingMove, before they are mined.
+    """
+
+    def __init__(
+        self,
+        w3,
+        game_contract,
+        ws_uri: str | None = None,
+        start_block: int | None = None,
+        poll_latency=DEFAULT_POLL_LATENCY,
+        pending=False,
+    ):
+        # game_contract is the GameInstance contract factory (see Client.factory), games are bound to it by address
+        self.w3 = w3
+        self.game = game_contract
+        self.ws_uri = ws_uri
+        self.poll_latency = poll_latency
+        self.pending = pending
+        self.events = {
+            event_abi_to_log_topic(event._get_event_abi()): event
+            for event in (
+                game_contract.events.PlayerJoined,
+                game_contract.events.MoveAppended,
+                game_contract.events.GameCancelled,
+                game_contract.events.GameStatusChanged,
+            )
+        }
+        self.topics = [["0x" + topic.hex() for topic in self.events]]
+        # Last block, which logs have been delivered for
+        self.cursor = None if start_block is None else start_block - 1
+        self._by_game: dict[str, set[Subscription]] = defaultdict(set)
+        self._by_player: dict[str, set[Subscription]] = defaultdict(set)
+        # Players of every game seen while players are watched: asked for once, then kept up by PlayerJoined
+        self._players_of: dict[str, set[str]] = {}
+        self._task: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._ids = itertools.count()
+        # Set once the hub is subscribed and caught up with the head, whatever happens from then on is delivered
+        self.ready = asyncio.Event()
+        self.stats = defaultdict(int)
+
+    async def start(self) -> "NotificationHub":
+        if self.cursor is None:
+            self.cursor = await self.w3.eth.block_number
+        self._task = asyncio.create_task(self._follow_ws() if self.ws_uri else self._poll())
+        return self
+
+    async def stop(self):
+        for task in (self._task, *self._tasks):
+            if task is not None:
+                task.cancel()
+        await asyncio.gather(*(task for task in (self._task, *self._tasks) if task), return_exceptions=True)
+        self._task = None
+
+    async def __aenter__(self) -> "NotificationHub":
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    def subscribe(self, games=(), players=()) -> Subscription:
+        subscription = Subscription(self, games, players)
+        for game in subscription.games:
+            self._by_game[game].add(subscription)
+        for player in subscription.players:
+            self._by_player[player].add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription):
+        for key, index in [(game, self._by_game) for game in subscription.games] + [
+            (player, self._by_player) for player in subscription.players
+        ]:
+            index[key].discard(subscription)
+            if not index[key]:
+                del index[key]
+
+    async def _players(self, game: str) -> set[str]:
+        if game not in self._players_of:
+            self.stats["player_requests"] += 1
+            try:
+                players = await self.game(address=game).functions.get_players().call()
+            except (BadFunctionCallOutput, ValueError):
+                # Not a game after all
+                players = ()
+            self._players_of[game] = {player for player in players if int(player, 16)}
+        return self._players_of[game]
+
+    async def _dispatch(self, notification: Notification):
+        self.stats["events"] += 1
+        game = notification.game
+        player = notification.args.get("player")
+        # A player may have joined the game long before subscribing, nobody has to ask for the players otherwise
+        players = await self._players(game) if self._by_player else self._players_of.get(game, set())
+        if notification.event == "PlayerJoined" and game in self._players_of:
+            self._players_of[game].add(player)
+        targets = set(self._by_game.get(game, ()))
+        for watched in players | {player}:
+            targets.update(self._by_player.get(watched, ()))
+        for subscription in targets:
+            subscription.queue.put_nowait(notification)
+        self.stats["notifications"] += len(targets)
+        if notification.event == "GameStatusChanged" and notification.args["status"] in FINISHED:
+            # Nothing is going to happen in the game anymore
+            self._players_of.pop(game, None)
+
+    async def _dispatch_log(self, log):
+        event = self.events.get(bytes(HexBytes(log["topics"][0])))
+        if event is None or log.get("removed"):
+            return
+        args = dict(event().processLog(log)["args"])
+        if args["game"] != log["address"]:
+            # Same signature, but not emitted by a game about itself
+            return
+        await self._dispatch(Notification(
+            event.event_name, log["address"], args, log["blockNumber"], HexBytes(log["transactionHash"]).hex()
+        ))
+
+    async def _catch_up(self):
+        head = await self.w3.eth.block_number
+        if head > self.cursor:
+            self.stats["log_requests"] += 1
+            logs = await self.w3.eth.get_logs({"fromBlock": self.cursor + 1, "toBlock": head, "topics": self.topics})
+            for log in logs:
+                await self._dispatch_log(log)
+            self.cursor = head
+
+    async def _poll(self):
+        pending_filter = None
+        while True:
+            try:
+                if self.pending and pending_filter is None:
+                    pending_filter = (await self.w3.provider.make_request("eth_newPendingTransactionFilter", []))[
+                        "result"
+                    ]
+                self.stats["polls"] += 1
+                await self._catch_up()
+                self.ready.set()
+                if pending_filter is not None:
+                    response = await self.w3.provider.make_request("eth_getFilterChanges", [pending_filter])
+                    for tx_hash in response.get("result") or []:
+                        self._spawn(self._pending_transaction(tx_hash))
+            except (ValueError, OSError, asyncio.TimeoutError):
+                # The node is not reachable for now, the next poll picks up from the cursor
+                pending_filter = None
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+            await asyncio.sleep(self.poll_latency)
+
+    async def _follow_ws(self):
+        while True:
+            try:
+                async with websockets.connect(self.ws_uri, max_size=None) as ws:
+                    subscriptions = {await self._ws_subscribe(ws, ["logs", {"topics": self.topics}]): "logs"}
+                    if self.pending:
+                        subscriptions[await self._ws_subscribe(ws, ["newPendingTransactions"])] = "pending"
+                    # Whatever happened while not connected, anything later comes over the websocket
+                    await self._catch_up()
+                    caught_up = self.cursor
+                    self.ready.set()
+                    async for message in ws:
+                        params = json.loads(message).get("params") or {}
+                        kind = subscriptions.get(params.get("subscription"))
+                        if kind == "logs":
+                            log = format_log(params["result"])
+                            if log["blockNumber"] > caught_up:
+                                await self._dispatch_log(log)
+                                self.cursor = max(self.cursor, log["blockNumber"])
+                        elif kind == "pending":
+                            self._spawn(self._pending_transaction(params["result"]))
+            except (websockets.ConnectionClosed, ValueError, OSError, asyncio.TimeoutError):
+                self.stats["reconnects"] += 1
+                await asyncio.sleep(RETRY_DELAY)
+
+    async def _ws_subscribe(self, ws, params) -> str:
+        request_id = next(self._ids)
+        await ws.send(json.dumps({"jsonrpc": "2.0", "id": request_id, "method": "eth_subscribe", "params": params}))
+        while True:
+            response = json.loads(await ws.recv())
+            if response.get("id") == request_id:
+                if "error" in response:
+                    raise ValueError(response["error"])
+                return response["result"]
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _pending_transaction(self, tx_hash):
+        if not self._by_game and not self._by_player:
+            return
+        try:
+            transaction = await self.w3.eth.get_transaction(tx_hash)
+        except TransactionNotFound:
+            # Mined or dropped in the meantime
+            return
+        game, player = transaction["to"], transaction["from"]
+        try:
+            function, params = self.game.decode_function_input(transaction["input"])
+        except ValueError:
+            return
+        if function.fn_name != "append_move":
+            return
+        if game not in self._by_game and player not in self._by_player and not (
+            self._by_player and await self._players(game) & self._by_player.keys()
+        ):
+            return
+        self.stats["pending_moves"] += 1
+        await self._dispatch(Notification(
+            "PendingMove", game, {"game": game, "player": player, **params}, None, HexBytes(tx_hash).hex(),
+            pending=True,
+        ))
+
+
+def format_log(log: dict) -> dict:
+    # Log of an eth_subscribe notification, hex as it is on the wire, the way eth_getLogs of web3 returns it
+    return {
+        **log,
+        "address": Web3.toChecksumAddress(log["address"]),
+        "topics": [HexBytes(topic) for topic in log["topics"]],
+        "blockNumber": int(log["blockNumber"], 16),
+        "blockHash": HexBytes(log["blockHash"]),
+        "transactionHash": HexBytes(log["transactionHash"]),
+        "transactionIndex": int(log["transactionIndex"], 16),
+        "logIndex": int(log["logIndex"], 16),
+    }
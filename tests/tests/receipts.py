@@ -0,0 +1,184 @@
+import asyncio
+import weakref
+from collections import OrderedDict
+
+from hexbytes import HexBytes
+from web3.exceptions import TimeExhausted, TransactionNotFound
+
+from .fees import STATION
+from .instrument import TRACER
+
+DEFAULT_CONFIRMATIONS = 1
+DEFAULT_POLL_LATENCY = 0.1
+DEFAULT_TIMEOUT = 120
+# How many blocks behind the head are scanned, when the watcher wakes up after being idle
+DEFAULT_BACKFILL = 16
+# Pause before polling again after an error, seconds
+RETRY_DELAY = 1.0
+# How many already scanned transaction hashes are remembered, see ReceiptWatcher.wait
+RECENT_HASHES_LIMIT = 4096
+
+
+class ReceiptWatcher:
+    """
+    Shared receipt waiter. Instead of polling the node per pending transaction, the watcher follows new block
+    heads once, picks the awaited hashes out of each block and resolves all of them together. Hence the RPC
+    load stays flat no matter how many transactions are in flight.
+
+    The watcher runs only while somebody is waiting, so there are no dangling tasks between the tests. A hash,
+    which is not in the blocks scanned so far, is asked for once with eth_getTransactionReceipt, it may have been
+    mined while the watcher was idle or in the blocks skipped, when it caught up with the head.
+    """
+
+    _instances: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+    def __init__(
+        self,
+        w3,
+        confirmations=DEFAULT_CONFIRMATIONS,
+        poll_latency=DEFAULT_POLL_LATENCY,
+        timeout=DEFAULT_TIMEOUT,
+        backfill=DEFAULT_BACKFILL,
+    ):
+        # Watcher is cached per web3 instance, hence the weak reference
+        self._w3 = weakref.ref(w3)
+        self.confirmations = confirmations
+        self.poll_latency = poll_latency
+        self.timeout = timeout
+        self.backfill = backfill
+        self._waiters: dict[HexBytes, list[asyncio.Future]] = {}
+        # Receipts, which are already on chain, but still lack confirmations
+        self._mined: dict[HexBytes, dict] = {}
+        # Hashes, which were mined in the blocks scanned before somebody started to wait for them
+        self._backlog: set[HexBytes] = set()
+        # Hashes, which may have been mined in blocks, which have never been scanned
+        self._unchecked: set[HexBytes] = set()
+        self._recent: OrderedDict[HexBytes, int] = OrderedDict()
+        # Number of the next block to scan
+        self._cursor: int | None = None
+        self._task: asyncio.Task | None = None
+        # Last error of the node, reported to whoever times out while it lasts
+        self._error: Exception | None = None
+
+    @classmethod
+    def of(cls, w3, **kwargs) -> "ReceiptWatcher":
+        if w3 not in cls._instances:
+            cls._instances[w3] = cls(w3, **kwargs)
+        return cls._instances[w3]
+
+    @property
+    def w3(self):
+        return self._w3()
+
+    def reset(self):
+        # Forget everything learned about the chain, i.e. after the chain has been reverted
+        self._cursor = None
+        self._recent.clear()
+        self._mined.clear()
+
+    async def wait(self, tx_hash, timeout=None):
+        tx_hash = HexBytes(tx_hash)
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(tx_hash, []).append(future)
+        if tx_hash in self._recent:
+            # The transaction got mined before we've been asked to wait for it
+            self._backlog.add(tx_hash)
+        else:
+            self._unchecked.add(tx_hash)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._follow())
+        try:
+            return await asyncio.wait_for(future, self.timeout if timeout is None else timeout)
+        except asyncio.TimeoutError:
+            raise TimeExhausted(
+                "Transaction %r is not in the chain after %s seconds" % (tx_hash, timeout or self.timeout)
+            ) from self._error
+        finally:
+            self._forget(tx_hash, future)
+
+    def _forget(self, tx_hash, future):
+        futures = self._waiters.get(tx_hash, [])
+        if future in futures:
+            futures.remove(future)
+        if not futures:
+            self._waiters.pop(tx_hash, None)
+            self._mined.pop(tx_hash, None)
+            self._backlog.discard(tx_hash)
+            self._unchecked.discard(tx_hash)
+
+    def _remember(self, tx_hash, block_number):
+        self._recent[tx_hash] = block_number
+        while len(self._recent) > RECENT_HASHES_LIMIT:
+            self._recent.popitem(last=False)
+
+    async def _receipt(self, tx_hash):
+        try:
+            return await self.w3.eth.get_transaction_receipt(tx_hash)
+        except TransactionNotFound:
+            return None
+
+    async def _fetch_receipts(self, hashes):
+        receipts = await asyncio.gather(*(self._receipt(item) for item in hashes))
+        for tx_hash, receipt in zip(hashes, receipts):
+            if receipt is not None:
+                self._mined[tx_hash] = receipt
+
+    async def _scan(self, head):
+        if self._cursor is None or self._cursor < head - self.backfill:
+            if self._cursor is not None:
+                # Blocks are skipped, whatever is still awaited might be in there
+                self._unchecked.update(self._waiters.keys() - self._mined.keys())
+            self._cursor = max(0, head - self.backfill)
+        awaited = []
+        for number in range(self._cursor, head + 1):
+            block = await self.w3.eth.get_block(number)
+            for tx_hash in map(HexBytes, block["transactions"]):
+                self._remember(tx_hash, number)
+                TRACER.seen(tx_hash)
+                if tx_hash in self._waiters:
+                    awaited.append(tx_hash)
+        # New waiters may come while the receipts are fetched, they are left for the next scan
+        backlog, unchecked = set(self._backlog), set(self._unchecked)
+        awaited.extend(backlog - self._mined.keys())
+        # Whatever is mined from now on is in the blocks scanned next
+        awaited.extend(unchecked - self._mined.keys() - set(awaited))
+        await self._fetch_receipts(awaited)
+        self._cursor = head + 1
+        self._backlog -= backlog
+        self._unchecked -= unchecked
+
+    def _resolve(self, head):
+        for tx_hash, receipt in list(self._mined.items()):
+            if receipt["blockNumber"] + self.confirmations - 1 > head:
+                continue
+            for future in self._waiters.pop(tx_hash, []):
+                if not future.done():
+                    future.set_result(receipt)
+            del self._mined[tx_hash]
+
+    async def _follow(self):
+        # The task has inherited the context of the first waiter, its polling is not that transaction's though
+        TRACER.detach()
+        while self._waiters:
+            try:
+                head = await self.w3.eth.block_number
+                TRACER.head(head)
+                if self._cursor is None or head >= self._cursor or self._backlog or self._unchecked:
+                    await self._scan(head)
+                self._resolve(head)
+                self._error = None
+            except Exception as error:
+                # Node is not reachable for now, the next poll picks up from the cursor, the waiters time out
+                # with the error, should it last
+                self._error = error
+                await asyncio.sleep(max(self.poll_latency, RETRY_DELAY))
+                continue
+            if self._waiters:
+                await asyncio.sleep(self.poll_latency)
+
+
+async def wait_for_receipt(w3, tx_hash, timeout=None):
+    receipt = await ReceiptWatcher.of(w3).wait(tx_hash, timeout)
+    TRACER.mined(tx_hash, receipt)
+    STATION.mined(tx_hash, receipt)
+    return receipt
@@ -0,0 +1,199 @@
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+from eth_utils import keccak
+
+from .structs import CellOwner, GameStatus
+
+MOVE_APPENDED_TOPIC = "0x" + keccak(text="MoveAppended(address,address,uint8,uint8,bool)").hex()
+TURN_CHALLENGED_TOPIC = "0x" + keccak(text="TurnChallenged(address,address)").hex()
+# Upper bound of the padded boards of a single batch, larger groups of games are split
+BATCH_BYTES = 64 * 2 ** 20
+
+
+@dataclass
+class RecordedGame:
+    """
+    A game as the chain tells it: the MoveAppended logs in order and the final status. Gouged cells are optional,
+    the win rule does not depend on them (a gouged cell is never a player's cell), they only matter for the
+    legality of the recorded moves.
+    """
+
+    address: str
+    m: int
+    n: int
+    k: int
+    # (x, y, is_winner) of every MoveAppended
+    moves: list[tuple[int, int, bool]]
+    status: GameStatus
+    gouged: list[tuple[int, int]] = field(default_factory=list)
+    # Completed by claim_timeout, that is without a winning move
+    challenged: bool = False
+
+    @classmethod
+    def from_logs(cls, address, settings, move_logs, status, gouged=(), challenged=False):
+        m, n, k = settings
+        return cls(
+            address, m, n, k,
+            [(log["args"]["x"], log["args"]["y"], log["args"]["is_winner"]) for log in move_logs],
+            GameStatus(status), list(gouged), challenged
+        )
+
+
+@dataclass(frozen=True)
+class Mismatch:
+    address: str
+    # None for the final status
+    move: int | None
+    reason: str
+
+
+async def fetch_recorded_game(w3, game_contract) -> RecordedGame:
+    status, _, _, _, _, settings, _, block_game_deployed, _ = await game_contract.functions.get_state().call()
+    logs = await w3.eth.get_logs({
+        "address": game_contract.address,
+        "fromBlock": block_game_deployed,
+        "topics": [[MOVE_APPENDED_TOPIC, TURN_CHALLENGED_TOPIC]],
+    })
+    move_logs = [
+        game_contract.events.MoveAppended().processLog(log) for log in logs
+        if log["topics"][0].hex() == MOVE_APPENDED_TOPIC
+    ]
+    return RecordedGame.from_logs(
+        game_contract.address, settings, move_logs, status,
+        challenged=len(move_logs) < len(logs)
+    )
+
+
+def run_deltas(n: int, k: int, padding: int) -> np.ndarray:
+    # (8, k - 1) flat offsets of the cells walked from a move: both ways of the vertical, horizontal, main and
+    # secondary diagonal lines, the same four directions as the check_* functions of the contract
+    width = n + 2 * padding
+    steps = np.arange(1, k, dtype=np.int64)
+    directions = np.array([1, width, width + 1, width - 1], dtype=np.int64)
+    return (np.stack([directions, -directions], axis=1).reshape(-1, 1) * steps).astype(np.int64)
+
+
+def replay(games: list[RecordedGame]) -> list[Mismatch]:
+    """
+    Replays games of the very same (m, n, k) side by side, one move number at a time. The board of every game is
+    padded with k - 1 gouged cells on each side, so the k - 1 cells around a move are always a valid gather. A line
+    run is the cumulative product of "cell belongs to the player" along each of the 8 half-lines, hence capped at
+    k - 1 per side exactly as in Game.sol, and the move wins if 1 + both halves == k for one of the directions.
+    """
+    if not games:
+        return []
+    m, n, k = games[0].m, games[0].n, games[0].k
+    assert all((game.m, game.n, game.k) == (m, n, k) for game in games), "games of a different shape"
+    padding = k - 1
+    width = n + 2 * padding
+    cells = (m + 2 * padding) * width
+    count = len(games)
+    length = max(len(game.moves) for game in games)
+
+    boards = np.full((count, m + 2 * padding, width), CellOwner.gouged, dtype=np.int8)
+    boards[:, padding:padding + m, padding:padding + n] = CellOwner.available
+    for row, game in enumerate(games):
+        for x, y in game.gouged:
+            # The contract ignores gouged cells outside the board
+            if x < m and y < n:
+                boards[row, padding + x, padding + y] = CellOwner.gouged
+    boards = boards.reshape(count, cells)
+
+    xs = np.zeros((count, length), dtype=np.int64)
+    ys = np.zeros((count, length), dtype=np.int64)
+    flags = np.zeros((count, length), dtype=bool)
+    lengths = np.array([len(game.moves) for game in games], dtype=np.int64)
+    for row, game in enumerate(games):
+        if game.moves:
+            xs[row, :len(game.moves)], ys[row, :len(game.moves)], flags[row, :len(game.moves)] = zip(*game.moves)
+
+    deltas = run_deltas(n, k, padding)
+    # Number of the winning move (-1 if none) and the first broken move (-1 if none) of every game
+    won_at = np.full(count, -1, dtype=np.int64)
+    broken_at = np.full(count, -1, dtype=np.int64)
+    mismatches = []
+
+    for step in range(length):
+        active = np.flatnonzero((step < lengths) & (won_at < 0) & (broken_at < 0))
+        # A move recorded after the winning one
+        late = np.flatnonzero((step < lengths) & (won_at >= 0) & (broken_at < 0))
+        for row in late:
+            mismatches.append(Mismatch(games[row].address, step, "move after the end of the game"))
+        broken_at[late] = step
+        if active.size == 0:
+            continue
+        # Alice makes every even move
+        player = CellOwner.alice if step % 2 == 0 else CellOwner.bob
+        x, y = xs[active, step], ys[active, step]
+        inside = (x < m) & (y < n)
+        index = np.where(inside, (x + padding) * width + y + padding, 0)
+        legal = inside & (boards[active, index] == CellOwner.available)
+        for row in active[~legal]:
+            mismatches.append(Mismatch(
+                games[row].address, step, "illegal move (%s, %s)" % (xs[row, step], ys[row, step])
+            ))
+        broken_at[active[~legal]] = step
+        active, index = active[legal], index[legal]
+
+        if k > 1:
+            around = boards[active[:, None, None], index[:, None, None] + deltas[None, :, :]] == player
+            runs = np.cumprod(around, axis=2).sum(axis=2)
+            is_winner = (1 + runs[:, 0::2] + runs[:, 1::2] == k).any(axis=1)
+        else:
+            is_winner = np.ones(active.size, dtype=bool)
+        boards[active, index] = player
+
+        wrong = is_winner != flags[active, step]
+        for row, expected in zip(active[wrong], is_winner[wrong]):
+            mismatches.append(Mismatch(
+                games[row].address, step, "is_winner is %s, expected %s" % (not expected, bool(expected))
+            ))
+        won_at[active[is_winner]] = step
+
+    for row, game in enumerate(games):
+        if broken_at[row] >= 0:
+            continue
+        if won_at[row] >= 0 or (game.challenged and game.status == GameStatus.completed):
+            expected = GameStatus.completed
+        elif lengths[row] == m * n:
+            expected = GameStatus.exhausted
+        elif lengths[row] == 0 and game.status in (GameStatus.created, GameStatus.waiting, GameStatus.aborted):
+            # Nothing to replay, cancelled or not started yet
+            expected = game.status
+        else:
+            expected = GameStatus.running
+        if game.status != expected:
+            mismatches.append(Mismatch(
+                game.address, None, "status is %s, expected %s" % (game.status.name, expected.name)
+            ))
+    return mismatches
+
+
+def batches(games: list[RecordedGame], batch_bytes=BATCH_BYTES, parts=1):
+    # Same shape games together, as many as fit into batch_bytes of padded boards, every group in at least `parts`
+    groups = defaultdict(list)
+    for game in games:
+        groups[game.m, game.n, game.k].append(game)
+    for (m, n, k), group in groups.items():
+        size = max(1, min(batch_bytes // ((m + 2 * k - 2) * (n + 2 * k - 2)), -(-len(group) // parts)))
+        for start in range(0, len(group), size):
+            yield group[start:start + size]
+
+
+def verify(games: list[RecordedGame], processes: int | None = 1, batch_bytes=BATCH_BYTES) -> list[Mismatch]:
+    """
+    Checks the recorded games against the rules, returns the disagreements. `processes=None` uses every core.
+    """
+    if processes == 1:
+        return [mismatch for batch in batches(games, batch_bytes) for mismatch in replay(batch)]
+    processes = processes or os.cpu_count()
+    with ProcessPoolExecutor(processes) as executor:
+        return [
+            mismatch
+            for result in executor.map(replay, batches(games, batch_bytes, processes))
+            for mismatch in result
+        ]
@@ -0,0 +1,239 @@
+import asyncio
+import time
+from collections import deque
+
+import aiohttp
+import numpy as np
+from web3.providers.async_base import AsyncJSONBaseProvider
+
+# Read-only calls, which are sent to a second endpoint, should the first one be slower than usual
+HEDGED_METHODS = frozenset({"eth_call", "eth_getTransactionReceipt"})
+# Sent to several endpoints at once, the first one to accept it answers
+BROADCAST_METHODS = frozenset({"eth_sendRawTransaction"})
+DEFAULT_TIMEOUT = 10
+# Seconds an endpoint is left alone after a failure, unless it says otherwise with Retry-After
+DEFAULT_COOLDOWN = 5.0
+# Hedging delay of an endpoint with too few latency samples for a p95
+INITIAL_HEDGE_DELAY = 0.5
+MIN_HEDGE_DELAY = 0.02
+MIN_SAMPLES = 20
+LATENCY_SAMPLES = 256
+# HTTP statuses and JSON-RPC error codes of an overloaded or broken node, rather than of a bad request
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+RATE_LIMIT_CODES = frozenset({429, -32005})
+
+
+class EndpointError(IOError):
+    pass
+
+
+class Endpoint:
+    def __init__(self, uri: str):
+        self.uri = uri
+        self.latencies: deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self.requests = 0
+        self.errors = 0
+        self.down_until = 0.0
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.requests if self.requests else 0.0
+
+    def latency(self) -> float:
+        # Median of the recent requests, an endpoint never asked comes first, so it gets measured
+        return float(np.median(self.latencies)) if self.latencies else 0.0
+
+    def p95(self) -> float | None:
+        return float(np.percentile(self.latencies, 95)) if len(self.latencies) >= MIN_SAMPLES else None
+
+    def succeeded(self, latency: float):
+        self.requests += 1
+        self.latencies.append(latency)
+
+    def failed(self, cooldown: float):
+        self.requests += 1
+        self.errors += 1
+        self.down_until = time.monotonic() + cooldown
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": self.error_rate,
+            "latency": self.latency(),
+            "p95": self.p95(),
+            "healthy": self.healthy,
+        }
+
+
+class PooledProvider(AsyncJSONBaseProvider):
+    """
+    JSON-RPC over several endpoints of the same chain. Every endpoint keeps the latencies of its recent requests
+    and its error count, an endpoint, which fails (connection error, timeout, HTTP 429/5xx or a rate limit error)
+    is left alone for a cooldown.
+
+    - Reads go to the healthy endpoint with the lowest median latency and fail over down the ranking.
+    - eth_call and eth_getTransactionReceipt are hedged: if the first endpoint has not answered within its p95,
+      the very same request goes to the next endpoint as well, the first answer wins.
+    - eth_sendRawTransaction goes to `broadcast` best endpoints at once (all of them by default), the first one
+      to accept the transaction answers, the others still get it.
+
+    A JSON-RPC error, which is not a rate limit, is the node's answer and is returned as is.
+    """
+
+    def __init__(
+        self,
+        uris: list[str],
+        timeout=DEFAULT_TIMEOUT,
+        cooldown=DEFAULT_COOLDOWN,
+        broadcast: int | None = None,
+        hedge_delay: float | None = None,
+    ):
+        super().__init__()
+        if not uris:
+            raise ValueError("no endpoints")
+        self.endpoints = [Endpoint(uri) for uri in uris]
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self.broadcast = broadcast
+        # Fixed hedging delay, the p95 of each endpoint if None
+        self.hedge_delay = hedge_delay
+        self.hedges = 0
+        # Session of the Client, if any, see Client.open
+        self.session: aiohttp.ClientSession | None = None
+        self._own_session = False
+        self._background: set[asyncio.Task] = set()
+
+    async def close(self):
+        if self._own_session and self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    def ranked(self) -> list[Endpoint]:
+        healthy = [endpoint for endpoint in self.endpoints if endpoint.healthy]
+        if not healthy:
+            # Everybody is down, the one to recover first is the best bet
+            return sorted(self.endpoints, key=lambda endpoint: endpoint.down_until)
+        return sorted(healthy, key=lambda endpoint: (endpoint.latency(), endpoint.error_rate))
+
+    def stats(self) -> dict:
+        return {"hedges": self.hedges, "endpoints": {endpoint.uri: endpoint.stats() for endpoint in self.endpoints}}
+
+    async def make_request(self, method, params):
+        body = self.encode_rpc_request(method, params)
+        if method in BROADCAST_METHODS:
+            return await self._broadcast(body)
+        if method in HEDGED_METHODS:
+            return await self._hedged(body)
+        return await self._failover(body, self.ranked())
+
+    async def _post(self, endpoint: Endpoint, body: bytes) -> dict:
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+            self._own_session = True
+        started = time.monotonic()
+        try:
+            async with self.session.post(
+                endpoint.uri,
+                data=body,
+                headers={"Content-Type": "application/json"},
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+            ) as response:
+                if response.status in RETRY_STATUSES:
+                    endpoint.failed(retry_after(response.headers.get("Retry-After"), self.cooldown))
+                    raise EndpointError("%s: HTTP %s" % (endpoint.uri, response.status))
+                response.raise_for_status()
+                raw = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+            endpoint.failed(self.cooldown)
+            raise EndpointError("%s: %r" % (endpoint.uri, error)) from error
+        decoded = self.decode_rpc_response(raw)
+        if isinstance(decoded.get("error"), dict) and decoded["error"].get("code") in RATE_LIMIT_CODES:
+            endpoint.failed(self.cooldown)
+            raise EndpointError("%s: %s" % (endpoint.uri, decoded["error"].get("message")))
+        endpoint.succeeded(time.monotonic() - started)
+        return decoded
+
+    async def _failover(self, body: bytes, endpoints: list[Endpoint]) -> dict:
+        errors = []
+        for endpoint in endpoints:
+            try:
+                return await self._post(endpoint, body)
+            except EndpointError as error:
+                errors.append(str(error))
+        raise EndpointError("all endpoints have failed: %s" % "; ".join(errors))
+
+    def _hedging_delay(self, endpoint: Endpoint) -> float:
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        p95 = endpoint.p95()
+        return INITIAL_HEDGE_DELAY if p95 is None else max(MIN_HEDGE_DELAY, p95)
+
+    async def _hedged(self, body: bytes) -> dict:
+        first, *rest = self.ranked()
+        if not rest:
+            return await self._failover(body, [first])
+        started = time.monotonic()
+        primary = asyncio.create_task(self._post(first, body))
+        done, _ = await asyncio.wait({primary}, timeout=self._hedging_delay(first))
+        if done:
+            if primary.exception() is None:
+                return primary.result()
+            return await self._failover(body, rest)
+        self.hedges += 1
+        pending = {primary, asyncio.create_task(self._failover(body, rest))}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if primary in pending:
+                        # Lost to the hedge, it has taken at least that long
+                        first.latencies.append(time.monotonic() - started)
+                    for other in pending:
+                        other.cancel()
+                    return task.result()
+                error = task.exception()
+        raise error
+
+    async def _broadcast(self, body: bytes) -> dict:
+        endpoints = self.ranked()[:self.broadcast]
+        pending = {asyncio.create_task(self._post(endpoint, body)) for endpoint in endpoints}
+        responses = []
+        errors = []
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is not None:
+                    errors.append(str(task.exception()))
+                elif "result" in task.result():
+                    # Accepted, the rest of the endpoints get the transaction in the background
+                    for other in pending:
+                        self._background.add(other)
+                        other.add_done_callback(self._background.discard)
+                        other.add_done_callback(consume_exception)
+                    return task.result()
+                else:
+                    responses.append(task.result())
+        if responses:
+            # Nobody has accepted it, i.e. the nonce is too low, that is the node's answer
+            return responses[0]
+        raise EndpointError("all endpoints have failed: %s" % "; ".join(errors))
+
+
+def retry_after(value: str | None, default: float) -> float:
+    # Only the delay in seconds form of the header, a date falls back to the default
+    try:
+        return float(value) if value is not None else default
+    except ValueError:
+        return default
+
+
+def consume_exception(task: asyncio.Task):
+    # Failures of a background broadcast are of no interest, the transaction is already in
+    if not task.cancelled():
+        task.exception()
@@ -0,0 +1,196 @@
+import asyncio
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from eth_account import Account
+from hexbytes import HexBytes
+
+# Upper bound of the signatures sent to a worker at once
+DEFAULT_BATCH_SIZE = 256
+# How often the loop lag is sampled, seconds
+DEFAULT_LAG_INTERVAL = 0.01
+LAG_SAMPLES = 10_000
+
+
+def sign_batch(items: list[tuple[bytes, dict]]) -> list[tuple[bytes | None, str]]:
+    # Runs in a worker process: (raw transaction, "") or (None, error) for every (private key, transaction)
+    results = []
+    for key, transaction in items:
+        try:
+            results.append((bytes(Account.sign_transaction(transaction, key).rawTransaction), ""))
+        except Exception as error:
+            results.append((None, repr(error)))
+    return results
+
+
+class LocalSigner:
+    # Signs right in the event loop, which is blocked for the time of the signing
+    async def sign(self, account, transaction) -> HexBytes:
+        return account.sign_transaction(transaction).rawTransaction
+
+
+class SigningService:
+    """
+    Signs transactions in a pool of processes, so that secp256k1 and RLP do not hold the event loop up. Every
+    signature asked for during a single iteration of the loop goes into the same flush, the flush is split into
+    a batch per process (at most batch_size each), so the signatures of many wallets are made on all the cores
+    at once and each batch costs a single round trip to its worker.
+
+    Drop-in for LocalSigner, see set_default_signer and sign_and_send.
+    """
+
+    def __init__(self, processes: int | None = None, batch_size=DEFAULT_BATCH_SIZE):
+        self.processes = processes or os.cpu_count()
+        self.batch_size = batch_size
+        self._executor: ProcessPoolExecutor | None = None
+        self._pending: list[tuple[bytes, dict, asyncio.Future]] = []
+        self._flush_scheduled = False
+        self._tasks: set[asyncio.Task] = set()
+        self.signatures = 0
+        self.batches = 0
+        # Seconds with at least a single batch in flight
+        self.busy = 0.0
+        self._in_flight = 0
+        self._busy_since = 0.0
+
+    def open(self) -> "SigningService":
+        self._executor = ProcessPoolExecutor(self.processes)
+        return self
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def __aenter__(self) -> "SigningService":
+        return self.open()
+
+    async def __aexit__(self, *exc_info):
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.close()
+
+    async def sign(self, account, transaction) -> HexBytes:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((bytes(account.key), transaction, future))
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self._flush)
+        return await future
+
+    async def sign_many(self, items: list[tuple]) -> list[HexBytes]:
+        # (account, transaction) pairs of any number of wallets, signed in parallel
+        return await asyncio.gather(*(self.sign(account, transaction) for account, transaction in items))
+
+    def _flush(self):
+        self._flush_scheduled = False
+        pending, self._pending = self._pending, []
+        if not pending:
+            return
+        size = min(self.batch_size, -(-len(pending) // self.processes))
+        for start in range(0, len(pending), size):
+            task = asyncio.create_task(self._run(pending[start:start + size]))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        if self._in_flight == 0:
+            self._busy_since = time.perf_counter()
+        self._in_flight += 1
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self._executor, sign_batch, [(key, transaction) for key, transaction, _ in batch]
+            )
+        except Exception as error:
+            # The pool itself is broken
+            results = [(None, repr(error))] * len(batch)
+        finally:
+            self._in_flight -= 1
+            if self._in_flight == 0:
+                self.busy += time.perf_counter() - self._busy_since
+        self.batches += 1
+        for (_, _, future), (raw, error) in zip(batch, results):
+            if future.done():
+                continue
+            if raw is None:
+                future.set_exception(ValueError("failed to sign the transaction: %s" % error))
+            else:
+                self.signatures += 1
+                future.set_result(HexBytes(raw))
+
+    def stats(self) -> dict:
+        return {
+            "processes": self.processes,
+            "signatures": self.signatures,
+            "batches": self.batches,
+            "busy": self.busy,
+            "signatures_per_second": self.signatures / self.busy if self.busy else 0.0,
+        }
+
+
+class LoopLag:
+    """
+    Samples how late the event loop wakes up a coroutine sleeping for `interval`, that is how long the loop
+    has been busy with something else: signing, decoding, whatever blocks it.
+    """
+
+    def __init__(self, interval=DEFAULT_LAG_INTERVAL):
+        self.interval = interval
+        self.samples: deque[float] = deque(maxlen=LAG_SAMPLES)
+        self._task: asyncio.Task | None = None
+        self._sleeping_since = 0.0
+
+    def start(self) -> "LoopLag":
+        self._sleeping_since = asyncio.get_running_loop().time()
+        self._task = asyncio.create_task(self._follow())
+        return self
+
+    async def stop(self):
+        if self._task is not None:
+            # The loop may have been blocked all along, so the sleep in progress counts as well
+            late = asyncio.get_running_loop().time() - self._sleeping_since - self.interval
+            if late > 0:
+                self.samples.append(late)
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def __aenter__(self) -> "LoopLag":
+        return self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.stop()
+
+    async def _follow(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._sleeping_since = loop.time()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, loop.time() - self._sleeping_since - self.interval))
+
+    def stats(self) -> dict:
+        if not self.samples:
+            return {"samples": 0}
+        lags = np.array(self.samples)
+        return {
+            "samples": len(lags),
+            "mean": float(lags.mean()),
+            "p99": float(np.percentile(lags, 99)),
+            "max": float(lags.max()),
+        }
+
+
+_default_signer = LocalSigner()
+
+
+def default_signer():
+    return _default_signer
+
+
+def set_default_signer(signer):
+    # Signer of every sign_and_send, which is not given one explicitly. Returns the previous one
+    global _default_signer
+    previous, _default_signer = _default_signer, signer
+    return previous
@@ -0,0 +1,136 @@
+import asyncio
+import itertools
+from dataclasses import dataclass
+
+import aiohttp
+import eth_abi
+import numpy as np
+from eth_utils import function_signature_to_4byte_selector, to_checksum_address
+
+from .structs import CellOwner, GameStatus
+
+# ABI of the S.GameState struct, as returned by GameInstance.get_state
+GAME_STATE_ABI = "(uint8,uint8,address,address,uint256,(uint8,uint8,uint8),uint16,uint256,uint256)"
+GET_STATE_SELECTOR = "0x" + function_signature_to_4byte_selector("get_state()").hex()
+# Games per single JSON-RPC batch or per single Gateway.get_states call
+DEFAULT_CHUNK_SIZE = 250
+# Bit offsets of the 4 cells packed into a byte of GameInstance.get_board, the first cell is the lowest
+CELL_SHIFTS = np.array([0, 2, 4, 6], dtype=np.uint8)
+
+
+@dataclass(frozen=True)
+class GameSnapshot:
+    address: str
+    status: GameStatus
+    current_turn: CellOwner
+    alice: str
+    bob: str
+    bid: int
+    m: int
+    n: int
+    k: int
+    moves: int
+    block_game_deployed: int
+    block_recent_move: int
+
+    @classmethod
+    def from_tuple(cls, address, state):
+        status, current_turn, alice, bob, bid, (m, n, k), moves, block_game_deployed, block_recent_move = state
+        return cls(
+            address=to_checksum_address(address),
+            status=GameStatus(status),
+            current_turn=CellOwner(current_turn),
+            alice=to_checksum_address(alice),
+            bob=to_checksum_address(bob),
+            bid=bid,
+            m=m,
+            n=n,
+            k=k,
+            moves=moves,
+            block_game_deployed=block_game_deployed,
+            block_recent_move=block_recent_move,
+        )
+
+    @property
+    def winner(self) -> str | None:
+        # Same as GameInstance.get_winner, the winner is the one who made the last move
+        if self.status != GameStatus.completed:
+            return None
+        return self.alice if self.current_turn == CellOwner.alice else self.bob
+
+
+def decode_board(blob: bytes, m: int, n: int) -> np.ndarray:
+    """
+    (m, n) array of S.CellOwner values out of GameInstance.get_board. The words are big endian, so flipping the
+    bytes of every word (a view, nothing is copied) puts the cells in order, 4 cells per byte from the lowest bits.
+    """
+    words = np.frombuffer(blob, dtype=np.uint8).reshape(-1, 32)[:, ::-1]
+    return ((words[..., None] >> CELL_SHIFTS) & 3).reshape(-1)[:m * n].reshape(m, n)
+
+
+async def read_board(game_contract, m=None, n=None) -> np.ndarray:
+    if m is None or n is None:
+        m, n, _ = await game_contract.functions.get_settings().call()
+    return decode_board(await game_contract.functions.get_board().call(), m, n)
+
+
+def chunked(items, size):
+    iterator = iter(items)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
+class SnapshotReader:
+    """
+    Reads GameInstance.get_state of many games at once, either as a single JSON-RPC batch of eth_call's
+    (works with any node, no extra contracts involved) or as Gateway.get_states aggregate call.
+    """
+
+    def __init__(self, endpoint: str, session: aiohttp.ClientSession | None = None, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.endpoint = endpoint
+        self.chunk_size = chunk_size
+        self._session = session
+
+    async def _post(self, session, payload):
+        async with session.post(self.endpoint, json=payload) as response:
+            response.raise_for_status()
+            return await response.json(content_type=None)
+
+    async def _batch(self, session, addresses, block):
+        payload = [
+            {
+                "jsonrpc": "2.0",
+                "id": index,
+                "method": "eth_call",
+                "params": [{"to": address, "data": GET_STATE_SELECTOR}, block],
+            }
+            for index, address in enumerate(addresses)
+        ]
+        responses = {response["id"]: response for response in await self._post(session, payload)}
+        snapshots = []
+        for index, address in enumerate(addresses):
+            response = responses[index]
+            if "error" in response:
+                raise ValueError(response["error"])
+            (state,) = eth_abi.decode_abi([GAME_STATE_ABI], bytes.fromhex(response["result"][2:]))
+            snapshots.append(GameSnapshot.from_tuple(address, state))
+        return snapshots
+
+    async def batch(self, addresses, block="latest") -> list[GameSnapshot]:
+        if self._session is not None:
+            return await self._gather_batches(self._session, addresses, block)
+        async with aiohttp.ClientSession() as session:
+            return await self._gather_batches(session, addresses, block)
+
+    async def _gather_batches(self, session, addresses, block):
+        chunks = await asyncio.gather(
+            *(self._batch(session, chunk, block) for chunk in chunked(addresses, self.chunk_size))
+        )
+        return list(itertools.chain.from_iterable(chunks))
+
+    async def aggregate(self, gateway_contract, addresses) -> list[GameSnapshot]:
+        async def fetch(chunk):
+            states = await gateway_contract.functions.get_states(chunk).call()
+            return [GameSnapshot.from_tuple(address, state) for address, state in zip(chunk, states)]
+        chunks = await asyncio.gather(*(fetch(chunk) for chunk in chunked(addresses, self.chunk_size)))
+        return list(itertools.chain.from_iterable(chunks))
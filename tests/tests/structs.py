@@ -0,0 +1,19 @@
+import enum
+
+
+# Mirrors of the enums declared in contracts/Structs.sol, the order does matter
+
+class GameStatus(enum.IntEnum):
+    created = 0
+    waiting = 1
+    running = 2
+    completed = 3
+    aborted = 4
+    exhausted = 5
+
+
+class CellOwner(enum.IntEnum):
+    available = 0
+    gouged = 1
+    alice = 2
+    bob = 3
@@ -0,0 +1,133 @@
+import pytest
+
+from .channel import CHALLENGE_WINDOW, ChannelError, MoveChannel, sign_move
+from .conftest import (CHAIN_ID, DEFAULT_BID, GameStatus,
+                       append_move_and_get_receipt, transact,
+                       transaction_params, wait_for_receipt)
+
+pytestmark = pytest.mark.asyncio
+
+
+async def open_channel(game, alice, bob):
+    return MoveChannel(
+        chain_id=CHAIN_ID,
+        game=game.address,
+        alice=alice.address,
+        bob=bob.address,
+        start_index=await game.functions.get_move_count().call(),
+        start_history=await game.functions.get_history().call(),
+    )
+
+
+async def settle_and_get_receipt(w3, game, channel, relayer):
+    return await wait_for_receipt(
+        w3, await channel.relay(w3, game, relayer, transaction_params(relayer))
+    )
+
+
+async def call_and_get_receipt(w3, function_call, player):
+    return await wait_for_receipt(w3, await transact(w3, function_call, player))
+
+
+async def test_can_settle_whole_game(w3, get_game_running, prepayed_wallets):
+    alice, bob, charly, *_ = prepayed_wallets
+    game = await get_game_running(alice, bob, m=3, n=3, k=3)
+    alice_channel, bob_channel = await open_channel(game, alice, bob), await open_channel(game, alice, bob)
+    for player, x, y in [(alice, 0, 0), (bob, 0, 1), (alice, 1, 0), (bob, 1, 1), (alice, 2, 0)]:
+        own, other = (alice_channel, bob_channel) if player is alice else (bob_channel, alice_channel)
+        other.receive(own.propose(player, x, y))
+    assert alice_channel.transcript == bob_channel.transcript
+    balance_before = await w3.eth.get_balance(alice.address)
+    # Anybody may relay the transcript, the moves are attributed to their signers
+    receipt = await settle_and_get_receipt(w3, game, bob_channel, charly)
+    assert receipt.status
+    logs = game.events.MoveAppended().processReceipt(receipt)
+    assert [log["args"]["player"] for log in logs] == [alice.address, bob.address] * 2 + [alice.address]
+    assert [log["args"]["is_winner"] for log in logs] == [False] * 4 + [True]
+    assert GameStatus(await game.functions.get_game_status().call()) == GameStatus.completed
+    assert await game.functions.get_winner().call() == alice.address
+    assert await w3.eth.get_balance(alice.address) == balance_before + 2 * DEFAULT_BID
+
+
+async def test_transcript_may_overlap_chain(w3, get_game_running, prepayed_wallets):
+    alice, bob, *_ = prepayed_wallets
+    game = await get_game_running(alice, bob, m=3, n=3, k=3)
+    channel = await open_channel(game, alice, bob)
+    channel.propose(alice, 0, 0)
+    channel.propose(bob, 1, 1)
+    assert (await append_move_and_get_receipt(w3, game, alice, 0, 0)).status
+    assert (await settle_and_get_receipt(w3, game, channel, alice)).status
+    assert await game.functions.get_move_count().call() == 2
+    # Nothing new in the transcript, nothing to apply
+    assert (await settle_and_get_receipt(w3, game, channel, alice)).status
+    assert await game.functions.get_move_count().call() == 2
+
+
+async def test_cannot_settle_forged_move(w3, get_game_running, prepayed_wallets):
+    alice, bob, charly, *_ = prepayed_wallets
+    game = await get_game_running(alice, bob, m=3, n=3, k=3)
+    channel = await open_channel(game, alice, bob)
+    channel.propose(alice, 0, 0)
+    forged = sign_move(charly, CHAIN_ID, game.address, 1, 1, 1, channel.history)
+    with pytest.raises(ChannelError):
+        channel.receive(forged)
+    # The contract does not trust the relayer either
+    channel.transcript.append(forged)
+    assert not (await settle_and_get_receipt(w3, game, channel, alice)).status
+    assert await game.functions.get_move_count().call() == 0
+
+
+async def test_cannot_settle_on_top_of_another_history(w3, get_game_running, prepayed_wallets):
+    alice, bob, *_ = prepayed_wallets
+    game = await get_game_running(alice, bob, m=3, n=3, k=3)
+    channel = await open_channel(game, alice, bob)
+    channel.propose(alice, 0, 0)
+    channel.propose(bob, 1, 1)
+    # Alice makes another move #0 on chain, Bob's move #1 has been signed on top of (0, 0)
+    assert (await append_move_and_get_receipt(w3, game, alice, 2, 2)).status
+    assert not (await settle_and_get_receipt(w3, game, channel, alice)).status
+    assert await game.functions.get_move_count().call() == 1
+    # A channel opened on top of the on-chain history settles as usual
+    channel = await open_channel(game, alice, bob)
+    channel.propose(bob, 1, 1)
+    assert (await settle_and_get_receipt(w3, game, channel, alice)).status
+    assert await game.functions.get_move_count().call() == 2
+
+
+async def test_cannot_replay_move_in_another_game(w3, get_game_running, prepayed_wallets):
+    alice, bob, *_ = prepayed_wallets
+    game, other_game = [await get_game_running(alice, bob, m=3, n=3, k=3) for _ in range(2)]
+    channel = await open_channel(game, alice, bob)
+    channel.propose(alice, 0, 0)
+    assert not (await settle_and_get_receipt(w3, other_game, channel, alice)).status
+
+
+@pytest.mark.usefixtures("chain_control")
+async def test_can_claim_unanswered_challenge(w3, client, get_game_running, prepayed_wallets):
+    alice, bob, *_ = prepayed_wallets
+    game = await get_game_running(alice, bob, m=3, n=3, k=3)
+    assert (await append_move_and_get_receipt(w3, game, alice, 0, 0)).status
+    # Bob is the one to move, he cannot challenge
+    assert not (await call_and_get_receipt(w3, game.functions.challenge(), bob)).status
+    assert (await call_and_get_receipt(w3, game.functions.challenge(), alice)).status
+    assert not (await call_and_get_receipt(w3, game.functions.claim_timeout(), alice)).status
+    await client.mine(CHALLENGE_WINDOW)
+    assert not (await call_and_get_receipt(w3, game.functions.claim_timeout(), bob)).status
+    assert (await call_and_get_receipt(w3, game.functions.claim_timeout(), alice)).status
+    assert GameStatus(await game.functions.get_game_status().call()) == GameStatus.completed
+    assert await game.functions.get_winner().call() == alice.address
+    assert await w3.eth.get_balance(game.address) == 0
+
+
+@pytest.mark.usefixtures("chain_control")
+async def test_cannot_claim_answered_challenge(w3, client, get_game_running, prepayed_wallets):
+    alice, bob, *_ = prepayed_wallets
+    game = await get_game_running(alice, bob, m=3, n=3, k=3)
+    assert (await append_move_and_get_receipt(w3, game, alice, 0, 0)).status
+    assert (await call_and_get_receipt(w3, game.functions.challenge(), alice)).status
+    channel = await open_channel(game, alice, bob)
+    channel.propose(bob, 1, 1)
+    assert (await settle_and_get_receipt(w3, game, channel, bob)).status
+    await client.mine(CHALLENGE_WINDOW)
+    assert not (await call_and_get_receipt(w3, game.functions.claim_timeout(), alice)).status
+    assert GameStatus(await game.functions.get_game_status().call()) == GameStatus.running
@@ -0,0 +1,28 @@
+import json
+import os
+
+from .client import BUILD_DIR, load_artifact
+
+
+def test_artifact_is_slimmed_once(tmp_path):
+    os.makedirs(tmp_path / "contracts")
+    with open(os.path.join(BUILD_DIR, "contracts", "GameInstance.json")) as f:
+        artifact = json.load(f)
+    with open(tmp_path / "contracts" / "GameInstance.json", "w") as f:
+        json.dump(artifact, f)
+
+    slim = load_artifact("GameInstance", str(tmp_path))
+    assert (slim["abi"], slim["bytecode"]) == (artifact["abi"], artifact["bytecode"])
+    assert "ast" not in slim
+    # Memoized within the process, the next one reads the slim copy
+    assert load_artifact("GameInstance", str(tmp_path)) is slim
+    [stored] = os.listdir(tmp_path / "cache" / "artifacts")
+    load_artifact.cache_clear()
+    assert load_artifact("GameInstance", str(tmp_path)) == slim
+
+    # A recompiled artifact replaces the stale copy
+    with open(tmp_path / "contracts" / "GameInstance.json", "w") as f:
+        json.dump({**artifact, "bytecode": "0x00"}, f)
+    load_artifact.cache_clear()
+    assert load_artifact("GameInstance", str(tmp_path))["bytecode"] == "0x00"
+    assert os.listdir(tmp_path / "cache" / "artifacts") != [stored]
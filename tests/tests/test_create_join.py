@@ -1,7 +1,15 @@
+import asyncio
+
 import pytest
+from web3.exceptions import TimeExhausted
 
 from .conftest import (DEFAULT_BID, GameStatus, cancel_game_and_get_receipt,
-                       create_game_and_get_receipt, join_and_get_receipt)
+                       create_and_join_game_and_get_receipt,
+                       create_game_and_get_logs, create_game_and_get_receipt,
+                       create_games_and_get_logs, join_and_get_receipt,
+                       transact, transfer)
+from .nonces import NONCES
+from .receipts import DEFAULT_BACKFILL, wait_for_receipt
 
 pytestmark = pytest.mark.asyncio
 
@@ -34,11 +42,26 @@ async def test_can_create_game(get_game_created, prepayed_wallets):
     )
 
 
+# Games are clones, the initializer replaces the constructor and must never run twice
+async def test_cannot_reinitialize_game(w3, get_game_created, prepayed_wallets):
+    alice, bob, *_ = prepayed_wallets
+    game = await get_game_created(alice)
+    for player in (alice, bob):
+        receipt = await wait_for_receipt(w3, await transact(w3, game.functions.initialize([3, 3, 3], []), player))
+        assert not receipt.status
+    assert (await game.functions.get_settings().call()) == [20, 20, 5]
+    assert (await game.functions.get_players().call())[0] == alice.address
+
+
 async def test_can_cancel_created_game(w3, get_game_created, prepayed_wallets):
     alice, *_ = prepayed_wallets
     game = await get_game_created(alice)
-    assert (await cancel_game_and_get_receipt(w3, game, alice)).status
+    receipt = await cancel_game_and_get_receipt(w3, game, alice)
+    assert receipt.status
     assert GameStatus(await game.functions.get_game_status().call()) == GameStatus.aborted
+    assert [log["args"]["status"] for log in game.events.GameStatusChanged().processReceipt(receipt)] == [
+        GameStatus.aborted
+    ]
 
 
 async def test_can_cancel_waiting_game(w3, get_game_waiting, prepayed_wallets):
@@ -78,6 +101,40 @@ async def test_can_init_game(get_game_waiting, prepayed_wallets):
     )
 
 
+async def test_can_init_game_in_two_steps(w3, get_game_created, prepayed_wallets):
+    alice, *_ = prepayed_wallets
+    game = await get_game_created(alice)
+    assert (await join_and_get_receipt(w3, game, alice)).status
+    assert GameStatus(await game.functions.get_game_status().call()) == GameStatus.waiting
+
+
+async def test_cannot_create_and_join_without_bid(w3, gateway_contract, prepayed_wallets):
+    alice, *_ = prepayed_wallets
+    assert not (await create_and_join_game_and_get_receipt(w3, gateway_contract, alice, bid=0)).status
+
+
+async def test_can_create_games_in_batch(w3, client, gateway_contract, prepayed_wallets):
+    alice, *_ = prepayed_wallets
+    games = [(3, 3, 3, [], 0), (5, 5, 3, [], DEFAULT_BID), (20, 20, 5, [], 2 * DEFAULT_BID)]
+    logs = await create_games_and_get_logs(w3, gateway_contract, alice, games)
+    assert len(logs) == len(games)
+    for log, (m, n, k, _, bid) in zip(logs, games):
+        assert log["args"]["initiator"] == alice.address
+        game = client.game(log["args"]["game"])
+        assert await game.functions.get_settings().call() == [m, n, k]
+        assert GameStatus(await game.functions.get_game_status().call()) == (
+            GameStatus.waiting if bid else GameStatus.created
+        )
+        assert await w3.eth.get_balance(game.address) == bid
+
+
+async def test_cannot_create_games_with_wrong_deposit(w3, gateway_contract, prepayed_wallets):
+    alice, *_ = prepayed_wallets
+    for deposit in (0, DEFAULT_BID, 3 * DEFAULT_BID):
+        new_games = gateway_contract.functions.new_games([[3, 3, 3], [3, 3, 3]], [[], []], [DEFAULT_BID, DEFAULT_BID])
+        assert not (await wait_for_receipt(w3, await transact(w3, new_games, alice, deposit))).status
+
+
 async def test_can_join_game(get_game_running, prepayed_wallets):
     alice, bob, *_ = prepayed_wallets
     game = await get_game_running(alice, bob)
@@ -111,3 +168,40 @@ async def test_cannot_join_running_game(get_game_running, prepayed_wallets, w3):
     assert not (await join_and_get_receipt(w3, game, alice)).status
     assert not (await join_and_get_receipt(w3, game, bob)).status
     assert not (await join_and_get_receipt(w3, game, charly)).status
+
+
+# A single wallet keeps many transactions in flight, nonces are handed out locally
+async def test_can_pipeline_game_creation(w3, gateway_contract, prepayed_wallets):
+    alice, *_ = prepayed_wallets
+    # Pool wallets have made the transactions of the baseline already
+    nonce = await w3.eth.get_transaction_count(alice.address)
+    logs = await asyncio.gather(
+        *(create_game_and_get_logs(w3, gateway_contract, alice, 3, 3, 3) for _ in range(10))
+    )
+    assert len({log[0]["args"]["game"] for log in logs}) == 10
+    assert await w3.eth.get_transaction_count(alice.address) == nonce + 10
+
+
+# Local nonce counter went out of sync with the chain, e.g. a transaction was dropped from the mempool
+async def test_nonce_manager_recovers_from_stale_nonce(w3, gateway_contract, prepayed_wallets):
+    alice, *_ = prepayed_wallets
+    nonce = await w3.eth.get_transaction_count(alice.address)
+    assert (await create_game_and_get_receipt(w3, gateway_contract, alice, 3, 3, 3)).status
+    nonces = NONCES[alice.address]
+    nonces.release(await nonces.allocate(w3))
+    nonces._next = 0
+    assert (await create_game_and_get_receipt(w3, gateway_contract, alice, 3, 3, 3)).status
+    assert await w3.eth.get_transaction_count(alice.address) == nonce + 2
+
+
+async def test_receipt_watcher_times_out(w3):
+    with pytest.raises(TimeExhausted):
+        await wait_for_receipt(w3, b"\x00" * 32, timeout=1)
+
+
+# Nobody waits while the transactions get mined, more blocks than the watcher looks back on, when it wakes up
+async def test_receipt_watcher_finds_transactions_mined_before_waiting(w3, prepayed_wallets):
+    alice, bob, _ = prepayed_wallets
+    tx_hashes = [await transfer(w3, alice, bob.address, 1) for _ in range(2 * DEFAULT_BACKFILL)]
+    receipts = await asyncio.gather(*(wait_for_receipt(w3, tx_hash) for tx_hash in tx_hashes))
+    assert all(receipt.status for receipt in receipts)
@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from .conftest import GameStatus, append_move_and_get_receipt
+from .engine import Engine, IllegalMove
+from .structs import CellOwner
+from .test_gameplay import Move
+
+
+def random_game(seed):
+    rng = random.Random(seed)
+    m, n = rng.randint(1, 6), rng.randint(1, 6)
+    k = rng.randint(1, min(m, n))
+    # Some of the gouged cells are outside the board on purpose
+    gouged = [Move(rng.randint(0, m), rng.randint(0, n)) for _ in range(rng.randint(0, 4))]
+    # Some of the moves are illegal on purpose: outside the board, taken cells, the wrong player's turn
+    moves = [
+        (rng.choice([CellOwner.alice, CellOwner.bob]), rng.randint(0, m), rng.randint(0, n))
+        for _ in range(3 * m * n)
+    ]
+    return m, n, k, gouged, moves
+
+
+# The engine is the oracle: every move must be accepted or rejected and flagged as winning exactly as on chain
+@pytest.mark.parametrize("seed", range(20))
+@pytest.mark.asyncio
+async def test_engine_matches_contract(w3, get_game_running, prepayed_wallets, seed):
+    alice, bob, *_ = prepayed_wallets
+    m, n, k, gouged, moves = random_game(seed)
+    game = await get_game_running(alice, bob, m=m, n=n, k=k, gouged=gouged)
+    engine = Engine(m, n, k, [(cell.x, cell.y) for cell in gouged])
+    for player, x, y in moves:
+        try:
+            is_winner = engine.play(x, y, player)
+        except IllegalMove:
+            is_winner = None
+        receipt = await append_move_and_get_receipt(w3, game, alice if player == CellOwner.alice else bob, x, y)
+        assert bool(receipt.status) == (is_winner is not None)
+        if receipt.status:
+            assert game.events.MoveAppended().processReceipt(receipt)[0]["args"]["is_winner"] == is_winner
+        if engine.status != GameStatus.running:
+            break
+    assert GameStatus(await game.functions.get_game_status().call()) == engine.status
+    assert await game.functions.get_move_count().call() == engine.moves
+
+
+def test_engine_winner_and_draw():
+    engine = Engine(2, 2, 2, gouged=[(5, 5)])
+    assert not engine.play(0, 0)
+    assert not engine.play(1, 1)
+    assert engine.play(0, 1)
+    assert engine.status == GameStatus.completed and engine.winner == CellOwner.alice
+    engine = Engine(3, 3, 3)
+    for x, y in [(0, 0), (0, 1), (0, 2), (1, 1), (1, 0), (1, 2), (2, 1), (2, 0), (2, 2)]:
+        assert not engine.play(x, y)
+    assert engine.status == GameStatus.exhausted and engine.winner is None
+
+
+def test_engine_rejects_like_contract():
+    engine = Engine(3, 3, 3, gouged=[(1, 1)])
+    for x, y, player in [(3, 0, None), (0, 3, None), (1, 1, None), (0, 0, CellOwner.bob)]:
+        with pytest.raises(IllegalMove):
+            engine.play(x, y, player)
+    assert engine.moves == 0
+    with pytest.raises(ValueError):
+        Engine(3, 3, 4)
@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import pytest
+
+from .conftest import GAS_LIMIT, GAS_PRICE, append_move_and_get_receipt
+from .fees import GAME_CREATED_TOPIC, MOVE_APPENDED_TOPIC, STATION, GasStation
+
+
+GAME = "0x" + "11" * 20
+
+
+def move_receipt(gas_used, is_winner):
+    data = "0x" + "00" * 64 + ("%064x" % is_winner)
+    return {"status": 1, "gasUsed": gas_used, "logs": [{"topics": [MOVE_APPENDED_TOPIC], "data": data}]}
+
+
+def enabled_station():
+    station = GasStation()
+    station.enable(GAS_LIMIT, GAS_PRICE, margin=0.5)
+    station.block_gas_limit = 10 * GAS_LIMIT
+    station.shapes[GAME] = (3, 3, 3)
+    return station
+
+
+def test_moves_are_budgeted_after_a_win():
+    station = enabled_station()
+    move = SimpleNamespace(fn_name="append_move", args=(0, 0), address=GAME)
+    station.sent(b"\x01" * 32, move)
+    station.mined(b"\x01" * 32, move_receipt(100, False))
+    # Whether the next move wins is not known, it gets estimated
+    assert station.budget("append_move", (3, 3, 3)) is None
+    station.sent(b"\x02" * 32, move)
+    station.mined(b"\x02" * 32, move_receipt(140, True))
+    assert station.gas == {("append_move", 3, 3, 3, False): 100, ("append_move", 3, 3, 3, True): 140}
+    assert station.budget("append_move", (3, 3, 3)) == 210
+    assert station.moves_per_block() == {(3, 3, 3): (10, 10 * GAS_LIMIT // 210)}
+
+
+def test_reverted_and_variable_calls_are_not_cached():
+    station = enabled_station()
+    station.sent(b"\x01" * 32, SimpleNamespace(fn_name="join", args=(), address=GAME))
+    station.mined(b"\x01" * 32, {"status": 0, "gasUsed": GAS_LIMIT, "logs": []})
+    station.sent(b"\x02" * 32, SimpleNamespace(fn_name="settle", args=([1, 2],), address=GAME))
+    station.mined(b"\x02" * 32, {"status": 1, "gasUsed": 500, "logs": []})
+    assert station.gas == {}
+
+
+def test_created_game_shape_is_learned():
+    station = enabled_station()
+    station.forget_games()
+    create = SimpleNamespace(fn_name="new_game", args=([4, 5, 3], []), address="0x" + "22" * 20)
+    station.sent(b"\x01" * 32, create)
+    game_topic = "0x" + "00" * 12 + GAME[2:]
+    station.mined(b"\x01" * 32, {"status": 1, "gasUsed": 300, "logs": [{"topics": [GAME_CREATED_TOPIC, game_topic]}]})
+    assert station.shapes == {GAME: (4, 5, 3)}
+    assert station.budget("new_game", (4, 5, 3)) == 450
+
+
+@pytest.mark.asyncio
+async def test_fees_follow_history():
+    station = enabled_station()
+    history = {"baseFeePerGas": [10, 12, 14], "reward": [[1], [3], [2]]}
+    w3 = SimpleNamespace(eth=SimpleNamespace(fee_history=lambda *args: coroutine(history)))
+    assert await station.fees(w3) == {"maxFeePerGas": 30, "maxPriorityFeePerGas": 2}
+    # Without a base fee the chain is a legacy one
+    station = enabled_station()
+    w3 = SimpleNamespace(eth=SimpleNamespace(fee_history=lambda *args: coroutine({"baseFeePerGas": [0, 0]})))
+    assert await station.fees(w3) == {"gasPrice": GAS_PRICE}
+
+
+async def coroutine(value):
+    return value
+
+
+@pytest.mark.asyncio
+async def test_estimated_game(w3, client, get_game_running, prepayed_wallets):
+    if not STATION.enabled:
+        pytest.skip("--fixed-gas")
+    alice, bob, _ = prepayed_wallets
+    game = await get_game_running(alice, bob, m=3, n=3, k=3)
+    for player, x, y in [(alice, 0, 0), (bob, 1, 0), (alice, 0, 1), (bob, 1, 1), (alice, 0, 2)]:
+        receipt = await append_move_and_get_receipt(w3, game, player, x, y)
+        assert receipt.status
+        assert receipt.gasUsed <= (await w3.eth.get_transaction(receipt.transactionHash))["gas"] < GAS_LIMIT
+    fixed, estimated = STATION.moves_per_block()[3, 3, 3]
+    assert estimated > fixed
+    # A taken cell reverts on chain as it used to, with the fixed limit
+    receipt = await append_move_and_get_receipt(w3, game, bob, 0, 0)
+    assert not receipt.status
@@ -219,6 +219,7 @@ async def test_gameplay(
     )
 
     moves_registered_expected = 0
+    statuses_reported = []
     for move in moves:
         if move.status:
             moves_registered_expected += 1
@@ -238,6 +239,9 @@ async def test_gameplay(
             logs = game.events.MoveAppended().processReceipt(receipt)
             assert len(logs) == 1
             assert logs[0]["args"]["is_winner"] == move.is_winner
+            statuses_reported += [
+                log["args"]["status"] for log in game.events.GameStatusChanged().processReceipt(receipt)
+            ]
 
     match who_wins:
         case WhoWon.alice: winner_address = alice.address
@@ -247,6 +251,8 @@ async def test_gameplay(
     assert await game.functions.get_move_count().call() == moves_registered_expected
     assert await game.functions.get_winner().call() == winner_address
     assert GameStatus(await game.functions.get_game_status().call()) == status
+    # The end of the game is announced once
+    assert statuses_reported == ([] if status == GameStatus.running else [status])
 
     # Now the important part: check whether the FUNDS are SAFU
     game_balance = await w3.eth.get_balance(game.address)
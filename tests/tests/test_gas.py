@@ -0,0 +1,100 @@
+import pytest
+
+from .conftest import (DEFAULT_BID, create_game_and_get_receipt,
+                       load_artifact, transact, wait_for_receipt)
+from .test_gameplay import Move
+
+pytestmark = pytest.mark.asyncio
+
+
+# Both layouts implement the very same rules, the only difference is the board's storage
+PACKED_LAYOUT = "GameInstance"
+MAPPED_LAYOUT = "GameInstanceMapped"
+
+
+async def deploy_contract(w3, name, initiator, *args):
+    artifact = load_artifact(name)
+    factory = w3.eth.contract(abi=artifact["abi"], bytecode=artifact["bytecode"])
+    receipt = await wait_for_receipt(w3, await transact(w3, factory.constructor(*args), initiator))
+    assert receipt.status
+    return w3.eth.contract(address=receipt.contractAddress, abi=artifact["abi"]), receipt.gasUsed
+
+
+async def deploy_game(w3, gateway_contract, layout, initiator, m, n, k, gouged):
+    if layout == MAPPED_LAYOUT:
+        return await deploy_contract(w3, layout, initiator, [m, n, k], gouged)
+    # Packed games are clones made by the Gateway
+    receipt = await create_game_and_get_receipt(
+        w3, gateway_contract, initiator, m, n, k, gouged=[Move(x, y) for x, y in gouged]
+    )
+    assert receipt.status
+    address = gateway_contract.events.GameCreated().processReceipt(receipt)[0]["args"]["game"]
+    return w3.eth.contract(address=address, abi=load_artifact(layout)["abi"]), receipt.gasUsed
+
+
+async def play_and_measure(w3, gateway_contract, layout, alice, bob, m, n, k, gouged_count):
+    # Alice builds a horizontal line in the middle of the board, Bob follows her two rows below,
+    # gouged cells are taken from the rows further down, so they never interfere with the moves.
+    x0, y0 = (m - k) // 2, n // 2 - 2
+    gouged = [(x, y) for y in range(y0 + 4, n) for x in range(m)][:gouged_count]
+    assert len(gouged) == gouged_count
+    game, deployment_gas = await deploy_game(w3, gateway_contract, layout, alice, m, n, k, gouged)
+    for player in (alice, bob):
+        assert (await wait_for_receipt(w3, await transact(w3, game.functions.join(), player, DEFAULT_BID))).status
+    moves_gas = []
+    for shift in range(k):
+        for player, y in ((alice, y0), (bob, y0 + 2)):
+            if player is bob and shift == k - 1:
+                break
+            receipt = await wait_for_receipt(
+                w3, await transact(w3, game.functions.append_move(x0 + shift, y), player)
+            )
+            assert receipt.status
+            moves_gas.append(receipt.gasUsed)
+    assert await game.functions.get_winner().call() == alice.address
+    return deployment_gas, moves_gas
+
+
+@pytest.mark.parametrize(
+    "m,n,k,gouged_count",
+    [
+        pytest.param(5, 5, 3, 0, id="5x5x3"),
+        pytest.param(20, 20, 5, 0, id="20x20x5"),
+        pytest.param(20, 20, 5, 100, id="20x20x5 gouged=100"),
+        pytest.param(100, 100, 5, 300, id="100x100x5 gouged=300"),
+        pytest.param(255, 255, 10, 300, id="255x255x10 gouged=300"),
+    ]
+)
+async def test_packed_board_is_cheaper(w3, gateway_contract, prepayed_wallets, m, n, k, gouged_count):
+    alice, bob, *_ = prepayed_wallets
+    packed_deployment, packed_moves = await play_and_measure(
+        w3, gateway_contract, PACKED_LAYOUT, alice, bob, m, n, k, gouged_count
+    )
+    mapped_deployment, mapped_moves = await play_and_measure(
+        w3, gateway_contract, MAPPED_LAYOUT, alice, bob, m, n, k, gouged_count
+    )
+    comparison = "%sx%sx%s gouged=%s: deployment %s -> %s, append_move total %s -> %s, winning move %s -> %s" % (
+        m, n, k, gouged_count,
+        mapped_deployment, packed_deployment,
+        sum(mapped_moves), sum(packed_moves),
+        mapped_moves[-1], packed_moves[-1],
+    )
+    assert sum(packed_moves) < sum(mapped_moves), comparison
+    if gouged_count:
+        assert packed_deployment < mapped_deployment, comparison
+
+
+# Gateway.new_game clones the implementation instead of deploying the whole GameInstance bytecode
+@pytest.mark.parametrize("m,n,k", [(3, 3, 3), (20, 20, 5), (255, 255, 10)])
+async def test_clone_is_cheaper_than_deployment(w3, gateway_contract, prepayed_wallets, m, n, k):
+    alice, *_ = prepayed_wallets
+    receipt = await create_game_and_get_receipt(w3, gateway_contract, alice, m, n, k)
+    assert receipt.status
+    game, deployment_gas = await deploy_contract(w3, PACKED_LAYOUT, alice)
+    initialization = await wait_for_receipt(w3, await transact(w3, game.functions.initialize([m, n, k], []), alice))
+    assert initialization.status
+    assert receipt.gasUsed < deployment_gas + initialization.gasUsed, (
+        "%sx%sx%s: deployment + initialize %s -> clone %s" % (
+            m, n, k, deployment_gas + initialization.gasUsed, receipt.gasUsed
+        )
+    )
@@ -0,0 +1,106 @@
+import pytest
+
+from .conftest import (DEFAULT_BID, append_move_and_get_receipt,
+                       cancel_game_and_get_receipt, create_game_and_get_logs,
+                       create_game_and_get_receipt, join_and_get_receipt)
+from .test_gameplay import Move
+
+pytestmark = [pytest.mark.asyncio, pytest.mark.gas_benchmark]
+
+
+BOARDS = [
+    (1, 1, 1),
+    (2, 255, 2),
+    (255, 2, 2),
+    (3, 3, 3),
+    (5, 5, 3),
+    (10, 10, 5),
+    (20, 20, 5),
+    (50, 50, 5),
+    (100, 100, 5),
+    (255, 255, 5),
+    (255, 255, 10),
+]
+GOUGED = [0, 50, 300, 600]
+
+
+def position(name, m, n):
+    match name:
+        case "center": return m // 2, n // 2
+        case "edge": return m - 1, n // 2
+        case "corner": return 0, 0
+
+
+def layout(m, n, k, gouged_count, x, y):
+    """
+    Alice's k cells on the row `y` containing (x, y), Bob's k - 1 cells taken from the opposite end of the board and
+    the gouged cells taken from whatever is left. Returns None if the board is too small for all that.
+    """
+    start = min(max(x - (k - 1) // 2, 0), m - k)
+    line = [(x, y)] + [(column, y) for column in range(start, start + k) if column != x]
+    cells = [(column, row) for column in range(m) for row in range(n) if (column, row) not in line]
+    if len(cells) < k - 1 + gouged_count:
+        return None
+    bob = cells[::-1][:k - 1]
+    gouged = cells[:gouged_count]
+    return line, bob, gouged
+
+
+def sweep():
+    for m, n, k in BOARDS:
+        for gouged_count in GOUGED:
+            for name in ("center", "edge", "corner"):
+                x, y = position(name, m, n)
+                if (cells := layout(m, n, k, gouged_count, x, y)) is not None:
+                    yield pytest.param(m, n, k, cells, id="%sx%sx%s-gouged=%s-%s" % (m, n, k, gouged_count, name))
+
+
+@pytest.mark.parametrize("m,n,k,cells", list(sweep()))
+async def test_gameplay_gas(
+    request, w3, client, gateway_contract, prepayed_wallets, gas_recorder, m, n, k, cells
+):
+    case = request.node.callspec.id
+    alice, bob, *_ = prepayed_wallets
+    line, bob_cells, gouged = cells
+
+    receipt = await create_game_and_get_receipt(
+        w3, gateway_contract, alice, m, n, k, gouged=[Move(x, y) for x, y in gouged]
+    )
+    gas_recorder.record(case, "new_game", receipt)
+    game = client.game(gateway_contract.events.GameCreated().processReceipt(receipt)[0]["args"]["game"])
+    gas_recorder.record(case, "join_initiator", await join_and_get_receipt(w3, game, alice))
+    gas_recorder.record(case, "join_follower", await join_and_get_receipt(w3, game, bob))
+
+    for index, (x, y) in enumerate(line):
+        receipt = await append_move_and_get_receipt(w3, game, alice, x, y)
+        if index == 0 and k > 1:
+            gas_recorder.record(case, "append_move", receipt)
+        if index == k - 1:
+            gas_recorder.record(case, "append_move_winning", receipt)
+            break
+        assert (await append_move_and_get_receipt(w3, game, bob, *bob_cells[index])).status
+
+    assert await game.functions.get_winner().call() == alice.address
+    assert not (regressions := gas_recorder.regressions(case)), "\n".join(regressions)
+
+
+@pytest.mark.parametrize(
+    "m,n,k,gouged_count",
+    [
+        pytest.param(m, n, k, gouged_count, id="%sx%sx%s-gouged=%s" % (m, n, k, gouged_count))
+        for m, n, k in BOARDS
+        for gouged_count in GOUGED
+        if gouged_count < m * n
+    ]
+)
+async def test_cancel_gas(
+    request, w3, client, gateway_contract, prepayed_wallets, gas_recorder, m, n, k, gouged_count
+):
+    case = "cancel-" + request.node.callspec.id
+    alice, *_ = prepayed_wallets
+    gouged = [Move(index // n, index % n) for index in range(gouged_count)]
+    logs = await create_game_and_get_logs(w3, gateway_contract, alice, m, n, k, gouged=gouged)
+    game = client.game(logs[0]["args"]["game"])
+    assert (await join_and_get_receipt(w3, game, alice, DEFAULT_BID)).status
+    gas_recorder.record(case, "cancel_game", await cancel_game_and_get_receipt(w3, game, alice))
+    assert not (regressions := gas_recorder.regressions(case)), "\n".join(regressions)
@@ -0,0 +1,130 @@
+import json
+
+import pytest
+
+from .channel import CHALLENGE_WINDOW
+from .conftest import (GameStatus, append_move_and_get_receipt,
+                       cancel_game_and_get_receipt, join_and_get_receipt,
+                       transact, wait_for_receipt)
+from .indexer import Indexer
+from .nonces import NONCES
+from .receipts import ReceiptWatcher
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+async def indexer(w3, client, gateway_contract, tmp_path):
+    # Starting at the current block, the history of the forked chain is of no interest here. Hence the games of the
+    # tests are of the shapes, which the baseline games do not have, see BASELINE_SETTINGS
+    indexer = Indexer(
+        w3, gateway_contract, client.factory("GameInstance"), path=tmp_path / "index.sqlite",
+        start_block=await w3.eth.block_number
+    )
+    yield indexer
+    indexer.close()
+
+
+async def test_indexer_follows_games(
+    w3, indexer, tmp_path, get_game_created, get_game_waiting, get_game_running, prepayed_wallets
+):
+    alice, bob, charly = prepayed_wallets
+    created = await get_game_created(alice, m=3, n=4, k=3)
+    waiting = await get_game_waiting(bob)
+    running = await get_game_running(alice, bob, m=4, n=4, k=3)
+    cancelled = await get_game_waiting(charly)
+    assert (await cancel_game_and_get_receipt(w3, cancelled, charly)).status
+    for player, x, y in [(alice, 0, 0), (bob, 1, 1), (alice, 0, 1)]:
+        assert (await append_move_and_get_receipt(w3, running, player, x, y)).status
+
+    # Other xdist workers may share the node, so the head may move on and their games get indexed as well
+    ours = {created.address, waiting.address, running.address, cancelled.address}
+    head = await w3.eth.block_number
+    assert await indexer.sync() >= head
+    assert indexer.board_of(running.address) == [(alice.address, 0, 0), (bob.address, 1, 1), (alice.address, 0, 1)]
+    assert [indexer.status_of(game.address) for game in (created, waiting, running, cancelled)] == [
+        GameStatus.created, GameStatus.waiting, GameStatus.running, GameStatus.aborted
+    ]
+    assert [game for game in indexer.open_games() if game in ours] == [waiting.address]
+    assert indexer.games_of(alice.address) == [created.address, running.address]
+    assert indexer.games_of(bob.address) == [waiting.address, running.address]
+
+    # The cursor is persisted, another indexer over the same file carries on from it
+    assert (await append_move_and_get_receipt(w3, running, bob, 2, 2)).status
+    assert (await join_and_get_receipt(w3, waiting, charly)).status
+    reopened = Indexer(w3, indexer.gateway, indexer.game, path=tmp_path / "index.sqlite")
+    assert reopened.cursor == indexer.cursor
+    await reopened.sync()
+    assert len(reopened.board_of(running.address)) == 4
+    assert not ours.intersection(reopened.open_games())
+    reopened.close()
+
+
+@pytest.mark.exclusive_chain
+@pytest.mark.usefixtures("chain_control")
+async def test_indexer_rolls_back_reorg(w3, client, indexer, get_game_running, prepayed_wallets):
+    alice, bob, *_ = prepayed_wallets
+    game = await get_game_running(alice, bob, m=4, n=4, k=3)
+    assert (await append_move_and_get_receipt(w3, game, alice, 0, 0)).status
+    await indexer.sync()
+    snapshot = await client.snapshot()
+    assert (await append_move_and_get_receipt(w3, game, bob, 1, 1)).status
+    await indexer.sync()
+    assert indexer.board_of(game.address)[-1] == (bob.address, 1, 1)
+
+    # The move is gone from the chain, a different one takes its block
+    await client.revert(snapshot)
+    NONCES.reset()
+    ReceiptWatcher.of(w3).reset()
+    assert (await append_move_and_get_receipt(w3, game, bob, 2, 2)).status
+    await indexer.sync()
+    assert indexer.board_of(game.address) == [(alice.address, 0, 0), (bob.address, 2, 2)]
+
+
+@pytest.mark.usefixtures("chain_control")
+async def test_indexer_sees_game_over(w3, client, indexer, get_game_running, prepayed_wallets):
+    alice, bob, *_ = prepayed_wallets
+    game = await get_game_running(alice, bob, m=4, n=4, k=3)
+    assert (await append_move_and_get_receipt(w3, game, alice, 0, 0)).status
+    # A win by timeout has no winning move, only the status event tells the game is over
+    assert (await wait_for_receipt(w3, await transact(w3, game.functions.challenge(), alice))).status
+    await client.mine(CHALLENGE_WINDOW)
+    receipt = await wait_for_receipt(w3, await transact(w3, game.functions.claim_timeout(), alice))
+    assert [log["args"]["status"] for log in game.events.GameStatusChanged().processReceipt(receipt)] == [
+        GameStatus.completed
+    ]
+    await indexer.sync()
+    assert indexer.status_of(game.address) == GameStatus.completed
+
+
+async def log_bytes(w3, log_filter) -> tuple[int, list]:
+    # Size of the eth_getLogs result as it goes over the wire
+    log_filter = {
+        key: hex(value) if isinstance(value, int) else value for key, value in log_filter.items()
+    }
+    result = (await w3.provider.make_request("eth_getLogs", [log_filter]))["result"]
+    return len(json.dumps(result)), result
+
+
+@pytest.mark.http_only
+async def test_player_history_log_bytes(w3, indexer, get_game_running, prepayed_wallets):
+    alice, bob, charly = prepayed_wallets
+    start_block = indexer.start_block
+    # Alice plays one game, Bob and Charly play a couple more in the meantime
+    for initiator, follower in [(alice, bob), (bob, charly), (charly, bob), (bob, charly)]:
+        game = await get_game_running(initiator, follower, m=4, n=4, k=3)
+        for player, x, y in [(initiator, 0, 0), (follower, 1, 1), (initiator, 0, 1), (follower, 2, 2)]:
+            assert (await append_move_and_get_receipt(w3, game, player, x, y)).status
+
+    player_filter = indexer.player_filter(alice.address, start_block)
+    # Filtered by the events only, the node returns the logs of every player and the client picks the player's ones
+    event_bytes, by_event = await log_bytes(w3, {**player_filter, "topics": player_filter["topics"][:1]})
+    player_bytes, by_player = await log_bytes(w3, player_filter)
+    assert by_player == [log for log in by_event if log["topics"][2] == player_filter["topics"][2]]
+    # Created, joined, two moves
+    assert len(by_player) == 4
+    # Alice has played one game of the four, the payload shrinks accordingly
+    assert player_bytes < event_bytes / 3, "%s bytes filtered by the player, %s by the events only" % (
+        player_bytes, event_bytes
+    )
+    assert len(await indexer.player_history(alice.address, start_block)) == len(by_player)
@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+from .conftest import append_move_and_get_receipt
+from .instrument import PHASES, TRACER, Histogram, Tracer, instrument
+
+
+def test_histogram_is_cumulative():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 5.0):
+        histogram.observe(value)
+    assert histogram.prometheus("latency", 'method="eth_call"') == [
+        'latency_bucket{method="eth_call",le="0.1"} 2',
+        'latency_bucket{method="eth_call",le="1.0"} 3',
+        'latency_bucket{method="eth_call",le="+Inf"} 4',
+        'latency_sum{method="eth_call"} 5.65',
+        'latency_count{method="eth_call"} 4',
+    ]
+
+
+def test_disabled_tracer_records_nothing():
+    tracer = Tracer()
+    with tracer.transaction("append_move") as trace:
+        with tracer.phase("build"):
+            pass
+        tracer.sent(b"\x01" * 32)
+    tracer.mined(b"\x01" * 32, {"gasUsed": 1, "status": 1, "blockNumber": 1})
+    assert trace is None and tracer.traces == [] and tracer.phase_latency == {}
+
+
+def test_tracer_timeline():
+    tracer = Tracer()
+    tracer.enable()
+    tracer.head(10)
+    tx_hash = b"\x01" * 32
+    with tracer.transaction("append_move"):
+        for phase in PHASES[:4]:
+            with tracer.phase(phase):
+                pass
+        tracer.sent(tx_hash)
+    tracer.seen(tx_hash)
+    tracer.mined(tx_hash, {"gasUsed": 21000, "status": 1, "blockNumber": 12})
+    (trace,) = tracer.traces
+    assert [phase for phase, _, _ in trace.phases] == list(PHASES)
+    assert (trace.gas_used, trace.block_lag) == (21000, 2)
+    metrics = tracer.prometheus()
+    assert 'transaction_phase_duration_seconds_count{phase="mempool"} 1' in metrics
+    assert 'transactions_total{name="append_move",status="1"} 1' in metrics
+    assert 'transaction_gas_used_total{name="append_move"} 21000' in metrics
+    events = tracer.trace_events()["traceEvents"]
+    assert [event["name"] for event in events if event["ph"] == "X"] == list(PHASES)
+    assert all(event["dur"] >= 0 for event in events if event["ph"] == "X")
+
+
+@pytest.fixture
+def tracer(w3):
+    # The session's tracer, enabled and empty for the test, left the way it has been afterwards
+    state = dict(vars(TRACER))
+    TRACER.reset()
+    TRACER.enable()
+    instrumented = "instrument" in w3.middleware_onion
+    if not instrumented:
+        instrument(w3)
+    yield TRACER
+    if not instrumented:
+        w3.middleware_onion.remove("instrument")
+    vars(TRACER).update(state)
+
+
+@pytest.mark.asyncio
+async def test_move_is_traced(w3, tracer, get_game_running, prepayed_wallets, tmp_path):
+    alice, bob, *_ = prepayed_wallets
+    game = await get_game_running(alice, bob, m=3, n=3, k=3)
+    receipt = await append_move_and_get_receipt(w3, game, alice, 0, 0)
+    (trace,) = [trace for trace in tracer.traces if trace.tx_hash == receipt.transactionHash.hex()]
+    assert trace.name == "append_move"
+    assert [phase for phase, _, _ in trace.phases] == list(PHASES)
+    assert trace.gas_used == receipt.gasUsed and trace.status == 1
+    assert "eth_sendRawTransaction" in [method for method, *_ in trace.rpcs]
+    assert tracer.rpc_latency["eth_sendRawTransaction"].count >= 1
+
+    tracer.dump(tmp_path / "metrics.prom", tmp_path / "trace.json")
+    metrics = (tmp_path / "metrics.prom").read_text()
+    assert 'rpc_request_duration_seconds_count{method="eth_sendRawTransaction"}' in metrics
+    with open(tmp_path / "trace.json") as f:
+        assert {event["name"] for event in json.load(f)["traceEvents"]} >= set(PHASES)
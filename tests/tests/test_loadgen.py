@@ -0,0 +1,64 @@
+import asyncio
+import csv
+import json
+import random
+
+import pytest
+from eth_account import Account
+
+from .conftest import CHAIN_ID, GAS_LIMIT, GAS_PRICE
+from .fees import TRANSFER_GAS
+from .engine import Engine
+from .loadgen import POLICIES, LoadConfig, LoadGenerator, greedy_move
+from .receipts import DEFAULT_BACKFILL
+from .structs import GameStatus
+
+
+@pytest.mark.asyncio
+async def test_load_generator_plays_games(w3, client, deployer, tmp_path):
+    config = LoadConfig(
+        CHAIN_ID, GAS_PRICE, GAS_LIMIT, pairs=4, games_per_pair=2, boards=[(3, 3, 3), (4, 4, 3)], policy="greedy",
+        seed=0
+    )
+    report = await LoadGenerator(client, deployer, config).run()
+    summary = report.summary()
+    assert summary["failed"] == 0
+    # A create, a join and at least 2k - 1 moves per game
+    assert summary["transactions"] >= 8 * (2 + 5)
+    assert summary["games"]["completed"] + summary["games"]["exhausted"] == summary["games"]["started"] == 8
+    for latency in summary["latency"].values():
+        assert 0 < latency["p50"] <= latency["p95"] <= latency["p99"]
+    assert summary["tps"] > 0 and summary["gas_per_game"]["mean"] > 0
+
+    report.dump(tmp_path / "load")
+    with open(tmp_path / "load.json") as f:
+        assert json.load(f)["transactions"] == summary["transactions"]
+    with open(tmp_path / "load.csv") as f:
+        assert len(list(csv.DictReader(f))) == summary["transactions"]
+
+
+# The funding transfers take more blocks than the receipt watcher looks back on, when it wakes up
+@pytest.mark.asyncio
+async def test_load_generator_funds_many_players(w3, client, deployer):
+    # No games, the players get the gas reserve of a single transfer only
+    config = LoadConfig(CHAIN_ID, GAS_PRICE, TRANSFER_GAS, pairs=DEFAULT_BACKFILL + 1, games_per_pair=0)
+    players = [Account.create() for _ in range(2 * config.pairs)]
+    await LoadGenerator(client, deployer, config)._fund(players)
+    balances = await asyncio.gather(*(w3.eth.get_balance(player.address) for player in players))
+    assert balances == [config.funds()] * len(players)
+
+
+@pytest.mark.parametrize("policy", POLICIES)
+def test_policies_finish_games(policy):
+    rng = random.Random(0)
+    engine = Engine(5, 5, 3)
+    while engine.status == GameStatus.running:
+        engine.play(*POLICIES[policy](engine, rng))
+    assert engine.status in (GameStatus.completed, GameStatus.exhausted)
+
+
+def test_greedy_move_wins():
+    engine = Engine(3, 3, 3)
+    for x, y in [(0, 0), (1, 0), (0, 1), (1, 1)]:
+        engine.play(x, y)
+    assert greedy_move(engine, random.Random(0)) == (0, 2)
@@ -0,0 +1,75 @@
+import random
+
+import pytest
+
+from .conftest import (DEFAULT_BID, cancel_game_and_get_receipt,
+                       create_games_and_get_logs, get_waiting_games,
+                       join_and_get_receipt, transact, wait_for_receipt)
+
+pytestmark = pytest.mark.asyncio
+
+
+@pytest.fixture
+def bid():
+    # The lobby is shared with the rest of the tests, a unique bid tells our games apart
+    return DEFAULT_BID + random.randrange(1, 10 ** 9)
+
+
+async def test_lobby_follows_game_status(
+    w3, gateway_contract, get_game_created, get_game_waiting, prepayed_wallets, bid
+):
+    alice, bob, *_ = prepayed_wallets
+    created = await get_game_created(alice)
+    to_join, to_cancel, to_stay = [await get_game_waiting(alice, bid=bid) for _ in range(3)]
+    assert set(await get_waiting_games(gateway_contract, min_bid=bid, max_bid=bid)) == {
+        to_join.address, to_cancel.address, to_stay.address
+    }
+    assert (await join_and_get_receipt(w3, to_join, bob, bid)).status
+    assert (await cancel_game_and_get_receipt(w3, to_cancel, alice)).status
+    # Created game joins the lobby once the initiator joins it
+    assert (await join_and_get_receipt(w3, created, alice, bid)).status
+    assert set(await get_waiting_games(gateway_contract, min_bid=bid, max_bid=bid)) == {
+        to_stay.address, created.address
+    }
+
+
+async def test_lobby_filters_and_pages(w3, gateway_contract, prepayed_wallets, bid):
+    alice, *_ = prepayed_wallets
+    games = [(3, 3, 3, [], bid), (3, 3, 3, [], bid + 1), (5, 5, 3, [], bid), (5, 5, 4, [], bid)] * 3
+    logs = await create_games_and_get_logs(w3, gateway_contract, alice, games)
+    addresses = [log["args"]["game"] for log in logs]
+    waiting_count = await gateway_contract.functions.get_waiting_count().call()
+    assert waiting_count >= len(games)
+
+    def expected(predicate):
+        return {address for address, game in zip(addresses, games) if predicate(*game)}
+
+    for page_size in (1, 5, waiting_count):
+        assert set(await get_waiting_games(gateway_contract, page_size, min_bid=bid, max_bid=bid + 1)) == set(
+            addresses
+        )
+    assert set(await get_waiting_games(gateway_contract, 2, min_bid=bid + 1, max_bid=bid + 1)) == expected(
+        lambda m, n, k, gouged, game_bid: game_bid == bid + 1
+    )
+    assert set(await get_waiting_games(gateway_contract, 2, min_bid=bid, max_bid=bid + 1, m=5)) == expected(
+        lambda m, n, k, gouged, game_bid: m == 5
+    )
+    assert set(await get_waiting_games(gateway_contract, 2, min_bid=bid, max_bid=bid, k=3)) == expected(
+        lambda m, n, k, gouged, game_bid: k == 3 and game_bid == bid
+    )
+    # A page never holds more than asked for
+    lobby_filter = (bid, bid + 1, (0, 0, 0))
+    page, cursor = await gateway_contract.functions.get_waiting_games(0, 3, waiting_count, lobby_filter).call()
+    assert len(page) == 3 and cursor != 0
+    # Nor looks at more games than allowed, the rest of the lobby is up to the next pages
+    page, cursor = await gateway_contract.functions.get_waiting_games(0, waiting_count, 2, lobby_filter).call()
+    assert len(page) <= 2 and cursor == 2
+    assert set(
+        await get_waiting_games(gateway_contract, waiting_count, min_bid=bid, max_bid=bid, max_scan=1)
+    ) == expected(lambda m, n, k, gouged, game_bid: game_bid == bid)
+
+
+async def test_only_games_may_update_lobby(w3, gateway_contract, prepayed_wallets):
+    alice, *_ = prepayed_wallets
+    receipt = await wait_for_receipt(w3, await transact(w3, gateway_contract.functions.set_waiting(True), alice))
+    assert not receipt.status
@@ -0,0 +1,116 @@
+import asyncio
+
+import pytest
+
+from .conftest import (PROVIDER_WS, append_move_and_get_receipt,
+                       cancel_game_and_get_receipt, join_and_get_receipt,
+                       transact, wait_for_receipt)
+from .notify import NotificationHub
+
+pytestmark = pytest.mark.asyncio
+
+TIMEOUT = 30
+
+
+async def collect(subscription, count):
+    return [await subscription.next(TIMEOUT) for _ in range(count)]
+
+
+async def test_moves_reach_game_and_player(w3, client, get_game_running, get_game_waiting, prepayed_wallets):
+    alice, bob, charly = prepayed_wallets
+    running = await get_game_running(alice, bob, m=4, n=4, k=3)
+    waiting = await get_game_waiting(alice, m=3, n=4, k=3)
+    async with NotificationHub(w3, client.factory("GameInstance"), poll_latency=0.05) as hub:
+        with hub.subscribe(games=[running.address]) as spectator, hub.subscribe(players=[charly.address]) as player:
+            for initiator, x, y in [(alice, 0, 0), (bob, 1, 1)]:
+                assert (await append_move_and_get_receipt(w3, running, initiator, x, y)).status
+            moves = await collect(spectator, 2)
+            assert [(move.event, move.args["player"], move.args["x"], move.args["y"]) for move in moves] == [
+                ("MoveAppended", alice.address, 0, 0), ("MoveAppended", bob.address, 1, 1)
+            ]
+            assert all(move.game == running.address and not move.pending for move in moves)
+
+            # Once charly has joined, whatever happens in the game is charly's business as well
+            assert (await join_and_get_receipt(w3, waiting, charly)).status
+            assert (await player.next(TIMEOUT)).event == "PlayerJoined"
+            assert (await append_move_and_get_receipt(w3, waiting, alice, 0, 0)).status
+            seen = await collect(player, 1)
+            while seen[-1].event != "MoveAppended":
+                seen += await collect(player, 1)
+            assert seen[-1].args["player"] == alice.address
+            assert spectator.queue.empty()
+
+
+async def test_player_gets_moves_of_games_joined_before(w3, client, get_game_running, prepayed_wallets):
+    alice, bob, _ = prepayed_wallets
+    game = await get_game_running(alice, bob, m=4, n=4, k=3)
+    async with NotificationHub(w3, client.factory("GameInstance"), poll_latency=0.05) as hub:
+        with hub.subscribe(players=[alice.address]) as subscription:
+            for initiator, x, y in [(alice, 0, 0), (bob, 1, 1)]:
+                assert (await append_move_and_get_receipt(w3, game, initiator, x, y)).status
+            # Alice joined before subscribing, bob's move is alice's business all the same
+            moves = []
+            while len(moves) < 2:
+                moves += [move for move in await collect(subscription, 1) if move.game == game.address]
+            assert [move.args["player"] for move in moves] == [alice.address, bob.address]
+
+
+async def test_cancel_is_delivered(w3, client, get_game_waiting, prepayed_wallets):
+    alice, *_ = prepayed_wallets
+    game = await get_game_waiting(alice, m=3, n=3, k=3)
+    async with NotificationHub(w3, client.factory("GameInstance"), poll_latency=0.05) as hub:
+        with hub.subscribe(games=[game.address]) as subscription:
+            assert (await cancel_game_and_get_receipt(w3, game, alice)).status
+            events = [notification.event for notification in await collect(subscription, 2)]
+            assert events == ["GameCancelled", "GameStatusChanged"]
+
+
+async def test_cost_does_not_depend_on_games(w3, client, get_game_running, prepayed_wallets):
+    alice, bob, _ = prepayed_wallets
+    games = [await get_game_running(alice, bob, m=4, n=4, k=3) for _ in range(5)]
+    async with NotificationHub(w3, client.factory("GameInstance"), poll_latency=0.05) as hub:
+        subscriptions = [hub.subscribe(games=[game.address]) for game in games]
+        await asyncio.gather(*(append_move_and_get_receipt(w3, game, alice, 0, 0) for game in games))
+        for game, subscription in zip(games, subscriptions):
+            notification = await subscription.next(TIMEOUT)
+            assert notification.game == game.address and notification.event == "MoveAppended"
+            subscription.close()
+    # A single eth_getLogs per new head, however many games are watched
+    assert hub.stats["log_requests"] <= hub.stats["polls"]
+    assert hub.stats["notifications"] >= len(games)
+
+
+@pytest.mark.http_only
+async def test_moves_over_websocket(w3, client, get_game_running, prepayed_wallets):
+    alice, bob, _ = prepayed_wallets
+    game = await get_game_running(alice, bob, m=4, n=4, k=3)
+    async with NotificationHub(w3, client.factory("GameInstance"), ws_uri=PROVIDER_WS) as hub:
+        with hub.subscribe(players=[alice.address]) as subscription:
+            await asyncio.wait_for(hub.ready.wait(), TIMEOUT)
+            assert (await append_move_and_get_receipt(w3, game, bob, 2, 2)).status
+            notification = await subscription.next(TIMEOUT)
+            assert (notification.event, notification.args["player"]) == ("MoveAppended", bob.address)
+    assert "polls" not in hub.stats and "reconnects" not in hub.stats
+
+
+@pytest.mark.http_only
+@pytest.mark.exclusive_chain
+async def test_pending_move(w3, client, get_game_running, prepayed_wallets):
+    alice, bob, _ = prepayed_wallets
+    game = await get_game_running(alice, bob, m=4, n=4, k=3)
+    async with NotificationHub(w3, client.factory("GameInstance"), poll_latency=0.05, pending=True) as hub:
+        with hub.subscribe(games=[game.address]) as subscription:
+            await asyncio.wait_for(hub.ready.wait(), TIMEOUT)
+            await w3.provider.make_request("miner_stop", [])
+            try:
+                tx_hash = await transact(w3, game.functions.append_move(3, 3), alice)
+                notification = await subscription.next(TIMEOUT)
+            finally:
+                await w3.provider.make_request("miner_start", [])
+            assert notification.pending and notification.event == "PendingMove"
+            assert (notification.args["player"], notification.args["x"], notification.args["y"]) == (
+                alice.address, 3, 3
+            )
+            assert (await wait_for_receipt(w3, tx_hash)).status
+            mined = await subscription.next(TIMEOUT)
+            assert (mined.event, mined.tx_hash, mined.pending) == ("MoveAppended", notification.tx_hash, False)
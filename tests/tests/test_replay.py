@@ -0,0 +1,66 @@
+import dataclasses
+import random
+
+import pytest
+
+from .conftest import GameStatus, append_move_and_get_receipt
+from .engine import Engine, IllegalMove
+from .replay import RecordedGame, fetch_recorded_game, verify
+
+
+def engine_game(seed, m, n, k) -> RecordedGame:
+    # A random game recorded from the reference engine, as an honest chain would have recorded it
+    rng = random.Random(seed)
+    gouged = [(rng.randrange(m), rng.randrange(n)) for _ in range(rng.randrange(3))]
+    engine = Engine(m, n, k, gouged)
+    cells = [(x, y) for x in range(m) for y in range(n)]
+    rng.shuffle(cells)
+    moves = []
+    for x, y in cells:
+        if engine.status != GameStatus.running:
+            break
+        try:
+            moves.append((x, y, engine.play(x, y)))
+        except IllegalMove:
+            pass
+    return RecordedGame("game-%s" % seed, m, n, k, moves, engine.status, gouged)
+
+
+def test_replay_agrees_with_engine():
+    rng = random.Random(0)
+    games = []
+    for seed in range(2000):
+        m, n = rng.randint(1, 7), rng.randint(1, 7)
+        games.append(engine_game(seed, m, n, rng.randint(1, min(m, n))))
+    assert verify(games) == []
+    assert verify(games, processes=2) == []
+
+
+def test_replay_reports_tampered_games():
+    honest = [engine_game(seed, 5, 5, 3) for seed in range(100)]
+    honest = [game for game in honest if game.status == GameStatus.completed and len(game.moves) > 5][:3]
+    flipped, extended, aborted = [dataclasses.replace(game, moves=list(game.moves)) for game in honest]
+    x, y, is_winner = flipped.moves[0]
+    flipped.moves[0] = (x, y, not is_winner)
+    extended.moves.append(extended.moves[0])
+    aborted.status = GameStatus.aborted
+    reasons = {mismatch.address: (mismatch.move, mismatch.reason) for mismatch in verify([flipped, extended, aborted])}
+    assert reasons == {
+        flipped.address: (0, "is_winner is True, expected False"),
+        extended.address: (len(extended.moves) - 1, "move after the end of the game"),
+        aborted.address: (None, "status is aborted, expected completed"),
+    }
+
+
+@pytest.mark.asyncio
+async def test_replay_recorded_games(w3, get_game_running, prepayed_wallets):
+    alice, bob, *_ = prepayed_wallets
+    won = await get_game_running(alice, bob, m=3, n=3, k=3)
+    for player, x, y in [(alice, 0, 0), (bob, 1, 1), (alice, 0, 1), (bob, 2, 2), (alice, 0, 2)]:
+        assert (await append_move_and_get_receipt(w3, won, player, x, y)).status
+    running = await get_game_running(alice, bob, m=3, n=3, k=3)
+    assert (await append_move_and_get_receipt(w3, running, alice, 1, 1)).status
+    games = [await fetch_recorded_game(w3, game) for game in (won, running)]
+    assert [game.status for game in games] == [GameStatus.completed, GameStatus.running]
+    assert [len(game.moves) for game in games] == [5, 1]
+    assert verify(games) == []
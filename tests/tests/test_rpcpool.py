@@ -0,0 +1,147 @@
+import asyncio
+import time
+
+import pytest
+from aiohttp import web
+from web3 import Web3
+from web3.eth import AsyncEth
+
+from .rpcpool import EndpointError, PooledProvider
+
+pytestmark = pytest.mark.asyncio
+
+
+class StubNode:
+    """
+    Local JSON-RPC endpoint, which answers every method with `result` after `latency` seconds. A non-200 `status`
+    (with Retry-After) or a JSON-RPC `error` is injected instead of the result.
+    """
+
+    def __init__(self, latency=0.0, result="0x10", status=200, error=None):
+        self.latency = latency
+        self.result = result
+        self.status = status
+        self.error = error
+        self.methods: list[str] = []
+        self.uri = None
+        self._runner = None
+
+    async def handle(self, request):
+        body = await request.json()
+        self.methods.append(body["method"])
+        await asyncio.sleep(self.latency)
+        if self.status != 200:
+            return web.Response(status=self.status, headers={"Retry-After": "60"})
+        if self.error is not None:
+            return web.json_response({"jsonrpc": "2.0", "id": body["id"], "error": self.error})
+        return web.json_response({"jsonrpc": "2.0", "id": body["id"], "result": self.result})
+
+    async def start(self) -> "StubNode":
+        app = web.Application()
+        app.router.add_post("/", self.handle)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.uri = "http://127.0.0.1:%s/" % self._runner.addresses[0][1]
+        return self
+
+    async def stop(self):
+        await self._runner.cleanup()
+
+
+@pytest.fixture
+async def stub_nodes():
+    nodes = []
+    providers = []
+
+    async def inner(*nodes_to_start, **kwargs):
+        nodes.extend(await asyncio.gather(*(node.start() for node in nodes_to_start)))
+        provider = PooledProvider([node.uri for node in nodes_to_start], **kwargs)
+        providers.append(provider)
+        return provider
+
+    yield inner
+    for provider in providers:
+        await provider.close()
+    await asyncio.gather(*(node.stop() for node in nodes))
+
+
+async def test_reads_go_to_fastest(stub_nodes):
+    slow, fast = StubNode(latency=0.05), StubNode()
+    provider = await stub_nodes(slow, fast)
+    for _ in range(10):
+        assert (await provider.make_request("eth_blockNumber", []))["result"] == "0x10"
+    # Either is asked once to get measured, the fast one answers the rest
+    assert len(slow.methods) == 1 and len(fast.methods) == 9
+
+
+async def test_web3_over_pool(stub_nodes):
+    provider = await stub_nodes(StubNode(), StubNode())
+    w3 = Web3(provider, modules={"eth": (AsyncEth,)}, middlewares=[])
+    assert await w3.eth.block_number == 16
+
+
+async def test_failover_on_rate_limit(stub_nodes):
+    limited, healthy = StubNode(status=429), StubNode()
+    provider = await stub_nodes(limited, healthy)
+    for _ in range(3):
+        assert (await provider.make_request("eth_blockNumber", []))["result"] == "0x10"
+    # Retry-After keeps the endpoint out of the rotation
+    assert len(limited.methods) == 1 and len(healthy.methods) == 3
+    assert provider.stats()["endpoints"][limited.uri]["healthy"] is False
+    assert provider.stats()["endpoints"][limited.uri]["error_rate"] == 1.0
+
+
+async def test_rate_limit_error_fails_over(stub_nodes):
+    limited, healthy = StubNode(error={"code": -32005, "message": "limit exceeded"}), StubNode()
+    provider = await stub_nodes(limited, healthy)
+    assert (await provider.make_request("eth_blockNumber", []))["result"] == "0x10"
+    assert len(healthy.methods) == 1
+
+
+async def test_json_rpc_error_is_an_answer(stub_nodes):
+    reverting, other = StubNode(error={"code": -32000, "message": "execution reverted"}), StubNode()
+    provider = await stub_nodes(reverting, other)
+    response = await provider.make_request("eth_estimateGas", [{}])
+    assert response["error"]["message"] == "execution reverted"
+    assert other.methods == []
+
+
+async def test_slow_call_is_hedged(stub_nodes):
+    stuck, backup = StubNode(latency=2.0, result="0x01"), StubNode(result="0x02")
+    provider = await stub_nodes(stuck, backup, hedge_delay=0.05)
+    started = time.monotonic()
+    assert (await provider.make_request("eth_call", [{}, "latest"]))["result"] == "0x02"
+    assert time.monotonic() - started < 1.0
+    assert provider.hedges == 1
+    # The lost request counts as slow, the next call goes to the backup straight away
+    assert provider.ranked()[0].uri == backup.uri
+
+
+async def test_hedging_delay_follows_p95(stub_nodes):
+    node, other = StubNode(latency=0.01), StubNode(latency=0.01)
+    provider = await stub_nodes(node, other)
+    for _ in range(30):
+        await provider.make_request("eth_getTransactionReceipt", ["0x00"])
+    assert provider.hedges == 0
+    endpoint = provider.ranked()[0]
+    assert 0.01 <= endpoint.p95() <= provider._hedging_delay(endpoint) < 0.5
+
+
+async def test_raw_transaction_is_broadcast(stub_nodes):
+    known = StubNode(error={"code": -32000, "message": "already known"})
+    slow, fast = StubNode(latency=0.5, result="0xaa"), StubNode(result="0xaa")
+    provider = await stub_nodes(known, slow, fast)
+    started = time.monotonic()
+    assert (await provider.make_request("eth_sendRawTransaction", ["0x00"]))["result"] == "0xaa"
+    # The fast acceptance answers, the slow node still gets the transaction
+    assert time.monotonic() - started < 0.4
+    await asyncio.sleep(0.6)
+    assert [node.methods for node in (known, slow, fast)] == [["eth_sendRawTransaction"]] * 3
+
+
+async def test_all_endpoints_down(stub_nodes):
+    provider = await stub_nodes(StubNode(status=503), StubNode(status=502))
+    with pytest.raises(EndpointError):
+        await provider.make_request("eth_blockNumber", [])
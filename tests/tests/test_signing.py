@@ -0,0 +1,111 @@
+import asyncio
+import time
+from types import SimpleNamespace
+
+import pytest
+from eth_utils import ValidationError
+from web3 import Web3
+from web3.eth import Eth
+
+from .conftest import CHAIN_ID, GAS_LIMIT, GAS_PRICE, wait_for_receipt
+from .nonces import NONCES, sign_and_send
+from .signing import LocalSigner, LoopLag, SigningService
+
+pytestmark = pytest.mark.asyncio
+
+
+def transfer(to, value=1, **fields):
+    return {"to": to, "value": value, "gas": GAS_LIMIT, "gasPrice": GAS_PRICE, "chainId": CHAIN_ID, **fields}
+
+
+async def test_pool_signs_like_the_loop():
+    wallets = [Eth.account.create() for _ in range(3)]
+    items = [(wallet, transfer(wallets[0].address, nonce=nonce)) for wallet in wallets for nonce in range(20)]
+    local = LocalSigner()
+    async with SigningService(processes=2, batch_size=8) as service:
+        # Signatures are deterministic (RFC 6979), so both sides must produce the very same bytes
+        assert await service.sign_many(items) == [await local.sign(wallet, tx) for wallet, tx in items]
+        stats = service.stats()
+    assert stats["signatures"] == len(items)
+    # Split into batches of at most 8
+    assert stats["batches"] >= len(items) // 8
+    assert stats["signatures_per_second"] > 0
+
+
+async def test_pool_reports_bad_transactions():
+    wallet = Eth.account.create()
+    async with SigningService(processes=1) as service:
+        good, bad = await asyncio.gather(
+            service.sign(wallet, transfer(wallet.address, nonce=0)),
+            service.sign(wallet, {"to": "not an address"}),
+            return_exceptions=True,
+        )
+    assert good == await LocalSigner().sign(wallet, transfer(wallet.address, nonce=0))
+    assert isinstance(bad, ValueError)
+
+
+async def test_sign_and_send_through_pool(w3, deployer):
+    wallets = [Eth.account.create() for _ in range(4)]
+    async with SigningService(processes=2) as service:
+        tx_hashes = await asyncio.gather(
+            *(
+                sign_and_send(w3, deployer, transfer(wallet.address, 10 ** 9), signer=service)
+                for wallet in wallets
+            )
+        )
+        receipts = await asyncio.gather(*(wait_for_receipt(w3, tx_hash) for tx_hash in tx_hashes))
+    assert all(receipt.status for receipt in receipts)
+    assert [await w3.eth.get_balance(wallet.address) for wallet in wallets] == [10 ** 9] * len(wallets)
+
+
+async def test_known_transaction_is_not_resent():
+    wallet = Eth.account.create()
+    sent = []
+
+    async def send_raw_transaction(raw_transaction):
+        sent.append(raw_transaction)
+        raise ValueError({"code": -32000, "message": "already known"})
+
+    async def get_transaction_count(address, block_identifier):
+        return 5
+
+    w3 = SimpleNamespace(
+        eth=SimpleNamespace(send_raw_transaction=send_raw_transaction, get_transaction_count=get_transaction_count)
+    )
+    tx_hash = await sign_and_send(w3, wallet, transfer(wallet.address))
+    # Pending already: one send, the nonce stays taken
+    assert tx_hash == Web3.keccak(sent[0]) and len(sent) == 1
+    assert await NONCES[wallet.address].allocate(w3) == 6
+
+
+# The in-process backend rejects a stale nonce with a validation error of its own, not a ValueError
+async def test_eth_tester_nonce_error_resyncs():
+    wallet = Eth.account.create()
+    sent = []
+
+    async def send_raw_transaction(raw_transaction):
+        sent.append(raw_transaction)
+        if len(sent) == 1:
+            raise ValidationError("Invalid transaction nonce: Expected 7, but got 3")
+        return Web3.keccak(raw_transaction)
+
+    async def get_transaction_count(address, block_identifier):
+        return 7
+
+    w3 = SimpleNamespace(
+        eth=SimpleNamespace(send_raw_transaction=send_raw_transaction, get_transaction_count=get_transaction_count)
+    )
+    NONCES[wallet.address]._next = 3
+    tx_hash = await sign_and_send(w3, wallet, transfer(wallet.address))
+    # Resynced with the chain and sent once again with the nonce it expects
+    assert tx_hash == Web3.keccak(sent[1]) and len(sent) == 2
+    assert await NONCES[wallet.address].allocate(w3) == 8
+
+
+async def test_loop_lag_sees_blocking():
+    async with LoopLag(interval=0.005) as lag:
+        await asyncio.sleep(0.02)
+        # Anything CPU bound in a coroutine, i.e. signing in the loop
+        time.sleep(0.05)
+        await asyncio.sleep(0.02)
+    assert lag.stats()["max"] >= 0.04
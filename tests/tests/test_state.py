@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+
+from .conftest import (DEFAULT_BID, PROVIDER_URI, GameStatus,
+                       append_move_and_get_receipt)
+from .engine import Engine
+from .snapshots import SnapshotReader, decode_board, read_board
+from .structs import CellOwner
+from .test_gameplay import Move
+
+
+NULL_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+
+@pytest.mark.asyncio
+async def test_state_of_running_game(w3, get_game_running, prepayed_wallets):
+    alice, bob, *_ = prepayed_wallets
+    game = await get_game_running(alice, bob, m=5, n=4, k=3)
+    assert (await append_move_and_get_receipt(w3, game, alice, 0, 0)).status
+    status, turn, first, second, bid, settings, moves, block_deployed, block_recent = (
+        await game.functions.get_state().call()
+    )
+    assert GameStatus(status) == GameStatus.running
+    assert CellOwner(turn) == CellOwner.bob
+    assert [first, second] == [alice.address, bob.address]
+    assert bid == DEFAULT_BID
+    assert list(settings) == [5, 4, 3]
+    assert moves == 1
+    assert block_deployed < block_recent
+
+
+@pytest.mark.http_only
+@pytest.mark.asyncio
+async def test_state_of_completed_game(w3, get_game_running, prepayed_wallets):
+    alice, bob, *_ = prepayed_wallets
+    game = await get_game_running(alice, bob, m=1, n=1, k=1)
+    assert (await append_move_and_get_receipt(w3, game, alice, 0, 0)).status
+    (snapshot,) = await SnapshotReader(PROVIDER_URI).batch([game.address])
+    assert snapshot.status == GameStatus.completed
+    assert snapshot.winner == alice.address == await game.functions.get_winner().call()
+
+
+@pytest.mark.http_only
+@pytest.mark.asyncio
+async def test_batch_matches_aggregate(w3, gateway_contract, get_game_created, get_game_waiting, prepayed_wallets):
+    alice, bob, *_ = prepayed_wallets
+    games = await asyncio.gather(
+        *(get_game_created(alice, m=3 + index, n=3, k=3) for index in range(5)),
+        *(get_game_waiting(bob, m=4, n=4 + index, k=2) for index in range(5)),
+    )
+    addresses = [game.address for game in games]
+    reader = SnapshotReader(PROVIDER_URI, chunk_size=3)
+    batch = await reader.batch(addresses)
+    assert batch == await reader.aggregate(gateway_contract, addresses)
+    assert [snapshot.address for snapshot in batch] == addresses
+    assert [snapshot.m for snapshot in batch[:5]] == [3, 4, 5, 6, 7]
+    assert {snapshot.status for snapshot in batch[:5]} == {GameStatus.created}
+    assert {snapshot.status for snapshot in batch[5:]} == {GameStatus.waiting}
+    assert {snapshot.bob for snapshot in batch} == {NULL_ADDRESS}
+
+
+@pytest.mark.asyncio
+async def test_aggregate_rejects_unknown_games(gateway_contract, prepayed_wallets):
+    alice, *_ = prepayed_wallets
+    with pytest.raises(Exception):
+        await SnapshotReader(PROVIDER_URI).aggregate(gateway_contract, [alice.address])
+
+
+@pytest.mark.parametrize("m,n", [(1, 1), (5, 4), (2, 255), (255, 255)])
+@pytest.mark.asyncio
+async def test_board_of_running_game(w3, get_game_running, prepayed_wallets, m, n):
+    alice, bob, *_ = prepayed_wallets
+    # Cells in both the first and the last storage words of the board, plus some outside of it
+    gouged = [(m - 1, 0), (0, n - 1), (m, n)]
+    moves = [(0, 0), (m - 1, n - 1), (m // 2, n // 2)]
+    k = min(m, n, 3)
+    game = await get_game_running(alice, bob, m=m, n=n, k=k, gouged=[Move(x, y) for x, y in gouged])
+    engine = Engine(m, n, k, gouged)
+    players = {CellOwner.alice: alice, CellOwner.bob: bob}
+    for x, y in moves:
+        if engine.status == GameStatus.running and engine.owner(x, y) == CellOwner.available:
+            assert (await append_move_and_get_receipt(w3, game, players[engine.turn], x, y)).status
+            engine.play(x, y)
+    board = await read_board(game)
+    assert board.shape == (m, n)
+    assert (board == engine.board()).all()
+
+
+def test_decode_board():
+    m, n = 3, 50
+    cells = [(x + y) % 4 for x in range(m) for y in range(n)]
+    words = [0, 0]
+    for index, cell in enumerate(cells):
+        words[index // 128] |= cell << (2 * (index % 128))
+    blob = b"".join(word.to_bytes(32, "big") for word in words)
+    assert decode_board(blob, m, n).tolist() == [cells[x * n:(x + 1) * n] for x in range(m)]